@@ -1,40 +1,70 @@
+from __future__ import annotations
+
+import hashlib
 import json
+import math
 import os
 import uuid
-import requests
-from typing import Dict, Any, Optional, TypedDict, List
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_aws import ChatBedrockConverse
-from langfuse import Langfuse
-from langfuse.callback import CallbackHandler
+from typing import TYPE_CHECKING, Dict, Any, Optional, TypedDict, List
+from utils import metrics
+from utils.invocation import Deadline
+from utils.kv_store import create_store
+from utils.llm import (
+    BedrockThrottlingError,
+    CompiledPrompt,
+    LangfuseError,
+    LLMConfig,
+    as_throttling_error,
+    build_chain,
+    compile_prompt,
+    get_compiled_prompt,
+    get_model_router,
+    invoke_bedrock,
+    record_trace_metadata,
+    setup_langfuse
+)
+from utils.llm_usage import create_usage_collector, empty_usage, put_usage_metrics
+from utils.model_routing import ModelRoute, ModelTier, describe_route, invoke_with_fallback
+from utils.secrets import SecretError, get_secrets
+from utils.telemetry import get_flusher
+from utils.tokens import (
+    InputTooLargeError,
+    OverflowMode,
+    compute_max_tokens,
+    estimate_tokens,
+    preflight_input,
+    split_text_by_tokens
+)
+from utils.tweet import TweetGenerationError, generate_tweet
+
+# langchain・langfuseなどの重い依存は、OPTIONSやバリデーションエラーの早期リターンで
+# 読み込まないよう、使う関数の中でimportする（コールドスタート短縮のため）
+if TYPE_CHECKING:
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.runnables import RunnableConfig
+    from langfuse import Langfuse
+    from langfuse.callback import CallbackHandler
 
 # カスタム例外クラス
 class EnvironmentError(Exception):
     """環境変数関連のエラー"""
     pass
 
-class SecretError(Exception):
-    """シークレット取得関連のエラー"""
-    pass
-
-class LangfuseError(Exception):
-    """Langfuse関連のエラー"""
-    pass
-
 class EvaluationError(Exception):
     """出力評価関連のエラー"""
     pass
 
-class BedrockThrottlingError(Exception):
-    """Bedrock APIのスロットリングエラー"""
-    pass
-
 # 型定義
-class SecretConfig(TypedDict):
-    """シークレット設定の型定義"""
-    LANGFUSE_SECRET_KEY: str
-    LANGFUSE_PUBLIC_KEY: str
+class EvaluationResult(TypedDict):
+    """評価結果の型定義"""
+    output: str
+    promptVersion: int
+    cacheHit: bool
+    chunkCount: int
+    # Bedrockのトークン使用量（プロンプトキャッシュの読み書きを含む）
+    usage: Dict[str, int]
+    # タスクごとに選んだモデルと理由
+    routes: List[Dict[str, Any]]
 
 class LambdaResponse(TypedDict):
     """Lambda関数のレスポンス型定義"""
@@ -46,17 +76,61 @@ class HttpStatus:
     """HTTPステータスコード定数"""
     OK = 200
     BAD_REQUEST = 400
+    PAYLOAD_TOO_LARGE = 413
+    TOO_MANY_REQUESTS = 429
     SERVER_ERROR = 500
 
 class LangfuseConfig:
     """Langfuse関連の設定定数"""
     PROMPT_NAME = "output_evaluation"
     RUN_NAME = "Output Evaluation"
-    REQUIRED_KEYS = ["LANGFUSE_SECRET_KEY", "LANGFUSE_PUBLIC_KEY"]
+
+class ResultCacheConfig:
+    """評価結果キャッシュ関連の設定定数"""
+    # memory / dynamodb:<テーブル名> / s3:<バケット名>/<プレフィックス> / file:<ディレクトリ>
+    BACKEND = os.environ.get("EVALUATION_CACHE_BACKEND", "memory")
+    TTL_SECONDS = float(os.environ.get("EVALUATION_CACHE_TTL_SECONDS", "86400"))
+    MAX_ENTRIES = int(os.environ.get("EVALUATION_CACHE_MAX_ENTRIES", "128"))
+
+class LongInputConfig:
+    """長文評価（チャンクごとに評価してから全体を判定するmap-reduce方式）の設定定数"""
+    # 推定トークン数がこの値を超えた場合のみmap-reduce方式にする
+    THRESHOLD_TOKENS = int(os.environ.get("LONG_INPUT_THRESHOLD_TOKENS", "50000"))
+    # チャンクの最小サイズ（入力が長い場合は、チャンク数がMAX_CONCURRENCYに収まるように大きくする）
+    CHUNK_TOKENS = int(os.environ.get("LONG_INPUT_CHUNK_TOKENS", "20000"))
+    # 全チャンクを1回の並列実行で評価する（順番待ちのチャンクを作るとLambdaのタイムアウト内に終わらないため）
+    MAX_CONCURRENCY = int(os.environ.get("LONG_INPUT_MAX_CONCURRENCY", "4"))
+    # チャンク評価と全体評価の2回の呼び出しに必要な残り時間の見込み（足りない場合は413を返す）
+    MIN_REMAINING_SECONDS = float(os.environ.get("LONG_INPUT_MIN_REMAINING_SECONDS", "20"))
+    MAP_PROMPT_NAME = "output_evaluation_chunk"
+    REDUCE_PROMPT_NAME = "output_evaluation_reduce"
+    MAP_RUN_NAME = "Output Evaluation (Chunk)"
+
+class PreflightConfig:
+    """Bedrock呼び出し前の入力チェック関連の設定定数"""
+    # 評価する入力の推定トークン数の上限（MAX_CONCURRENCY個のチャンクを1回の並列実行で評価できる長さ）
+    INPUT_BUDGET_TOKENS = int(os.environ.get("EVALUATION_INPUT_BUDGET_TOKENS", "100000"))
+    # 上限を超えた場合の扱い（trim: 上限まで切り詰める / reject: 413を返す）
+    OVERFLOW_MODE = os.environ.get("INPUT_OVERFLOW_MODE", OverflowMode.TRIM)
+    # 直前の行と同じこの文字数以上の行は重複として削除する
+    MIN_DUPLICATE_LINE_CHARS = 20
 
 class BedrockConfig:
-    """Bedrock関連の設定定数"""
-    MAX_TOKENS = 4096
+    """Bedrock関連の設定定数（呼び出し共通の設定は utils.llm.LLMConfig）"""
+    CONTEXT_WINDOW_TOKENS = 200000
+    # プロンプトテンプレート自体の推定トークン数の見込み
+    PROMPT_OVERHEAD_TOKENS = 2000
+    # 出力トークン数の上限（入力が長いほど評価文も長くなるため、入力に比例して増やす）
+    EVALUATION_MIN_OUTPUT_TOKENS = 1024
+    OUTPUT_TOKENS_PER_INPUT_TOKEN = 0.05
+    CHUNK_MAX_OUTPUT_TOKENS = 1024
+
+# タスク（プロンプト名）ごとのモデルの区分（MODEL_ROUTES にJSONで指定すると上書きできる）
+TASK_TIERS: Dict[str, str] = {
+    LangfuseConfig.PROMPT_NAME: ModelTier.AUTO,
+    LongInputConfig.MAP_PROMPT_NAME: ModelTier.LARGE,
+    LongInputConfig.REDUCE_PROMPT_NAME: ModelTier.LARGE
+}
 
 # 必要な環境変数のリスト
 REQUIRED_ENV_VARS: List[str] = [
@@ -76,13 +150,18 @@ def validate_environment() -> None:
     if missing_vars:
         raise EnvironmentError(f"必要な環境変数が設定されていません: {', '.join(missing_vars)}")
 
-def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse:
+def create_response(
+    status_code: int,
+    message: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None
+) -> LambdaResponse:
     """
     レスポンスを生成する
     
     Args:
         status_code (int): HTTPステータスコード
         message (Dict[str, Any]): レスポンスメッセージ
+        headers (Optional[Dict[str, str]]): 追加のレスポンスヘッダー
     
     Returns:
         LambdaResponse: Lambda関数のレスポンス
@@ -94,90 +173,124 @@ def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse
             "Access-Control-Allow-Headers": "Content-Type,Authorization",
             "Access-Control-Allow-Methods": "OPTIONS,POST",
             "Access-Control-Allow-Credentials": "true",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            **(headers or {})
         },
         "body": json.dumps(message, ensure_ascii=False)
     }
 
-def get_secrets() -> SecretConfig:
+def create_throttled_response(e: BedrockThrottlingError) -> LambdaResponse:
     """
-    AWS Secrets Managerから設定を取得する
+    スロットリング時のレスポンス（429 + Retry-After）を生成する
+    
+    Args:
+        e (BedrockThrottlingError): スロットリングエラー
     
     Returns:
-        SecretConfig: シークレット設定
+        LambdaResponse: Lambda関数のレスポンス
+    """
+    return create_response(
+        HttpStatus.TOO_MANY_REQUESTS,
+        {"message": f"エラーが発生しました: {str(e)}"},
+        {"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+# 評価結果キャッシュ（コンテンツ・プロンプトバージョン・モデルをキーとする）
+_result_cache = create_store(ResultCacheConfig.BACKEND, ResultCacheConfig.MAX_ENTRIES)
+
+def build_result_cache_key(blog_content: str, prompt_versions: Dict[str, int], model_ids: List[str]) -> str:
+    """
+    評価結果キャッシュのキーを生成する
     
-    Raises:
-        SecretError: シークレット取得に失敗した場合
+    空白の違いだけのコンテンツは同じキーになるように正規化してからハッシュ化する
+    
+    Args:
+        blog_content (str): 評価対象のブログコンテンツ
+        prompt_versions (Dict[str, int]): 評価に使うプロンプト名とバージョン
+        model_ids (List[str]): 処理段階ごとのモデルID（長文の場合はチャンク評価・全体評価の順）
+    
+    Returns:
+        str: キャッシュキー
     """
-    try:
-        headers = {"X-Aws-Parameters-Secrets-Token": os.environ.get('AWS_SESSION_TOKEN')}
-        secrets_extension_endpoint = f"http://localhost:2773/secretsmanager/get?secretId={os.environ['LANGFUSE_SECRET_NAME']}"
-        secrets_response = requests.get(secrets_extension_endpoint, headers=headers)
-        
-        if secrets_response.status_code != HttpStatus.OK:
-            raise SecretError(f"シークレット取得APIが失敗しました。: {secrets_response.status_code} （再実行してみてください🙏）")
-            
-        secret = json.loads(secrets_response.text)["SecretString"]
-        
-        if isinstance(secret, str):
-            secret = json.loads(secret)
-            
-        if not all(key in secret for key in LangfuseConfig.REQUIRED_KEYS):
-            raise SecretError("必要なシークレットキーが見つかりません")
-            
-        return secret
-    except requests.RequestException as e:
-        raise SecretError(f"シークレット取得時にネットワークエラーが発生しました: {str(e)}")
-    except json.JSONDecodeError as e:
-        raise SecretError(f"シークレットのJSONパースに失敗しました: {str(e)}")
-    except SecretError:
-        raise
-    except Exception as e:
-        raise SecretError(f"シークレットの取得に失敗しました: {str(e)}")
+    normalized = " ".join(blog_content.split())
+    digest = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    versions = ",".join(f"{name}@{version}" for name, version in sorted(prompt_versions.items()))
+    return f"evaluation:{versions}:{'+'.join(model_ids)}:{digest}"
 
-def setup_langfuse(
-    secret: SecretConfig,
-    user_email: Optional[str]
-) -> tuple[CallbackHandler, str, Langfuse]:
+def plan_chunks(blog_content: str, input_tokens: int) -> List[str]:
     """
-    Langfuseの設定をセットアップする
+    長文のコンテンツを、1回の並列実行で評価できる数のチャンクに分割する
     
     Args:
-        secret (SecretConfig): シークレット設定
-        user_email (Optional[str]): ユーザーメールアドレス
+        blog_content (str): 評価対象のブログコンテンツ
+        input_tokens (int): コンテンツの推定トークン数
     
     Returns:
-        tuple[CallbackHandler, str, Langfuse]: Langfuseハンドラー、セッションID、Langfuseインスタンス
+        List[str]: 分割したコンテンツ（LongInputConfig.MAX_CONCURRENCY個以下）
+    """
+    chunk_tokens = max(LongInputConfig.CHUNK_TOKENS, math.ceil(input_tokens / LongInputConfig.MAX_CONCURRENCY))
+    chunks = split_text_by_tokens(blog_content, chunk_tokens)
+    # 行の区切りで分割するため上限を少し超えることがあり、その場合は余りを最後のチャンクにまとめる
+    if len(chunks) > LongInputConfig.MAX_CONCURRENCY:
+        last = LongInputConfig.MAX_CONCURRENCY - 1
+        chunks = chunks[:last] + ["".join(chunks[last:])]
+    return chunks
+
+def evaluate_chunks(
+    compiled: CompiledPrompt,
+    route: ModelRoute,
+    chunks: List[str],
+    callbacks: List[BaseCallbackHandler],
+    deadline: Optional[Deadline] = None
+) -> tuple[str, List[str]]:
+    """
+    分割したコンテンツをチャンクごとに並列で評価する（map処理）
     
-    Raises:
-        LangfuseError: Langfuseの設定に失敗した場合
+    Args:
+        compiled (CompiledPrompt): チャンク評価用のコンパイル済みプロンプト
+        route (ModelRoute): チャンク評価に使うモデル
+        chunks (List[str]): 分割したコンテンツ
+        callbacks (List[BaseCallbackHandler]): Langfuseハンドラーなどのコールバック
+        deadline (Optional[Deadline]): Lambdaの残り実行時間
+    
+    Returns:
+        tuple[str, List[str]]: チャンクごとの評価メモを順番に結合したテキストと、チャンクごとに応答したモデルID
     """
-    try:
-        langfuse_session_id = str(uuid.uuid4())
-        
-        # Langfuseインスタンスを認証情報付きで初期化
-        langfuse = Langfuse(
-            public_key=secret.get("LANGFUSE_PUBLIC_KEY"),
-            secret_key=secret.get("LANGFUSE_SECRET_KEY"),
-            host=os.environ["LANGFUSE_HOST"]
-        )
-        
-        langfuse_handler = CallbackHandler(
-            secret_key=secret.get("LANGFUSE_SECRET_KEY"),
-            public_key=secret.get("LANGFUSE_PUBLIC_KEY"),
-            host=os.environ["LANGFUSE_HOST"],
-            user_id=user_email,
-            session_id=langfuse_session_id
+    from langchain_core.runnables import RunnableLambda
+
+    # チャンク単位でリトライし、成功済みのチャンクは再評価しない
+    def invoke_chunk(chunk_input: Dict[str, Any], config: RunnableConfig) -> tuple[str, str]:
+        return invoke_bedrock(
+            lambda: invoke_with_fallback(
+                route,
+                lambda model_id: build_chain(compiled, BedrockConfig.CHUNK_MAX_OUTPUT_TOKENS, model_id, deadline).invoke(chunk_input, config)
+            ),
+            deadline
         )
-        return langfuse_handler, langfuse_session_id, langfuse
-    except Exception as e:
-        raise LangfuseError(f"Langfuseの設定に失敗しました: {str(e)}")
+
+    outputs = RunnableLambda(invoke_chunk).batch(
+        [
+            {"blog_content": chunk, "chunk_index": index + 1, "chunk_count": len(chunks)}
+            for index, chunk in enumerate(chunks)
+        ],
+        config={
+            "run_name": LongInputConfig.MAP_RUN_NAME,
+            "callbacks": callbacks,
+            "max_concurrency": LongInputConfig.MAX_CONCURRENCY
+        }
+    )
+    combined = "\n\n".join(
+        f"<パート{index + 1}>\n{output}\n</パート{index + 1}>"
+        for index, (output, _) in enumerate(outputs)
+    )
+    return combined, [model_id for _, model_id in outputs]
 
 def evaluate_output(
     langfuse: Langfuse,
     blog_content: str,
-    langfuse_handler: CallbackHandler
-) -> str:
+    langfuse_handler: CallbackHandler,
+    deadline: Optional[Deadline] = None
+) -> EvaluationResult:
     """
     ブログコンテンツを評価する
     
@@ -185,38 +298,147 @@ def evaluate_output(
         langfuse (Langfuse): Langfuseインスタンス
         blog_content (str): 評価対象のブログコンテンツ
         langfuse_handler (CallbackHandler): Langfuseハンドラー
+        deadline (Optional[Deadline]): Lambdaの残り実行時間（リトライの待ち時間の上限）
     
     Returns:
-        str: 評価結果
+        EvaluationResult: 評価結果、使用したプロンプトのバージョン、キャッシュヒット有無、チャンク数、トークン使用量、選んだモデル
     
     Raises:
         EvaluationError: 評価処理に失敗した場合
+        BedrockThrottlingError: Bedrockのスロットリングまたは流量制限で評価できなかった場合
     """
     try:
-        llm = ChatBedrockConverse(
-            model=os.environ["BEDROCK_INFERENCE_PROFILE_ARN"],
-            max_tokens=BedrockConfig.MAX_TOKENS,
-        )
-        
-        prompt_template = langfuse.get_prompt(LangfuseConfig.PROMPT_NAME)
-        prompt = ChatPromptTemplate.from_template(
-            prompt_template.get_langchain_prompt(),
-            metadata={"langfuse_prompt": prompt_template},
-        )
-        
-        chain = prompt | llm | StrOutputParser()
-        return chain.invoke(
-            input={"blog_content": blog_content},
-            config={
-                "run_name": LangfuseConfig.RUN_NAME,
-                "callbacks": [langfuse_handler]
+        # 長文の場合はチャンクごとに評価してから全体のレベルを判定する
+        input_tokens = estimate_tokens(blog_content)
+        long_input = input_tokens > LongInputConfig.THRESHOLD_TOKENS
+        # 入力の長さに応じてモデルを選ぶ（短い入力は小さいモデル、長い入力は大きいモデル）
+        router = get_model_router(TASK_TIERS)
+        if long_input:
+            map_prompt = get_compiled_prompt(langfuse, LongInputConfig.MAP_PROMPT_NAME)
+            compiled = get_compiled_prompt(langfuse, LongInputConfig.REDUCE_PROMPT_NAME)
+            prompt_versions = {
+                LongInputConfig.MAP_PROMPT_NAME: map_prompt.version,
+                LongInputConfig.REDUCE_PROMPT_NAME: compiled.version
             }
+            map_route = router.route(LongInputConfig.MAP_PROMPT_NAME, input_tokens)
+            route = router.route(LongInputConfig.REDUCE_PROMPT_NAME, input_tokens)
+            model_ids = [map_route.model_id, route.model_id]
+        else:
+            compiled = get_compiled_prompt(langfuse, LangfuseConfig.PROMPT_NAME)
+            prompt_versions = {LangfuseConfig.PROMPT_NAME: compiled.version}
+            route = router.route(LangfuseConfig.PROMPT_NAME, input_tokens)
+            model_ids = [route.model_id]
+
+        # 通常どおり優先モデルが応答した場合の結果を探す
+        cached = _result_cache.get(build_result_cache_key(blog_content, prompt_versions, model_ids))
+        if cached is not None:
+            return {
+                "output": cached["output"],
+                "promptVersion": compiled.version,
+                "cacheHit": True,
+                "chunkCount": cached.get("chunkCount", 1),
+                "usage": empty_usage(),
+                "routes": []
+            }
+
+        # チャンク評価・全体評価のトークン使用量をまとめて集計する
+        usage_collector = create_usage_collector()
+        callbacks = [langfuse_handler, usage_collector]
+
+        routes: List[Dict[str, Any]] = []
+        if long_input:
+            if deadline is not None and deadline.remaining_seconds() < LongInputConfig.MIN_REMAINING_SECONDS:
+                raise InputTooLargeError("入力が長すぎるため、制限時間内に評価できません。内容を分けて評価してください🙏")
+            chunks = plan_chunks(blog_content, input_tokens)
+            chunk_count = len(chunks)
+            with metrics.span("Bedrock"):
+                chunk_evaluations, chunk_models = evaluate_chunks(map_prompt, map_route, chunks, callbacks, deadline)
+            routes.append(describe_route(map_route, chunk_models))
+            chain_input = {
+                "chunk_evaluations": chunk_evaluations,
+                "chunk_count": chunk_count
+            }
+            input_tokens = estimate_tokens(chain_input["chunk_evaluations"])
+        else:
+            chunk_count = 1
+            chain_input = {"blog_content": blog_content}
+        # 入力の長さに合わせて出力トークン数の上限を決める
+        max_tokens = compute_max_tokens(
+            input_tokens + BedrockConfig.PROMPT_OVERHEAD_TOKENS,
+            BedrockConfig.EVALUATION_MIN_OUTPUT_TOKENS,
+            LLMConfig.MAX_TOKENS,
+            BedrockConfig.OUTPUT_TOKENS_PER_INPUT_TOKEN,
+            BedrockConfig.CONTEXT_WINDOW_TOKENS
         )
+        chain_config = {
+            "run_name": LangfuseConfig.RUN_NAME,
+            "callbacks": callbacks
+        }
+        with metrics.span("Bedrock"):
+            output, served_by = invoke_bedrock(
+                lambda: invoke_with_fallback(
+                    route,
+                    lambda model_id: build_chain(compiled, max_tokens, model_id, deadline).invoke(input=chain_input, config=chain_config)
+                ),
+                deadline
+            )
+        routes.append(describe_route(route, [served_by]))
+        # フォールバック先のモデルが応答した結果は、優先モデルの結果として返さないよう応答したモデルのキーで保存する
+        served_model_ids = ["|".join(sorted(set(chunk_models))), served_by] if long_input else [served_by]
+        _result_cache.set(
+            build_result_cache_key(blog_content, prompt_versions, served_model_ids),
+            {"output": output, "chunkCount": chunk_count},
+            ResultCacheConfig.TTL_SECONDS
+        )
+        return {
+            "output": output,
+            "promptVersion": compiled.version,
+            "cacheHit": False,
+            "chunkCount": chunk_count,
+            "usage": usage_collector.usage,
+            "routes": routes
+        }
+    except InputTooLargeError:
+        raise
     except Exception as e:
-        if 'ThrottlingException' in str(e):
-            raise BedrockThrottlingError("Bedrockが高負荷のようです。1分ほど待ってからリトライください🙏")
+        throttled = as_throttling_error(e)
+        if throttled is not None:
+            raise throttled
         raise EvaluationError(f"出力評価に失敗しました: {str(e)}")
 
+def record_cache_hit_trace(
+    langfuse: Langfuse,
+    langfuse_session_id: str,
+    user_email: Optional[str],
+    result: EvaluationResult
+) -> str:
+    """
+    キャッシュヒット時はLLMを呼ばないため、フィードバック用のトレースを記録する
+    
+    Args:
+        langfuse (Langfuse): Langfuseインスタンス
+        langfuse_session_id (str): セッションID
+        user_email (Optional[str]): ユーザーメールアドレス
+        result (EvaluationResult): 評価結果
+    
+    Returns:
+        str: トレースID
+    """
+    trace = langfuse.trace(
+        name=LangfuseConfig.RUN_NAME,
+        session_id=langfuse_session_id,
+        user_id=user_email,
+        output=result["output"],
+        metadata={"cacheHit": True, "promptVersion": result["promptVersion"]}
+    )
+    _telemetry.submit(langfuse.flush)
+    return trace.id
+
+# Langfuseへの送信はレスポンス返却後に行う（TELEMETRY_MODE=sync で従来どおり同期送信）
+_telemetry = get_flusher()
+
+@metrics.instrument_handler("evaluate")
+@_telemetry.wrap_handler
 def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
     """
     Lambda関数のメインハンドラー
@@ -228,9 +450,6 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
     Returns:
         LambdaResponse: Lambda関数のレスポンス
     """
-    # デバッグ用にイベント内容をログ出力
-    print("Event:", json.dumps(event, ensure_ascii=False))
-
     # OPTIONSメソッドの場合は早期リターン
     if event.get("httpMethod") == "OPTIONS":
         return create_response(HttpStatus.OK, {"message": "OK"})
@@ -240,19 +459,36 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
         validate_environment()
         
         # プロキシ統合からのリクエストボディを解析
+        # ブログの本文を含むため、リクエストボディはログに出さずサイズだけを記録する
         body = event.get("body", "{}")
         if isinstance(body, str):
+            metrics.put("RequestBytes", len(body.encode("utf-8")), metrics.MetricUnit.BYTES)
             try:
                 body = json.loads(body)
             except json.JSONDecodeError as e:
                 print("JSONデコードエラー:", str(e))
-                print("受信したbody:", body)
                 return create_response(HttpStatus.BAD_REQUEST, {
                     "message": "リクエストボディのJSONパースに失敗しました"
                 })
 
-        print("Parsed body:", json.dumps(body, ensure_ascii=False))
         blog_content = body.get("blogContent")
+        if not blog_content:
+            return create_response(HttpStatus.BAD_REQUEST, {
+                "message": "アウトプットの内容が入力されていないようです🤔"
+            })
+        metrics.put("InputChars", len(blog_content))
+
+        # Bedrockを呼ぶ前に入力を正規化し、長すぎる入力は切り詰めるか早めに断る
+        with metrics.span("Preflight"):
+            preflight = preflight_input(
+                blog_content,
+                PreflightConfig.INPUT_BUDGET_TOKENS,
+                PreflightConfig.OVERFLOW_MODE,
+                PreflightConfig.MIN_DUPLICATE_LINE_CHARS
+            )
+        blog_content = preflight["text"]
+        metrics.put("InputTokens", preflight["inputTokens"])
+        metrics.set_property("trimmed", preflight["trimmed"])
         if not blog_content:
             return create_response(HttpStatus.BAD_REQUEST, {
                 "message": "アウトプットの内容が入力されていないようです🤔"
@@ -262,22 +498,69 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
         secret = get_secrets()
         
         # Langfuseセットアップ
-        langfuse_handler, langfuse_session_id, langfuse = setup_langfuse(
-            secret,
-            event.get("requestContext", {}).get("authorizer", {}).get("claims", {}).get("email")
-        )
+        user_email = event.get("requestContext", {}).get("authorizer", {}).get("claims", {}).get("email")
+        with metrics.span("SetupLangfuse"):
+            langfuse_session_id = str(uuid.uuid4())
+            langfuse_handler, langfuse = setup_langfuse(secret, user_email, langfuse_session_id)
         
         # 出力評価
-        output = evaluate_output(langfuse, blog_content, langfuse_handler)
-        langfuse_handler.flush()
+        deadline = Deadline.from_context(context)
+        result = evaluate_output(langfuse, blog_content, langfuse_handler, deadline)
+        metrics.put("OutputChars", len(result["output"]))
+        metrics.put("ChunkCount", result["chunkCount"])
+        put_usage_metrics(result["usage"])
+        metrics.set_property("cacheHit", result["cacheHit"])
+        if result["cacheHit"]:
+            trace_id = record_cache_hit_trace(langfuse, langfuse_session_id, user_email, result)
+        else:
+            trace_id = langfuse_handler.get_trace_id()
+        metrics.set_property("traceId", trace_id)
+        trace_metadata: Dict[str, Any] = {} if result["cacheHit"] else {
+            "bedrockUsage": result["usage"],
+            "modelRoutes": list(result["routes"])
+        }
+        
+        # withTweet指定時だけ、同じ呼び出しの中で続けてツイート文言も生成する（/tweet と同じ処理）
+        # Bedrockの呼び出しが1回増えるため、フロントエンドは指定せず共有ボタンを押したときに /tweet を呼ぶ
+        # ツイート生成に失敗しても評価結果は返す
+        tweet: Optional[Dict[str, Any]] = None
+        if body.get("withTweet"):
+            try:
+                tweet_result = generate_tweet(langfuse, result["output"], langfuse_handler, deadline, "Tweet")
+                tweet = {"message": tweet_result["output"], "promptVersion": tweet_result["promptVersion"]}
+                trace_metadata.setdefault("modelRoutes", []).append(tweet_result["route"])
+                trace_metadata["tweetBedrockUsage"] = tweet_result["usage"]
+            except (TweetGenerationError, InputTooLargeError, BedrockThrottlingError) as e:
+                print(f"{type(e).__name__}:", str(e))
+        if trace_metadata and record_trace_metadata(langfuse, trace_id, trace_metadata):
+            _telemetry.submit(langfuse.flush)
+        _telemetry.submit(langfuse_handler.flush)
+        
+        metadata = {
+            "traceId": trace_id,
+            "langfuseSessionId": langfuse_session_id,
+            "promptVersion": result["promptVersion"],
+            "cacheHit": result["cacheHit"],
+            "chunkCount": result["chunkCount"],
+            "inputTokens": preflight["inputTokens"],
+            "keptRatio": preflight["keptRatio"],
+            "trimmed": preflight["trimmed"]
+        }
+        if tweet is not None:
+            metadata["tweet"] = tweet
         
         return create_response(HttpStatus.OK, {
-            "message": output,
-            "traceId": langfuse_handler.get_trace_id(),
-            "langfuseSessionId": langfuse_session_id
+            "message": result["output"],
+            **metadata
         })
 
-    except (EnvironmentError, SecretError, LangfuseError, EvaluationError, BedrockThrottlingError) as e:
+    except InputTooLargeError as e:
+        return create_response(HttpStatus.PAYLOAD_TOO_LARGE, {
+            "message": str(e)
+        })
+    except BedrockThrottlingError as e:
+        return create_throttled_response(e)
+    except (EnvironmentError, SecretError, LangfuseError, EvaluationError) as e:
         error_message = str(e)
         return create_response(HttpStatus.SERVER_ERROR, {
             "message": f"エラーが発生しました: {error_message}"
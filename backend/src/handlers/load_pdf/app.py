@@ -1,11 +1,24 @@
 import json
+import multiprocessing
 import os
 import base64
+import hashlib
+import re
 import uuid
-from typing import Dict, Any, TypedDict
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Any, BinaryIO, List, Optional, Tuple, TypedDict, Union
 import boto3
+from botocore.config import Config
 from pypdf import PdfReader
 from io import BytesIO
+from page_worker import extract_page_texts, run_extract_worker
+from utils import metrics
+from utils.kv_store import create_store
+from utils.telemetry import get_flusher
+from utils.tokens import estimate_tokens
 
 # カスタム例外クラス
 class EnvironmentError(Exception):
@@ -20,7 +33,33 @@ class PDFProcessError(Exception):
     """PDF処理関連のエラー"""
     pass
 
+class PDFTooLargeError(Exception):
+    """PDFのサイズが上限を超えるエラー"""
+    pass
+
+class PageRangeError(Exception):
+    """ページ範囲の指定に関するエラー"""
+    pass
+
+class PDFHashMismatchError(Exception):
+    """アップロードされたPDFの内容がオブジェクトキーのハッシュと一致しないエラー"""
+    pass
+
+class InvalidPDFError(Exception):
+    """アップロードされたファイルがPDFではないエラー"""
+    pass
+
 # 型定義
+class PdfExtractionResult(TypedDict):
+    """PDFのテキスト抽出結果の型定義"""
+    text: str
+    # 抽出したページ番号（1始まり）
+    pages: List[int]
+    pageCount: int
+    estimatedTokens: int
+    # トークン予算により抽出を打ち切った場合はTrue
+    truncated: bool
+
 class LambdaResponse(TypedDict):
     """Lambda関数のレスポンス型定義"""
     statusCode: int
@@ -31,8 +70,68 @@ class HttpStatus:
     """HTTPステータスコード定数"""
     OK = 200
     BAD_REQUEST = 400
+    PAYLOAD_TOO_LARGE = 413
     SERVER_ERROR = 500
 
+class UploadConfig:
+    """S3への直接アップロード関連の設定定数"""
+    PREFIX = "uploads/"
+    CONTENT_TYPE = "application/pdf"
+    # 署名付きURLの有効期間（秒）
+    URL_EXPIRES_SECONDS = int(os.environ.get("PDF_UPLOAD_URL_EXPIRES_SECONDS", "300"))
+    # 処理するPDFの最大サイズ
+    MAX_BYTES = int(os.environ.get("PDF_MAX_BYTES", str(100 * 1024 * 1024)))
+    # これを超えるサイズのPDFはメモリではなく/tmpに書き出して読み込む
+    SPOOL_MAX_MEMORY_BYTES = int(os.environ.get("PDF_SPOOL_MAX_MEMORY_BYTES", str(16 * 1024 * 1024)))
+    # PDFファイルの先頭（この範囲にヘッダーがないファイルはPDFとして扱わない）
+    PDF_HEADER = b"%PDF-"
+    PDF_HEADER_SEARCH_BYTES = 1024
+    # 内容のSHA-256で命名したオブジェクトキー
+    HASHED_KEY_PATTERN = re.compile(r"^uploads/([0-9a-f]{64})\.pdf$")
+    HASH_CHUNK_SIZE = 1024 * 1024
+
+class ArchiveMode:
+    """PDFのS3への保存の待ち方"""
+    # テキスト抽出と並行して保存し、両方の完了を待ってからレスポンスを返す
+    WAIT = "wait"
+    # 保存の完了を待たずにレスポンスを返す（保存はレスポンス返却後も続け、失敗はログに出す）
+    BACKGROUND = "background"
+
+class ArchiveConfig:
+    """PDFのS3への保存関連の設定定数"""
+    MODE = os.environ.get("PDF_ARCHIVE_MODE", ArchiveMode.WAIT)
+    MAX_ATTEMPTS = int(os.environ.get("PDF_ARCHIVE_MAX_ATTEMPTS", "3"))
+    RETRY_BASE_DELAY_SECONDS = 0.5
+
+class PdfCacheConfig:
+    """抽出済みテキストのキャッシュ関連の設定定数"""
+    # memory / dynamodb:<テーブル名> / s3:<バケット名>/<プレフィックス> / file:<ディレクトリ>
+    BACKEND = os.environ.get("PDF_CACHE_BACKEND", "memory")
+    TTL_SECONDS = float(os.environ.get("PDF_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+    MAX_ENTRIES = int(os.environ.get("PDF_CACHE_MAX_ENTRIES", "32"))
+    MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+class ExtractConfig:
+    """PDFのテキスト抽出関連の設定定数"""
+    # 並列抽出のワーカー数（0の場合はメモリ設定から割り当てられるvCPU数に合わせる）
+    WORKERS = int(os.environ.get("PDF_EXTRACT_WORKERS", "0"))
+    # Lambdaは1,769MBごとに1vCPUが割り当てられる
+    MEMORY_MB_PER_VCPU = 1769
+    # ワーカー1つあたりの最小ページ数（これより少ない場合はプロセス起動のコストの方が大きい）
+    MIN_PAGES_PER_WORKER = 8
+    # 抽出するテキストの推定トークン数のサーバー側の上限（0の場合は上限なし）。
+    # 0より大きい場合は、リクエストのbudgetTokens（0=上限なしを含む）もこの値までに制限される
+    TOKEN_BUDGET = int(os.environ.get("PDF_TOKEN_BUDGET", "0"))
+    # サンプリング時に必ず含める先頭のページ数
+    SAMPLE_HEAD_PAGES = int(os.environ.get("PDF_SAMPLE_HEAD_PAGES", "5"))
+
+class PageStrategy:
+    """トークン予算内に収めるページの選び方"""
+    # 先頭から順に抽出する
+    SEQUENTIAL = "sequential"
+    # 先頭の数ページに加えて、残りのページから均等な間隔で抽出する
+    SAMPLE = "sample"
+
 # 必要な環境変数のリスト
 REQUIRED_ENV_VARS = [
     "PDF_BUCKET_NAME"
@@ -71,6 +170,220 @@ def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse
         "body": json.dumps(message)
     }
 
+@lru_cache(maxsize=1)
+def get_s3_client() -> Any:
+    """
+    コンテナで共有するS3クライアントを取得する
+    
+    Returns:
+        Any: S3クライアント
+    """
+    # チェックサム付きの署名付きURLを発行するため、署名バージョン4を使う
+    return boto3.client('s3', config=Config(signature_version="s3v4"))
+
+def compute_sha256(pdf_content: Union[bytes, BinaryIO]) -> str:
+    """
+    PDFの内容のSHA-256を計算する
+    
+    Args:
+        pdf_content (Union[bytes, BinaryIO]): PDFファイルのバイナリデータ、またはシーク可能なファイル
+    
+    Returns:
+        str: 16進数のハッシュ値（ファイルの場合は読み終えた後に先頭にシークし直す）
+    """
+    if isinstance(pdf_content, bytes):
+        return hashlib.sha256(pdf_content).hexdigest()
+    digest = hashlib.sha256()
+    pdf_content.seek(0)
+    for chunk in iter(lambda: pdf_content.read(UploadConfig.HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    pdf_content.seek(0)
+    return digest.hexdigest()
+
+def get_object_key_for_hash(pdf_hash: str) -> str:
+    """
+    PDFのハッシュ値から保存先のオブジェクトキーを生成する
+    
+    Args:
+        pdf_hash (str): 16進数のSHA-256
+    
+    Returns:
+        str: オブジェクトキー
+    """
+    return f"{UploadConfig.PREFIX}{pdf_hash}.pdf"
+
+def get_hash_from_object_key(object_key: str) -> Optional[str]:
+    """
+    ハッシュ値で命名したオブジェクトキーからハッシュ値を取り出す
+    
+    Args:
+        object_key (str): オブジェクトキー
+    
+    Returns:
+        Optional[str]: ハッシュ値。UUIDで命名した従来のキーの場合はNone
+    """
+    match = UploadConfig.HASHED_KEY_PATTERN.match(object_key)
+    return match.group(1) if match else None
+
+def object_exists(object_key: str) -> bool:
+    """
+    S3にオブジェクトが存在するか確認する
+    
+    Args:
+        object_key (str): オブジェクトキー
+    
+    Returns:
+        bool: 存在する場合はTrue
+    
+    Raises:
+        S3Error: 確認に失敗した場合
+    """
+    try:
+        get_s3_client().head_object(Bucket=os.environ["PDF_BUCKET_NAME"], Key=object_key)
+        return True
+    except Exception as e:
+        code = getattr(e, "response", {}).get("Error", {}).get("Code")
+        if code in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise S3Error(f"S3のオブジェクトの確認に失敗しました: {str(e)}")
+
+def create_upload_url(pdf_hash: Optional[str] = None) -> Dict[str, Any]:
+    """
+    ブラウザからS3へPDFを直接アップロードするための署名付きPOSTを発行する
+    
+    S3側でサイズの上限（UploadConfig.MAX_BYTES）とContent-Typeを検証する条件を付ける。
+    PDFのSHA-256を指定した場合は、ハッシュ値で命名したキーに対してS3側でチェックサムも検証する。
+    同じ内容のPDFがすでに保存されている場合は発行せず、既存のオブジェクトキーを返す。
+    
+    Args:
+        pdf_hash (Optional[str]): 16進数のSHA-256
+    
+    Returns:
+        Dict[str, Any]: アップロード先のURL、オブジェクトキー、フォームに含めるフィールド
+    
+    Raises:
+        S3Error: 署名付きPOSTの発行に失敗した場合
+    """
+    if pdf_hash is not None:
+        pdf_hash = str(pdf_hash).lower()
+        object_key = get_object_key_for_hash(pdf_hash)
+        if not get_hash_from_object_key(object_key):
+            raise PDFHashMismatchError("sha256には64桁の16進数を指定してください")
+        if object_exists(object_key):
+            return {"exists": True, "objectKey": object_key}
+    else:
+        object_key = f"{UploadConfig.PREFIX}{uuid.uuid4()}.pdf"
+
+    try:
+        fields = {"Content-Type": UploadConfig.CONTENT_TYPE}
+        conditions: List[Any] = [
+            {"Content-Type": UploadConfig.CONTENT_TYPE},
+            ["content-length-range", 1, UploadConfig.MAX_BYTES]
+        ]
+        if pdf_hash is not None:
+            checksum = base64.b64encode(bytes.fromhex(pdf_hash)).decode("ascii")
+            fields["x-amz-checksum-sha256"] = checksum
+            conditions.append({"x-amz-checksum-sha256": checksum})
+        post = get_s3_client().generate_presigned_post(
+            Bucket=os.environ["PDF_BUCKET_NAME"],
+            Key=object_key,
+            Fields=fields,
+            Conditions=conditions,
+            ExpiresIn=UploadConfig.URL_EXPIRES_SECONDS
+        )
+        return {
+            "exists": False,
+            "uploadUrl": post["url"],
+            "objectKey": object_key,
+            "fields": post["fields"],
+            "expiresIn": UploadConfig.URL_EXPIRES_SECONDS,
+            "maxBytes": UploadConfig.MAX_BYTES
+        }
+    except Exception as e:
+        raise S3Error(f"アップロード用URLの発行に失敗しました: {str(e)}")
+
+def is_valid_object_key(object_key: Any) -> bool:
+    """
+    クライアントから受け取ったオブジェクトキーがアップロード用プレフィックス配下のPDFか確認する
+    
+    Args:
+        object_key (Any): オブジェクトキー
+    
+    Returns:
+        bool: 処理してよいキーの場合はTrue
+    """
+    return (
+        isinstance(object_key, str)
+        and object_key.startswith(UploadConfig.PREFIX)
+        and object_key.endswith(".pdf")
+        and ".." not in object_key
+    )
+
+def open_s3_object(object_key: str) -> BinaryIO:
+    """
+    S3上のPDFをストリーミングで読み込み、シーク可能なファイルとして返す
+    
+    小さいファイルはメモリ上に、大きいファイルは/tmpに書き出す（Base64文字列やバイト列のコピーを保持しない）
+    
+    Args:
+        object_key (str): オブジェクトキー
+    
+    Returns:
+        BinaryIO: 先頭にシークしたファイル（呼び出し元でcloseすること）
+    
+    Raises:
+        PDFTooLargeError: サイズが上限を超える場合（オブジェクトは削除する）
+        S3Error: 読み込みに失敗した場合
+    """
+    s3 = get_s3_client()
+    bucket_name = os.environ["PDF_BUCKET_NAME"]
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=object_key)
+    except Exception as e:
+        raise S3Error(f"アップロードされたPDFが見つかりません: {str(e)}")
+    if head["ContentLength"] > UploadConfig.MAX_BYTES:
+        # 処理できないオブジェクトをバケットに残さない
+        delete_from_s3(object_key)
+        raise PDFTooLargeError(
+            f"PDFファイルが大きすぎます（上限: {UploadConfig.MAX_BYTES // (1024 * 1024)}MB）"
+        )
+
+    pdf_file = tempfile.SpooledTemporaryFile(max_size=UploadConfig.SPOOL_MAX_MEMORY_BYTES)
+    try:
+        s3.download_fileobj(bucket_name, object_key, pdf_file)
+        pdf_file.seek(0)
+        return pdf_file
+    except Exception as e:
+        pdf_file.close()
+        raise S3Error(f"PDFファイルのS3からの読み込みに失敗しました: {str(e)}")
+
+def is_pdf_file(pdf_file: BinaryIO) -> bool:
+    """
+    ファイルの先頭にPDFのヘッダーがあるか確認する
+    
+    Args:
+        pdf_file (BinaryIO): シーク可能なファイル（確認後に先頭にシークし直す）
+    
+    Returns:
+        bool: PDFのヘッダーがある場合はTrue
+    """
+    pdf_file.seek(0)
+    head = pdf_file.read(UploadConfig.PDF_HEADER_SEARCH_BYTES)
+    pdf_file.seek(0)
+    return UploadConfig.PDF_HEADER in head
+
+def delete_from_s3(object_key: str) -> None:
+    """
+    S3のオブジェクトを削除する（失敗してもログに出すだけにする）
+    
+    Args:
+        object_key (str): オブジェクトキー
+    """
+    try:
+        get_s3_client().delete_object(Bucket=os.environ["PDF_BUCKET_NAME"], Key=object_key)
+    except Exception as e:
+        print(f"S3のオブジェクトの削除に失敗しました: {str(e)}")
+
 def save_to_s3(pdf_content: bytes, file_name: str) -> str:
     """
     PDFファイルをS3に保存する
@@ -86,9 +399,9 @@ def save_to_s3(pdf_content: bytes, file_name: str) -> str:
         S3Error: S3への保存に失敗した場合
     """
     try:
-        s3 = boto3.client('s3')
+        s3 = get_s3_client()
         bucket_name = os.environ["PDF_BUCKET_NAME"]
-        object_key = f"uploads/{file_name}"
+        object_key = f"{UploadConfig.PREFIX}{file_name}"
         
         s3.put_object(
             Bucket=bucket_name,
@@ -100,34 +413,444 @@ def save_to_s3(pdf_content: bytes, file_name: str) -> str:
     except Exception as e:
         raise S3Error(f"PDFファイルのS3保存に失敗しました: {str(e)}")
 
-def extract_text_from_pdf(pdf_content: bytes) -> str:
+# S3への保存をテキスト抽出と並行して行うスレッド
+_archive_executor = ThreadPoolExecutor(max_workers=2)
+# レスポンス返却後に保存の完了を待つためのキュー（Lambdaの内部拡張機能で処理する）
+_deferred = get_flusher()
+
+def archive_pdf(pdf_content: bytes, pdf_hash: str) -> str:
     """
-    PDFからテキストを抽出する
+    PDFをハッシュ値で命名したキーでS3に保存する（保存済みの場合は省略し、失敗した場合はリトライする）
     
     Args:
         pdf_content (bytes): PDFファイルのバイナリデータ
+        pdf_hash (str): PDFのSHA-256
     
     Returns:
-        str: 抽出されたテキスト
+        str: オブジェクトキー
     
     Raises:
+        S3Error: リトライしても保存できなかった場合
+    """
+    object_key = get_object_key_for_hash(pdf_hash)
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if not object_exists(object_key):
+                save_to_s3(pdf_content, f"{pdf_hash}.pdf")
+            return object_key
+        except S3Error as e:
+            if attempt >= ArchiveConfig.MAX_ATTEMPTS:
+                raise
+            delay = ArchiveConfig.RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)
+            print(f"PDFファイルのS3保存をリトライします（{attempt}回目, {delay:.1f}秒後）: {str(e)}")
+            time.sleep(delay)
+
+def finish_background_archive(future: Any, object_key: str, cache_key: str, result: Dict[str, Any]) -> None:
+    """
+    バックグラウンドでの保存の完了を待ち、保存できた場合のみ抽出結果をキャッシュする
+    
+    Args:
+        future (Any): archive_pdfのFuture
+        object_key (str): オブジェクトキー
+        cache_key (str): 抽出済みテキストのキャッシュキー
+        result (Dict[str, Any]): 抽出結果
+    """
+    try:
+        future.result()
+    except Exception as e:
+        print(f"PDFファイルのS3保存に失敗しました（{object_key}）: {str(e)}")
+        return
+    _extraction_cache.set(cache_key, result, PdfCacheConfig.TTL_SECONDS)
+
+def get_worker_count(page_count: int) -> int:
+    """
+    並列抽出に使うワーカー数を決める
+    
+    Args:
+        page_count (int): PDFのページ数
+    
+    Returns:
+        int: ワーカー数（1の場合は並列化しない）
+    """
+    workers = ExtractConfig.WORKERS
+    if workers <= 0:
+        cpu_count = os.cpu_count() or 1
+        memory_mb = int(os.environ.get("AWS_LAMBDA_FUNCTION_MEMORY_SIZE", "0"))
+        # 1,769MBを超えると2つ目のvCPUの一部が割り当てられるため切り上げる（3,008MBでは2）
+        workers = min(cpu_count, -(-memory_mb // ExtractConfig.MEMORY_MB_PER_VCPU)) if memory_mb else cpu_count
+    return max(1, min(workers, page_count // ExtractConfig.MIN_PAGES_PER_WORKER))
+
+def split_page_ranges(page_count: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    ページを連続した範囲に均等に分割する
+    
+    Args:
+        page_count (int): PDFのページ数
+        workers (int): ワーカー数
+    
+    Returns:
+        List[Tuple[int, int]]: ページ範囲（開始, 終了）のリスト（ページ順）
+    """
+    size, remainder = divmod(page_count, workers)
+    ranges = []
+    start = 0
+    for i in range(workers):
+        end = start + size + (1 if i < remainder else 0)
+        ranges.append((start, end))
+        start = end
+    return ranges
+
+@lru_cache(maxsize=1)
+def get_worker_context() -> Any:
+    """
+    並列抽出の子プロセスの起動に使うmultiprocessingのコンテキストを取得する
+    
+    S3保存やテレメトリのスレッドが動いているハンドラーのプロセスをforkすると、それらが保持している
+    ロックを子プロセスに持ち込むおそれがある。そのため、スレッドを持たないforkserverのプロセスからforkする。
+    forkserverにはpage_worker（pypdf）を事前に読み込ませ、子プロセスごとのimportを省く
+    
+    Returns:
+        Any: forkserverのコンテキスト
+    """
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(["page_worker"])
+    return context
+
+def extract_pages_parallel(reader: PdfReader, pdf_content: bytes, indices: List[int], workers: int) -> List[str]:
+    """
+    ページを分割して複数プロセスで並列にテキストを抽出する
+    
+    LambdaではPOSIXセマフォ（/dev/shm）が使えずmultiprocessing.Poolが動かないため、
+    forkserverから起動したProcessとPipeで結果を受け取る。最初の範囲は親プロセス自身が担当する。
+    
+    Args:
+        reader (PdfReader): 親プロセスのPDFリーダー
+        pdf_content (bytes): PDFファイルのバイナリデータ
+        indices (List[int]): ページ番号（0始まり）
+        workers (int): ワーカー数
+    
+    Returns:
+        List[str]: indicesと同じ順序のテキスト
+    
+    Raises:
+        PDFProcessError: 子プロセスでの抽出に失敗した場合
+    """
+    context = get_worker_context()
+    ranges = split_page_ranges(len(indices), workers)
+    children = []
+    for start, end in ranges[1:]:
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(target=run_extract_worker, args=(pdf_content, indices[start:end], child_conn))
+        process.start()
+        child_conn.close()
+        children.append((process, parent_conn))
+
+    try:
+        start, end = ranges[0]
+        texts = extract_page_texts(reader, indices[start:end])
+        errors = []
+        # 子プロセスがパイプへの書き込みで止まらないよう、joinより先に受け取る
+        for process, conn in children:
+            try:
+                ok, result = conn.recv()
+            except EOFError:
+                ok, result = False, f"ワーカーが異常終了しました（終了コード: {process.exitcode}）"
+            if ok:
+                texts.extend(result)
+            else:
+                errors.append(result)
+    finally:
+        for process, conn in children:
+            conn.close()
+            process.join()
+
+    if errors:
+        raise PDFProcessError(errors[0])
+    return texts
+
+def parse_page_range(spec: Optional[str], page_count: int) -> List[int]:
+    """
+    ページ範囲の指定（例: "1-10,15,20-"）をページ番号のリストに変換する
+    
+    Args:
+        spec (Optional[str]): ページ範囲（1始まり）。未指定の場合は全ページ
+        page_count (int): PDFのページ数
+    
+    Returns:
+        List[int]: 昇順のページ番号（0始まり）
+    
+    Raises:
+        PageRangeError: 指定が正しくない場合
+    """
+    if not spec:
+        return list(range(page_count))
+    indices = set()
+    for part in str(spec).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        first, separator, last = part.partition("-")
+        try:
+            start = int(first) if first.strip() else 1
+            end = (int(last) if last.strip() else page_count) if separator else start
+        except ValueError:
+            raise PageRangeError(f"ページ範囲の指定が正しくありません: {part}")
+        if start < 1 or end < start:
+            raise PageRangeError(f"ページ範囲の指定が正しくありません: {part}")
+        indices.update(range(start - 1, min(end, page_count)))
+    if not indices:
+        raise PageRangeError(f"指定した範囲にページがありません（全{page_count}ページ）")
+    return sorted(indices)
+
+def spread_order(count: int) -> List[int]:
+    """
+    0〜count-1を、どこで打ち切っても全体から均等な間隔で選ばれる順序に並べる
+    
+    Args:
+        count (int): 要素数
+    
+    Returns:
+        List[int]: 並べ替えた位置（例: 8なら 0, 4, 2, 6, 1, 3, 5, 7）
+    """
+    order: List[int] = []
+    seen = set()
+    step = 1
+    while step < count:
+        step *= 2
+    while step >= 1:
+        for position in range(0, count, step):
+            if position not in seen:
+                seen.add(position)
+                order.append(position)
+        step //= 2
+    return order
+
+def order_pages(indices: List[int], strategy: str) -> List[int]:
+    """
+    トークン予算内で抽出する優先順にページを並べる
+    
+    Args:
+        indices (List[int]): 対象のページ番号（0始まり、昇順）
+        strategy (str): ページの選び方（PageStrategyのいずれか）
+    
+    Returns:
+        List[int]: 抽出する順序に並べたページ番号
+    """
+    if strategy != PageStrategy.SAMPLE:
+        return indices
+    head = indices[:ExtractConfig.SAMPLE_HEAD_PAGES]
+    rest = indices[ExtractConfig.SAMPLE_HEAD_PAGES:]
+    return head + [rest[position] for position in spread_order(len(rest))]
+
+def extract_pages(reader: PdfReader, pdf_content: Optional[bytes], indices: List[int]) -> List[str]:
+    """
+    ページ数と使えるvCPU数に応じて、直列または並列にテキストを抽出する
+    
+    Args:
+        reader (PdfReader): PDFリーダー
+        pdf_content (Optional[bytes]): PDFファイルのバイナリデータ（Noneの場合は並列化しない）
+        indices (List[int]): ページ番号（0始まり）
+    
+    Returns:
+        List[str]: indicesと同じ順序のテキスト
+    """
+    workers = get_worker_count(len(indices))
+    if workers > 1 and pdf_content is not None:
+        return extract_pages_parallel(reader, pdf_content, indices, workers)
+    return extract_page_texts(reader, indices)
+
+def extract_pages_within_budget(
+    reader: PdfReader,
+    pdf_content: Optional[bytes],
+    indices: List[int],
+    budget_tokens: int
+) -> Tuple[List[Tuple[int, str]], bool]:
+    """
+    推定トークン数が予算に達するまで、指定した順にページを抽出する
+    
+    並列に抽出できる場合は「ワーカー数×ワーカーあたりの最小ページ数」ずつまとめて並列に抽出し、
+    予算に達したら以降のまとまりは読まない。並列化しない場合は1枚ずつ抽出する
+    
+    Args:
+        reader (PdfReader): PDFリーダー
+        pdf_content (Optional[bytes]): PDFファイルのバイナリデータ（Noneの場合は並列化しない）
+        indices (List[int]): 抽出する順序に並べたページ番号（0始まり）
+        budget_tokens (int): 推定トークン数の上限
+    
+    Returns:
+        Tuple[List[Tuple[int, str]], bool]: 抽出した（ページ番号, テキスト）のリストと、予算で打ち切ったかどうか
+    """
+    workers = get_worker_count(len(indices)) if pdf_content is not None else 1
+    batch_size = workers * ExtractConfig.MIN_PAGES_PER_WORKER if workers > 1 else 1
+    extracted: List[Tuple[int, str]] = []
+    total_tokens = 0
+    for start in range(0, len(indices), batch_size):
+        batch = indices[start:start + batch_size]
+        for index, text in zip(batch, extract_pages(reader, pdf_content, batch)):
+            tokens = estimate_tokens(text)
+            if total_tokens + tokens > budget_tokens:
+                if not extracted:
+                    # 1ページ目だけで予算を超える場合は途中まで使う（1文字は1トークン以下なので文字数で切れば収まる）
+                    extracted.append((index, text[:budget_tokens]))
+                return extracted, True
+            extracted.append((index, text))
+            total_tokens += tokens
+    return extracted, False
+
+def extract_text_from_pdf(
+    pdf_content: Union[bytes, BinaryIO],
+    page_range: Optional[str] = None,
+    strategy: str = PageStrategy.SEQUENTIAL,
+    budget_tokens: Optional[int] = None
+) -> PdfExtractionResult:
+    """
+    PDFからテキストを抽出する
+    
+    ページ数が多く複数のvCPUが使える場合は、ページを分割して複数プロセスで並列に抽出する。
+    トークン予算を指定した場合は、予算に達するまでページを抽出して残りのページは読まない。
+    
+    Args:
+        pdf_content (Union[bytes, BinaryIO]): PDFファイルのバイナリデータ、またはシーク可能なファイル
+        page_range (Optional[str]): 抽出するページ範囲（例: "1-10,15"）。未指定の場合は全ページ
+        strategy (str): 予算内に収めるページの選び方（PageStrategyのいずれか）
+        budget_tokens (Optional[int]): 推定トークン数の上限。未指定の場合はExtractConfig.TOKEN_BUDGET（0は上限なし）
+    
+    Returns:
+        PdfExtractionResult: 抽出結果
+    
+    Raises:
+        PageRangeError: ページ範囲の指定が正しくない場合
         PDFProcessError: PDFの処理に失敗した場合
     """
+    if budget_tokens is None:
+        budget_tokens = ExtractConfig.TOKEN_BUDGET
     try:
-        # BytesIOを使用してメモリ上でPDFを読み込む
-        pdf_file = BytesIO(pdf_content)
+        # バイト列の場合はBytesIOを使用してメモリ上でPDFを読み込む
+        pdf_file = BytesIO(pdf_content) if isinstance(pdf_content, bytes) else pdf_content
         reader = PdfReader(pdf_file)
+        page_count = len(reader.pages)
+        indices = parse_page_range(page_range, page_count)
         
-        # 全ページのテキストを結合
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-            
-        return text.strip()
+        # 並列抽出の子プロセスに渡すため、並列化する場合はバイト列にする
+        content: Optional[bytes] = None
+        if get_worker_count(len(indices)) > 1:
+            if isinstance(pdf_content, bytes):
+                content = pdf_content
+            else:
+                pdf_file.seek(0)
+                content = pdf_file.read()
+        
+        truncated = False
+        if budget_tokens > 0:
+            extracted, truncated = extract_pages_within_budget(reader, content, order_pages(indices, strategy), budget_tokens)
+            extracted.sort()
+            indices = [index for index, _ in extracted]
+            texts = [text for _, text in extracted]
+        else:
+            texts = extract_pages(reader, content, indices)
+        
+        # ページ順に結合
+        text = "\n".join(texts).strip()
+        return {
+            "text": text,
+            "pages": [index + 1 for index in indices],
+            "pageCount": page_count,
+            "estimatedTokens": estimate_tokens(text),
+            "truncated": truncated
+        }
             
+    except (PageRangeError, PDFProcessError):
+        raise
     except Exception as e:
         raise PDFProcessError(f"PDFからのテキスト抽出に失敗しました: {str(e)}")
 
+# PDFのハッシュ値と抽出オプションごとの抽出済みテキストのキャッシュ
+_extraction_cache = create_store(PdfCacheConfig.BACKEND, PdfCacheConfig.MAX_ENTRIES, PdfCacheConfig.MAX_BYTES)
+
+def build_extraction_cache_key(pdf_hash: str, options: Dict[str, Any]) -> str:
+    """
+    抽出済みテキストのキャッシュキーを生成する
+    
+    Args:
+        pdf_hash (str): PDFのSHA-256
+        options (Dict[str, Any]): extract_text_from_pdfのキーワード引数
+    
+    Returns:
+        str: キャッシュキー
+    """
+    return f"pdf:{pdf_hash}:{options['page_range'] or ''}:{options['strategy']}:{options['budget_tokens']}"
+
+def get_extract_options(body: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    リクエストボディからテキスト抽出のオプションを取り出す
+    
+    Args:
+        body (Dict[str, Any]): リクエストボディ（pages, strategy, budgetTokens）
+    
+    Returns:
+        Dict[str, Any]: extract_text_from_pdfのキーワード引数
+    
+    Raises:
+        PageRangeError: オプションの指定が正しくない場合
+    """
+    # budgetTokensは未指定・0の場合は上限なし。ExtractConfig.TOKEN_BUDGETが設定されている場合はその値までに制限し、
+    # 適用した予算はレスポンスのbudgetTokensで返す
+    strategy = body.get("strategy") or PageStrategy.SEQUENTIAL
+    if strategy not in (PageStrategy.SEQUENTIAL, PageStrategy.SAMPLE):
+        raise PageRangeError(f"ページの選び方の指定が正しくありません: {strategy}")
+    budget_tokens = body.get("budgetTokens")
+    if budget_tokens is not None and (not isinstance(budget_tokens, int) or budget_tokens < 0):
+        raise PageRangeError("budgetTokensには0以上の整数を指定してください")
+    if ExtractConfig.TOKEN_BUDGET > 0:
+        # サーバー側の上限を超える予算（0=上限なしを含む）は指定できない
+        budget_tokens = min(budget_tokens or ExtractConfig.TOKEN_BUDGET, ExtractConfig.TOKEN_BUDGET)
+    elif budget_tokens is None:
+        budget_tokens = 0
+    return {
+        "page_range": body.get("pages"),
+        "strategy": strategy,
+        "budget_tokens": budget_tokens
+    }
+
+def create_extraction_response(
+    result: PdfExtractionResult,
+    object_key: str,
+    budget_tokens: int,
+    cache_hit: bool = False
+) -> LambdaResponse:
+    """
+    テキスト抽出結果のレスポンスを生成する
+    
+    Args:
+        result (PdfExtractionResult): 抽出結果
+        object_key (str): S3のオブジェクトキー
+        budget_tokens (int): 適用したトークン予算（0は上限なし）
+        cache_hit (bool): 抽出済みテキストのキャッシュを使ったかどうか
+    
+    Returns:
+        LambdaResponse: Lambda関数のレスポンス
+    """
+    metrics.put("PageCount", result["pageCount"])
+    metrics.put("ExtractedPages", len(result["pages"]))
+    metrics.put("OutputTokens", result["estimatedTokens"])
+    metrics.set_property("cacheHit", cache_hit)
+    metrics.set_property("truncated", result["truncated"])
+    return create_response(HttpStatus.OK, {
+        "message": "PDFの処理が完了しました",
+        "text": result["text"],
+        "objectKey": object_key,
+        "pages": result["pages"],
+        "pageCount": result["pageCount"],
+        "estimatedTokens": result["estimatedTokens"],
+        "truncated": result["truncated"],
+        "budgetTokens": budget_tokens,
+        "cacheHit": cache_hit
+    })
+
+@metrics.instrument_handler("load_pdf")
+@_deferred.wrap_handler
 def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
     """
     Lambda関数のメインハンドラー
@@ -147,8 +870,49 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
         # 環境変数の検証
         validate_environment()
         
+        # 直接アップロード用の署名付きURLの発行
+        if (event.get("resource") or "").endswith("/upload-url"):
+            body = json.loads(event.get("body") or "{}")
+            return create_response(HttpStatus.OK, create_upload_url(body.get("sha256")))
+
         # 入力チェック
-        body = json.loads(event.get("body", "{}"))
+        raw_body = event.get("body") or "{}"
+        metrics.put("RequestBytes", len(raw_body.encode("utf-8")), metrics.MetricUnit.BYTES)
+        body = json.loads(raw_body)
+        options = get_extract_options(body)
+
+        # S3に直接アップロード済みのPDFを処理
+        if "objectKey" in body:
+            object_key = body["objectKey"]
+            if not is_valid_object_key(object_key):
+                return create_response(HttpStatus.BAD_REQUEST, {
+                    "message": "オブジェクトキーが正しくないようです🤔"
+                })
+            # ハッシュ値で命名したキーで抽出済みの場合はS3から読み込まない
+            pdf_hash = get_hash_from_object_key(object_key)
+            if pdf_hash:
+                cached = _extraction_cache.get(build_extraction_cache_key(pdf_hash, options))
+                if cached is not None:
+                    return create_extraction_response(cached, object_key, options["budget_tokens"], cache_hit=True)
+
+            with open_s3_object(object_key) as pdf_file:
+                if not is_pdf_file(pdf_file):
+                    delete_from_s3(object_key)
+                    raise InvalidPDFError("アップロードされたファイルはPDFではないようです🤔")
+                actual_hash = compute_sha256(pdf_file)
+                if pdf_hash and actual_hash != pdf_hash:
+                    # キーと内容が一致しないオブジェクトは以降の重複判定を誤らせるので削除する
+                    delete_from_s3(object_key)
+                    raise PDFHashMismatchError("アップロードされたPDFが壊れているようです。もう一度アップロードしてください")
+                cache_key = build_extraction_cache_key(actual_hash, options)
+                cached = _extraction_cache.get(cache_key)
+                if cached is not None:
+                    return create_extraction_response(cached, object_key, options["budget_tokens"], cache_hit=True)
+                with metrics.span("Extract"):
+                    result = extract_text_from_pdf(pdf_file, **options)
+            _extraction_cache.set(cache_key, result, PdfCacheConfig.TTL_SECONDS)
+            return create_extraction_response(result, object_key, options["budget_tokens"])
+
         pdf_base64 = body.get("pdfBase64")
         if not pdf_base64:
             return create_response(HttpStatus.BAD_REQUEST, {
@@ -163,21 +927,45 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
                 "message": f"PDFファイルのデコードに失敗しました: {str(e)}"
             })
         
-        # ファイル名生成（UUID）
-        file_name = f"{uuid.uuid4()}.pdf"
-        
-        # S3に保存
-        object_key = save_to_s3(pdf_content, file_name)
+        metrics.put("PdfBytes", len(pdf_content), metrics.MetricUnit.BYTES)
+        # ファイル名は内容のSHA-256にして、同じPDFは1つだけ保存する
+        pdf_hash = compute_sha256(pdf_content)
+        object_key = get_object_key_for_hash(pdf_hash)
+        cache_key = build_extraction_cache_key(pdf_hash, options)
+
+        # 抽出済みの場合は保存済みなので、保存もテキスト抽出も行わない
+        cached = _extraction_cache.get(cache_key)
+        if cached is not None:
+            return create_extraction_response(cached, object_key, options["budget_tokens"], cache_hit=True)
+
+        # S3への保存（同じ内容のPDFが保存済みの場合は省略）をテキスト抽出と並行して行う
+        archive_future = _archive_executor.submit(archive_pdf, pdf_content, pdf_hash)
         
         # テキスト抽出
-        extracted_text = extract_text_from_pdf(pdf_content)
+        with metrics.span("Extract"):
+            result = extract_text_from_pdf(pdf_content, **options)
         
-        return create_response(HttpStatus.OK, {
-            "message": "PDFの処理が完了しました",
-            "text": extracted_text,
-            "objectKey": object_key
-        })
+        if ArchiveConfig.MODE == ArchiveMode.BACKGROUND:
+            # 保存の完了は待たずにレスポンスを返し、次の呼び出しまでに完了させる
+            _deferred.submit(
+                lambda: finish_background_archive(archive_future, object_key, cache_key, result),
+                stage="BackgroundArchive"
+            )
+        else:
+            with metrics.span("ArchiveWait"):
+                archive_future.result()
+            _extraction_cache.set(cache_key, result, PdfCacheConfig.TTL_SECONDS)
+        
+        return create_extraction_response(result, object_key, options["budget_tokens"])
 
+    except (PageRangeError, PDFHashMismatchError, InvalidPDFError) as e:
+        return create_response(HttpStatus.BAD_REQUEST, {
+            "message": str(e)
+        })
+    except PDFTooLargeError as e:
+        return create_response(HttpStatus.PAYLOAD_TOO_LARGE, {
+            "message": str(e)
+        })
     except (EnvironmentError, S3Error, PDFProcessError) as e:
         error_message = str(e)
         return create_response(HttpStatus.SERVER_ERROR, {
@@ -0,0 +1,43 @@
+"""
+PDFのページのテキスト抽出（並列抽出の子プロセスで実行する処理）
+
+子プロセスはforkserverから起動し、このモジュールだけをimportする。
+app（boto3・テレメトリの拡張機能の登録・S3保存のスレッドを含む）は子プロセスでは読み込まない
+"""
+from io import BytesIO
+from typing import Any, List
+
+from pypdf import PdfReader
+
+
+def extract_page_texts(reader: PdfReader, indices: List[int]) -> List[str]:
+    """
+    指定したページのテキストを抽出する
+
+    Args:
+        reader (PdfReader): PDFリーダー
+        indices (List[int]): ページ番号（0始まり）
+
+    Returns:
+        List[str]: ページごとのテキスト
+    """
+    return [reader.pages[i].extract_text() or "" for i in indices]
+
+
+def run_extract_worker(pdf_content: bytes, indices: List[int], conn: Any) -> None:
+    """
+    子プロセスで指定したページのテキストを抽出し、パイプで親プロセスに返す
+
+    Args:
+        pdf_content (bytes): PDFファイルのバイナリデータ
+        indices (List[int]): ページ番号（0始まり）
+        conn (Any): 結果を送るパイプ
+    """
+    try:
+        # ワーカーごとに独立したリーダーで読み込む
+        reader = PdfReader(BytesIO(pdf_content))
+        conn.send((True, extract_page_texts(reader, indices)))
+    except Exception as e:
+        conn.send((False, str(e)))
+    finally:
+        conn.close()
@@ -1,15 +1,57 @@
 import json
+import math
 import os
+import re
+import threading
+import time
 import requests
-from bs4 import BeautifulSoup
-from typing import Dict, Any, TypedDict
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup, Tag
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional, TypedDict
+from urllib.parse import urlparse
+from utils import metrics
+from utils.invocation import Deadline
+from utils.kv_store import create_store
 
 # カスタム例外クラス
 class URLProcessError(Exception):
     """URL処理関連のエラー"""
     pass
 
+class URLFetchError(URLProcessError):
+    """URL取得関連のエラー（エラー種別とHTTPステータスを持つ）"""
+    def __init__(self, message: str, code: str, status_code: int):
+        super().__init__(message)
+        self.code = code
+        self.status_code = status_code
+
 # 型定義
+class ExtractionResult(TypedDict):
+    """テキスト抽出結果の型定義"""
+    text: str
+    extractMode: str
+    originalChars: int
+    removedChars: int
+
+class FetchedPage(TypedDict):
+    """URL取得結果の型定義"""
+    html: Optional[str]
+    notModified: bool
+    etag: Optional[str]
+    lastModified: Optional[str]
+
+class BatchItemResult(TypedDict, total=False):
+    """一括読み込みのURLごとの結果の型定義"""
+    url: str
+    ok: bool
+    message: str
+    extractMode: str
+    originalChars: int
+    removedChars: int
+    cacheStatus: str
+    errorCode: str
+
 class LambdaResponse(TypedDict):
     """Lambda関数のレスポンス型定義"""
     statusCode: int
@@ -20,7 +62,110 @@ class HttpStatus:
     """HTTPステータスコード定数"""
     OK = 200
     BAD_REQUEST = 400
+    PAYLOAD_TOO_LARGE = 413
+    UNSUPPORTED_MEDIA_TYPE = 415
     SERVER_ERROR = 500
+    GATEWAY_TIMEOUT = 504
+
+class FetchErrorCode:
+    """URL取得エラーの種別"""
+    TOO_LARGE = "TOO_LARGE"
+    TIMED_OUT = "TIMED_OUT"
+    NOT_HTML = "NOT_HTML"
+    HTTP_ERROR = "HTTP_ERROR"
+    NETWORK_ERROR = "NETWORK_ERROR"
+
+class FetchConfig:
+    """URL取得関連の設定定数"""
+    CONNECT_TIMEOUT_SECONDS = 3.05
+    READ_TIMEOUT_SECONDS = float(os.environ.get("FETCH_READ_TIMEOUT_SECONDS", "10"))
+    # 展開後のサイズの上限
+    MAX_BYTES = int(os.environ.get("FETCH_MAX_BYTES", str(5 * 1024 * 1024)))
+    CHUNK_SIZE = 64 * 1024
+    # gzip/deflate圧縮での転送を受け付けるか
+    ENABLE_COMPRESSION = os.environ.get("FETCH_ENABLE_COMPRESSION", "true").lower() == "true"
+    ALLOWED_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+    POOL_MAXSIZE = 10
+    USER_AGENT = "Mozilla/5.0 (compatible; AWSLevelChecker/1.0; +https://checker.minoruonda.com/)"
+
+class CacheStatus:
+    """URLキャッシュの利用状況"""
+    # 有効期間内のキャッシュをそのまま返した
+    HIT = "HIT"
+    # 条件付きGETで304が返り、キャッシュを返した
+    REVALIDATED = "REVALIDATED"
+    # 取得・解析し直した
+    MISS = "MISS"
+
+class URLCacheConfig:
+    """URLキャッシュ関連の設定定数"""
+    # memory / dynamodb:<テーブル名> / s3:<バケット名>/<プレフィックス> / file:<ディレクトリ>
+    BACKEND = os.environ.get("URL_CACHE_BACKEND", "memory")
+    # この期間内は再検証せずにキャッシュを返す
+    FRESH_SECONDS = float(os.environ.get("URL_CACHE_FRESH_SECONDS", "300"))
+    # 再検証用にキャッシュを保持する期間
+    TTL_SECONDS = float(os.environ.get("URL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    MAX_ENTRIES = int(os.environ.get("URL_CACHE_MAX_ENTRIES", "64"))
+    # 256MBのメモリで動かすため、メモリ上のキャッシュは小さめにする
+    MAX_BYTES = int(os.environ.get("URL_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+class BatchConfig:
+    """複数URLの一括読み込み関連の設定定数"""
+    MAX_URLS = int(os.environ.get("BATCH_MAX_URLS", "10"))
+    # 取得を並列に行うスレッド数（HTMLのパースはExtractConfig.MAX_CONCURRENT_PARSESまでに制限する）
+    MAX_WORKERS = int(os.environ.get("BATCH_MAX_WORKERS", "4"))
+    # 同じホストへの同時接続数の上限（相手サイトへの負荷を抑える）
+    PER_HOST_CONCURRENCY = int(os.environ.get("BATCH_PER_HOST_CONCURRENCY", "2"))
+    # レスポンスを返すために残す時間。残り時間がこれを下回った時点で未完了のURLはタイムアウトとして返す
+    RESPONSE_MARGIN_SECONDS = float(os.environ.get("BATCH_RESPONSE_MARGIN_SECONDS", "2"))
+    # 結合したドキュメントでの記事の区切り
+    DOCUMENT_SEPARATOR = "\n\n---\n\n"
+
+class ExtractMode:
+    """テキスト抽出モード"""
+    # scriptとstyle以外のすべてのテキスト
+    FULL = "full"
+    # ナビゲーションやサイドバーなどを除いた本文のみ
+    MAIN = "main"
+
+class ExtractConfig:
+    """テキスト抽出関連の設定定数"""
+    # 既存の呼び出し元の結果を変えないよう全文を既定にし、本文のみの抽出はリクエストで指定したときだけ行う
+    DEFAULT_MODE = ExtractMode.FULL
+    # lxml / html.parser（lxmlが無い環境ではhtml.parserを使う）
+    PARSER = os.environ.get("HTML_PARSER", "lxml")
+    # 本文抽出の結果がこれより短い場合は抽出に失敗したとみなして全文を返す
+    MIN_MAIN_CHARS = 200
+    # 本文の候補とみなす段落の最小文字数
+    MIN_PARAGRAPH_CHARS = 25
+    # 文字コードを推定するときに見る先頭のバイト数
+    ENCODING_SAMPLE_BYTES = 64 * 1024
+    # 同時に行うHTMLのパースの数（パースはGILで並列にならず、大きなページはメモリを多く使うため）
+    MAX_CONCURRENT_PARSES = int(os.environ.get("MAX_CONCURRENT_PARSES", "1"))
+
+# 常に除去する要素（全文モードはこれだけを除く）
+TEXTLESS_TAGS = ["script", "style"]
+# 本文抽出モードで除去する要素
+NOISE_TAGS = ["noscript", "template", "iframe", "svg", "button"]
+BOILERPLATE_TAGS = ["nav", "footer", "aside"]
+
+# ブログプラットフォームごとの本文要素（先に見つかったものを使う）
+SITE_SELECTORS: Dict[str, List[str]] = {
+    "qiita.com": ["#personal-public-article-body", ".it-MdContent", "article"],
+    "zenn.dev": [".znc", "article"],
+    "note.com": [".note-common-styles__textnote-body", "[data-name='body']", "article"],
+    "dev.to": ["#article-body", ".crayons-article__body", "article"],
+}
+
+# class/id名による本文らしさの判定
+POSITIVE_HINT_PATTERN = re.compile(r"article|body|content|entry|main|post|text|blog|story|markdown", re.IGNORECASE)
+NEGATIVE_HINT_PATTERN = re.compile(
+    r"comment|footer|nav|sidebar|side-bar|related|recommend|share|social|banner|cookie|consent|"
+    r"\bads?\b|advert|promo|menu|breadcrumb|pagination|popup|modal|subscribe|newsletter|widget",
+    re.IGNORECASE
+)
+# 段落とみなす要素
+PARAGRAPH_TAGS = ["p", "pre", "td", "blockquote", "li", "h2", "h3"]
 
 def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse:
     """
@@ -44,46 +189,632 @@ def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse
         "body": json.dumps(message)
     }
 
-def extract_text_from_url(url: str) -> str:
+def create_session() -> requests.Session:
+    """
+    コネクションプール付きのHTTPセッションを生成する
+    
+    Returns:
+        requests.Session: HTTPセッション
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=FetchConfig.POOL_MAXSIZE, pool_maxsize=FetchConfig.POOL_MAXSIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({
+        "User-Agent": FetchConfig.USER_AGENT,
+        "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.1",
+        "Accept-Encoding": "gzip, deflate" if FetchConfig.ENABLE_COMPRESSION else "identity"
+    })
+    return session
+
+# ウォームコンテナ間で使い回すHTTPセッション
+_session = create_session()
+
+# <meta charset="..."> または <meta http-equiv="Content-Type" content="...; charset=..."> の文字コード指定
+META_CHARSET_PATTERN = re.compile(rb"""<meta[^>]+charset=["']?\s*([A-Za-z0-9_\-]+)""", re.IGNORECASE)
+
+def detect_encoding(response: requests.Response, content: bytes) -> str:
+    """
+    HTMLの文字コードを判定する（Content-Typeヘッダー、metaタグ、内容からの推定の順）
+    
+    ボディはiter_contentで読み終えているため、内容からの推定は受け取ったバイト列で行う
+    （response.apparent_encodingは読み終えたレスポンスでは使えない）
+    
+    Args:
+        response (requests.Response): HTTPレスポンス
+        content (bytes): レスポンスボディ
+    
+    Returns:
+        str: 文字コード
+    """
+    content_type = response.headers.get("Content-Type", "")
+    if "charset=" in content_type.lower():
+        return response.encoding
+    match = META_CHARSET_PATTERN.search(content[:4096])
+    if match:
+        return match.group(1).decode("ascii")
+    return guess_encoding(content)
+
+def guess_encoding(content: bytes) -> str:
+    """
+    文字コードの指定がないHTMLの文字コードを内容から推定する
+    
+    UTF-8として正しく読める場合はUTF-8とし、読めない場合のみcharset_normalizerで推定する
+    
+    Args:
+        content (bytes): レスポンスボディ
+    
+    Returns:
+        str: 文字コード（推定できない場合はutf-8）
+    """
+    try:
+        content.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        pass
+    from charset_normalizer import from_bytes
+    best = from_bytes(content[:ExtractConfig.ENCODING_SAMPLE_BYTES]).best()
+    return best.encoding if best else "utf-8"
+
+def create_timed_out_error() -> URLFetchError:
+    """
+    タイムアウトのエラーを生成する
+    
+    Returns:
+        URLFetchError: タイムアウトのエラー
+    """
+    return URLFetchError("ページの取得がタイムアウトしました", FetchErrorCode.TIMED_OUT, HttpStatus.GATEWAY_TIMEOUT)
+
+def create_too_large_error() -> URLFetchError:
+    """
+    サイズ上限超過のエラーを生成する
+    
+    Returns:
+        URLFetchError: サイズ上限超過のエラー
+    """
+    return URLFetchError(
+        f"ページのサイズが大きすぎます（上限: {FetchConfig.MAX_BYTES / (1024 * 1024):.1f}MB）",
+        FetchErrorCode.TOO_LARGE,
+        HttpStatus.PAYLOAD_TOO_LARGE
+    )
+
+def fetch_page(
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+    deadline: Optional[Deadline] = None
+) -> FetchedPage:
+    """
+    URLからHTMLを取得する（タイムアウト・サイズ上限・Content-Typeの確認付き）
+    
+    ETag/Last-Modifiedを指定した場合は条件付きGETで再検証し、更新が無ければHTMLを返さない。
+    期限を指定した場合は、読み込みのタイムアウトを残り時間までに縮め、ボディの受信中に期限を過ぎたら打ち切る
+    
+    Args:
+        url (str): 取得対象のURL
+        etag (Optional[str]): 前回取得時のETag
+        last_modified (Optional[str]): 前回取得時のLast-Modified
+        deadline (Optional[Deadline]): 取得の期限
+    
+    Returns:
+        FetchedPage: 取得結果
+    
+    Raises:
+        URLFetchError: 取得に失敗した場合
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    deadline = deadline or Deadline()
+    remaining = deadline.remaining_seconds()
+    if remaining <= 0:
+        raise create_timed_out_error()
+    try:
+        with _session.get(
+            url,
+            headers=headers,
+            stream=True,
+            timeout=(
+                min(FetchConfig.CONNECT_TIMEOUT_SECONDS, remaining),
+                min(FetchConfig.READ_TIMEOUT_SECONDS, remaining)
+            )
+        ) as response:
+            response.raise_for_status()
+            validators = {
+                "etag": response.headers.get("ETag") or etag,
+                "lastModified": response.headers.get("Last-Modified") or last_modified
+            }
+            if response.status_code == 304:
+                return {"html": None, "notModified": True, **validators}
+
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if content_type and content_type not in FetchConfig.ALLOWED_CONTENT_TYPES:
+                raise URLFetchError(
+                    f"HTMLページではないため読み込めません（Content-Type: {content_type}）",
+                    FetchErrorCode.NOT_HTML,
+                    HttpStatus.UNSUPPORTED_MEDIA_TYPE
+                )
+
+            content_length = response.headers.get("Content-Length")
+            if content_length and content_length.isdigit() and int(content_length) > FetchConfig.MAX_BYTES:
+                raise create_too_large_error()
+
+            # 圧縮転送の場合も展開後のサイズで上限を確認する
+            chunks = []
+            received = 0
+            for chunk in response.iter_content(chunk_size=FetchConfig.CHUNK_SIZE):
+                received += len(chunk)
+                if received > FetchConfig.MAX_BYTES:
+                    raise create_too_large_error()
+                if deadline.remaining_seconds() <= 0:
+                    raise create_timed_out_error()
+                chunks.append(chunk)
+            content = b"".join(chunks)
+            html = content.decode(detect_encoding(response, content), errors="replace")
+            return {"html": html, "notModified": False, **validators}
+    except URLFetchError:
+        raise
+    except requests.Timeout:
+        raise create_timed_out_error()
+    except requests.HTTPError as e:
+        raise URLFetchError(
+            f"ページの取得に失敗しました（HTTP {e.response.status_code}）",
+            FetchErrorCode.HTTP_ERROR,
+            HttpStatus.BAD_REQUEST
+        )
+    except LookupError as e:
+        raise URLFetchError(f"ページの文字コードを判定できませんでした: {str(e)}", FetchErrorCode.NOT_HTML, HttpStatus.UNSUPPORTED_MEDIA_TYPE)
+    except requests.RequestException as e:
+        raise URLFetchError(f"ページの取得に失敗しました: {str(e)}", FetchErrorCode.NETWORK_ERROR, HttpStatus.BAD_REQUEST)
+
+def create_soup(html: str) -> BeautifulSoup:
+    """
+    HTMLをパースする（設定されたパーサーが使えない場合はhtml.parserを使う）
+    
+    Args:
+        html (str): HTML
+    
+    Returns:
+        BeautifulSoup: パース結果
+    """
+    try:
+        return BeautifulSoup(html, ExtractConfig.PARSER)
+    except Exception:
+        return BeautifulSoup(html, "html.parser")
+
+def normalize_text(text: str) -> str:
+    """
+    抽出したテキストの空白を整理する
+    
+    Args:
+        text (str): 抽出したテキスト
+    
+    Returns:
+        str: 整理したテキスト
+    """
+    # 行に分割して前後の空白を削除
+    lines = (line.strip() for line in text.splitlines())
+
+    # 複数行の見出しを1行ずつに分割
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+
+    # 空行を削除して結合
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+def get_hint_weight(element: Tag) -> float:
+    """
+    class/id名から本文らしさの重みを求める
+    
+    Args:
+        element (Tag): 対象の要素
+    
+    Returns:
+        float: 重み（本文らしい場合は正、ナビゲーションなどらしい場合は負）
+    """
+    hints = " ".join([element.get("id") or "", *(element.get("class") or [])])
+    if not hints.strip():
+        return 0
+    weight = 0.0
+    if NEGATIVE_HINT_PATTERN.search(hints):
+        weight -= 25
+    if POSITIVE_HINT_PATTERN.search(hints):
+        weight += 25
+    return weight
+
+def get_link_density(element: Tag) -> float:
+    """
+    要素内のテキストに占めるリンクテキストの割合を求める
+    
+    Args:
+        element (Tag): 対象の要素
+    
+    Returns:
+        float: リンク密度（0〜1）
+    """
+    text_length = len(element.get_text(strip=True))
+    if text_length == 0:
+        return 1.0
+    link_length = sum(len(link.get_text(strip=True)) for link in element.find_all("a"))
+    return min(1.0, link_length / text_length)
+
+def find_site_content(soup: BeautifulSoup, url: str) -> Optional[Tag]:
+    """
+    ブログプラットフォームごとのルールで本文要素を探す
+    
+    Args:
+        soup (BeautifulSoup): パース結果
+        url (str): ページのURL
+    
+    Returns:
+        Optional[Tag]: 本文要素。対象外のサイトか見つからない場合はNone
+    """
+    host = (urlparse(url).hostname or "").lower()
+    for domain, selectors in SITE_SELECTORS.items():
+        if host == domain or host.endswith(f".{domain}"):
+            for selector in selectors:
+                element = soup.select_one(selector)
+                if element is not None and element.get_text(strip=True):
+                    return element
+    return None
+
+def find_main_content(soup: BeautifulSoup) -> Optional[Tag]:
+    """
+    テキスト密度とリンク密度から本文要素を推定する（Readability方式）
+    
+    段落ごとの点数を親要素（と祖父要素に半分）へ加算し、class/id名とリンク密度で補正して最も点数の高い要素を選ぶ
+    
+    Args:
+        soup (BeautifulSoup): パース結果
+    
+    Returns:
+        Optional[Tag]: 本文要素。候補が無い場合はNone
+    """
+    scores: Dict[int, float] = {}
+    candidates: Dict[int, Tag] = {}
+
+    def add_score(element: Optional[Tag], score: float) -> None:
+        if element is None or not isinstance(element, Tag) or element.name in ("html", "[document]"):
+            return
+        key = id(element)
+        if key not in candidates:
+            candidates[key] = element
+            scores[key] = get_hint_weight(element)
+        scores[key] += score
+
+    for paragraph in soup.find_all(PARAGRAPH_TAGS):
+        text = paragraph.get_text(" ", strip=True)
+        if len(text) < ExtractConfig.MIN_PARAGRAPH_CHARS:
+            continue
+        score = 1 + text.count("、") + text.count(",") + text.count("。") + min(len(text) / 100, 3)
+        parent = paragraph.parent
+        add_score(parent, score)
+        add_score(parent.parent if parent is not None else None, score / 2)
+
+    if not candidates:
+        return None
+    best_key = max(candidates, key=lambda key: scores[key] * (1 - get_link_density(candidates[key])))
+    return candidates[best_key]
+
+def extract_text_from_html(html: str, url: str, mode: str = ExtractMode.FULL) -> ExtractionResult:
+    """
+    HTMLからテキストを抽出する
+    
+    Args:
+        html (str): HTML
+        url (str): ページのURL（サイトごとのルールの判定に使う）
+        mode (str): 抽出モード（ExtractModeのいずれか）
+    
+    Returns:
+        ExtractionResult: 抽出結果
+    """
+    soup = create_soup(html)
+
+    # scriptとstyleを削除
+    for element in soup(TEXTLESS_TAGS):
+        element.decompose()
+
+    full_text = normalize_text(soup.get_text())
+    if mode != ExtractMode.MAIN:
+        return {"text": full_text, "extractMode": ExtractMode.FULL, "originalChars": len(full_text), "removedChars": 0}
+
+    for element in soup(NOISE_TAGS):
+        element.decompose()
+    # 検索ボックスやコメント欄などの短いフォームだけを削除する
+    # （ASP.NET WebFormsのサイトなど、ページ全体をformで囲むページの本文は残す）
+    for element in soup("form"):
+        if len(element.get_text(strip=True)) < ExtractConfig.MIN_MAIN_CHARS:
+            element.decompose()
+
+    content = find_site_content(soup, url)
+    if content is None:
+        for element in soup(BOILERPLATE_TAGS):
+            element.decompose()
+        content = find_main_content(soup)
+
+    main_text = normalize_text(content.get_text()) if content is not None else ""
+    if len(main_text) < ExtractConfig.MIN_MAIN_CHARS:
+        # 本文を特定できなかった場合は全文を返す
+        return {"text": full_text, "extractMode": ExtractMode.FULL, "originalChars": len(full_text), "removedChars": 0}
+
+    # 本文要素の外にあることが多いタイトルを先頭に付ける
+    title = soup.title.get_text(strip=True) if soup.title else ""
+    text = f"{title} {main_text}" if title and title not in main_text else main_text
+    return {
+        "text": text,
+        "extractMode": ExtractMode.MAIN,
+        "originalChars": len(full_text),
+        "removedChars": max(0, len(full_text) - len(text))
+    }
+
+# URLごとのETag/Last-Modifiedと抽出済みテキストのキャッシュ
+_url_cache = create_store(URLCacheConfig.BACKEND, URLCacheConfig.MAX_ENTRIES, URLCacheConfig.MAX_BYTES)
+# HTMLのパースは文書サイズの数倍のメモリを使うため、コンテナ内で同時にパースする数を制限する
+_parse_semaphore = threading.Semaphore(max(1, ExtractConfig.MAX_CONCURRENT_PARSES))
+
+def acquire_within(semaphore: threading.Semaphore, deadline: Deadline) -> None:
+    """
+    期限までにセマフォを獲得する
+    
+    Args:
+        semaphore (threading.Semaphore): 獲得するセマフォ
+        deadline (Deadline): 期限
+    
+    Raises:
+        URLFetchError: 期限までに獲得できなかった場合
+    """
+    remaining = deadline.remaining_seconds()
+    if remaining <= 0 or not semaphore.acquire(timeout=None if remaining == math.inf else remaining):
+        raise create_timed_out_error()
+
+def extract_text_from_url(
+    url: str,
+    mode: str = ExtractMode.FULL,
+    deadline: Optional[Deadline] = None
+) -> tuple[ExtractionResult, str]:
     """
     URLからテキストを抽出する
     
+    有効期間内のキャッシュはそのまま返し、期間を過ぎたものは条件付きGETで再検証して304ならパースを省略する
+    
     Args:
         url (str): 処理対象のURL
+        mode (str): 抽出モード（ExtractModeのいずれか）
+        deadline (Optional[Deadline]): 取得とパースの期限
     
     Returns:
-        str: 抽出されたテキスト
+        tuple[ExtractionResult, str]: 抽出結果とキャッシュの利用状況（CacheStatusのいずれか）
     
     Raises:
         URLProcessError: URLの処理に失敗した場合
     """
+    cache_key = f"url:{mode}:{url}"
+    deadline = deadline or Deadline()
     try:
-        # URLからコンテンツを取得
-        response = requests.get(url)
-        response.raise_for_status()
-        
-        # HTMLをパースしてテキストを抽出
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
-        # scriptとstyle要素を削除
-        for script in soup(["script", "style"]):
-            script.decompose()
-            
-        # テキストコンテンツを取得
-        text = soup.get_text()
-        
-        # 行に分割して前後の空白を削除
-        lines = (line.strip() for line in text.splitlines())
+        cached = _url_cache.get(cache_key)
+        if cached is not None and time.time() - cached["fetchedAt"] < URLCacheConfig.FRESH_SECONDS:
+            return cached["result"], CacheStatus.HIT
 
-        # 複数行の見出しを1行ずつに分割
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+        # URLからコンテンツを取得（キャッシュがあれば条件付きGET）
+        with metrics.span("Fetch"):
+            page = fetch_page(
+                url,
+                cached["etag"] if cached else None,
+                cached["lastModified"] if cached else None,
+                deadline
+            )
+        if page["notModified"] and cached is not None:
+            result = cached["result"]
+            status = CacheStatus.REVALIDATED
+        else:
+            # HTMLをパースしてテキストを抽出
+            acquire_within(_parse_semaphore, deadline)
+            try:
+                with metrics.span("Extract"):
+                    result = extract_text_from_html(page["html"] or "", url, mode)
+            finally:
+                _parse_semaphore.release()
+            status = CacheStatus.MISS
 
-        # 空行を削除して結合
-        return ' '.join(chunk for chunk in chunks if chunk)
+        _url_cache.set(cache_key, {
+            "result": result,
+            "etag": page["etag"],
+            "lastModified": page["lastModified"],
+            "fetchedAt": time.time()
+        }, URLCacheConfig.TTL_SECONDS)
+        return result, status
             
+    except URLFetchError:
+        raise
     except Exception as e:
         raise URLProcessError(f"URLからのテキスト抽出に失敗しました: {str(e)}")
 
+def get_host_semaphore(semaphores: Dict[str, threading.Semaphore], lock: threading.Lock, url: str) -> threading.Semaphore:
+    """
+    ホストごとの同時接続数を制限するセマフォを取得する
+    
+    Args:
+        semaphores (Dict[str, threading.Semaphore]): ホスト名ごとのセマフォ
+        lock (threading.Lock): semaphoresを更新するためのロック
+        url (str): 取得対象のURL
+    
+    Returns:
+        threading.Semaphore: ホストのセマフォ
+    """
+    host = urlparse(url).netloc.lower()
+    with lock:
+        if host not in semaphores:
+            semaphores[host] = threading.Semaphore(BatchConfig.PER_HOST_CONCURRENCY)
+        return semaphores[host]
+
+def load_url_item(
+    url: str,
+    mode: str,
+    semaphore: threading.Semaphore,
+    deadline: Optional[Deadline] = None
+) -> BatchItemResult:
+    """
+    一括読み込みの1件分を処理する（エラーは例外にせず結果に含める）
+    
+    Args:
+        url (str): 処理対象のURL
+        mode (str): 抽出モード（ExtractModeのいずれか）
+        semaphore (threading.Semaphore): ホストごとの同時接続数のセマフォ
+        deadline (Optional[Deadline]): 1件分の処理の期限
+    
+    Returns:
+        BatchItemResult: URLごとの結果
+    """
+    deadline = deadline or Deadline()
+    try:
+        acquire_within(semaphore, deadline)
+        try:
+            result, cache_status = extract_text_from_url(url, mode, deadline)
+        finally:
+            semaphore.release()
+        return {
+            "url": url,
+            "ok": True,
+            "message": result["text"],
+            "extractMode": result["extractMode"],
+            "originalChars": result["originalChars"],
+            "removedChars": result["removedChars"],
+            "cacheStatus": cache_status
+        }
+    except URLFetchError as e:
+        print("URLFetchError:", url, e.code, str(e))
+        return {"url": url, "ok": False, "message": str(e), "errorCode": e.code}
+    except Exception as e:
+        print("URLProcessError:", url, str(e))
+        return {"url": url, "ok": False, "message": str(e)}
+
+def create_timed_out_item(url: str) -> BatchItemResult:
+    """
+    期限までに処理が終わらなかったURLの結果を生成する
+    
+    Args:
+        url (str): 処理対象のURL
+    
+    Returns:
+        BatchItemResult: URLごとの結果
+    """
+    error = create_timed_out_error()
+    return {"url": url, "ok": False, "message": str(error), "errorCode": error.code}
+
+def load_urls(urls: List[str], mode: str, deadline: Optional[Deadline] = None) -> List[BatchItemResult]:
+    """
+    複数のURLを並列に取得してテキストを抽出する
+    
+    全体の処理時間が最も遅い1件の取得時間に近くなるよう、スレッドプールで同時に取得する。
+    同じホストへの同時接続数はBatchConfig.PER_HOST_CONCURRENCYまでに制限する。
+    期限（からBatchConfig.RESPONSE_MARGIN_SECONDSを引いた時刻）までに終わらなかったURLは
+    タイムアウトとして結果に含め、終わった分だけを返す
+    
+    Args:
+        urls (List[str]): 処理対象のURL
+        mode (str): 抽出モード（ExtractModeのいずれか）
+        deadline (Optional[Deadline]): 呼び出し全体の期限
+    
+    Returns:
+        List[BatchItemResult]: 入力と同じ順序のURLごとの結果
+    """
+    item_deadline = (deadline or Deadline()).with_margin(BatchConfig.RESPONSE_MARGIN_SECONDS)
+    semaphores: Dict[str, threading.Semaphore] = {}
+    lock = threading.Lock()
+    executor = ThreadPoolExecutor(max_workers=max(1, min(BatchConfig.MAX_WORKERS, len(urls))))
+    try:
+        futures = [
+            executor.submit(load_url_item, url, mode, get_host_semaphore(semaphores, lock, url), item_deadline)
+            for url in urls
+        ]
+        remaining = item_deadline.remaining_seconds()
+        done, _ = wait(futures, timeout=None if remaining == math.inf else max(0.0, remaining))
+        return [
+            future.result() if future in done else create_timed_out_item(url)
+            for url, future in zip(urls, futures)
+        ]
+    finally:
+        # 期限を過ぎた取得は待たずにレスポンスを返す（実行中の取得は各自の期限で打ち切られる）
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def combine_documents(results: List[BatchItemResult]) -> str:
+    """
+    読み込みに成功した記事を評価用の1つのドキュメントに結合する
+    
+    Args:
+        results (List[BatchItemResult]): URLごとの結果
+    
+    Returns:
+        str: 結合したドキュメント
+    """
+    return BatchConfig.DOCUMENT_SEPARATOR.join(
+        f"# {result['url']}\n\n{result['message']}"
+        for result in results
+        if result["ok"] and result["message"].strip()
+    )
+
+def get_extract_mode(body: Dict[str, Any]) -> str:
+    """
+    リクエストボディから抽出モードを取得する（未指定の場合はExtractConfig.DEFAULT_MODE）
+    
+    Args:
+        body (Dict[str, Any]): リクエストボディ
+    
+    Returns:
+        str: 抽出モード（ExtractModeのいずれか）
+    
+    Raises:
+        URLProcessError: 抽出モードの指定が正しくない場合
+    """
+    mode = body.get("extractMode") or ExtractConfig.DEFAULT_MODE
+    if mode not in (ExtractMode.FULL, ExtractMode.MAIN):
+        raise URLProcessError(f"extractModeは {ExtractMode.FULL} か {ExtractMode.MAIN} を指定してください")
+    return mode
+
+def handle_batch(body: Dict[str, Any], deadline: Optional[Deadline] = None) -> LambdaResponse:
+    """
+    複数URLの一括読み込みリクエストを処理する
+    
+    Args:
+        body (Dict[str, Any]): リクエストボディ（urls, extractMode, combine）
+        deadline (Optional[Deadline]): 呼び出し全体の期限
+    
+    Returns:
+        LambdaResponse: Lambda関数のレスポンス
+    """
+    urls = body.get("urls")
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url for url in urls):
+        return create_response(HttpStatus.BAD_REQUEST, {
+            "message": "URLのリストが正しく入力されていないようです🤔"
+        })
+    # 重複を除いて入力順を保つ
+    urls = list(dict.fromkeys(urls))
+    if len(urls) > BatchConfig.MAX_URLS:
+        return create_response(HttpStatus.BAD_REQUEST, {
+            "message": f"一度に読み込めるURLは{BatchConfig.MAX_URLS}件までです"
+        })
+
+    mode = get_extract_mode(body)
+    results = load_urls(urls, mode, deadline)
+    succeeded = sum(1 for result in results if result["ok"])
+    timed_out = sum(1 for result in results if result.get("errorCode") == FetchErrorCode.TIMED_OUT)
+    metrics.put("UrlCount", len(urls))
+    metrics.put("FailedUrlCount", len(results) - succeeded)
+    metrics.put("TimedOutUrlCount", timed_out)
+
+    response_body: Dict[str, Any] = {
+        "message": f"{len(results)}件中{succeeded}件のURLを読み込みました",
+        "results": results,
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "timedOut": timed_out
+    }
+    if body.get("combine"):
+        response_body["combined"] = combine_documents(results)
+    return create_response(HttpStatus.OK, response_body)
+
+@metrics.instrument_handler("load_url")
 def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
     """
     Lambda関数のメインハンドラー
@@ -101,20 +832,42 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
 
     try:
         # URLを取得
-        body = json.loads(event.get("body", "{}"))
+        raw_body = event.get("body") or "{}"
+        metrics.put("RequestBytes", len(raw_body.encode("utf-8")), metrics.MetricUnit.BYTES)
+        body = json.loads(raw_body)
+        if "urls" in body:
+            # 複数URLの一括読み込み
+            return handle_batch(body, Deadline.from_context(context))
+
         url = body.get('url')
         if not url:
             return create_response(HttpStatus.BAD_REQUEST, {
                 "message": "URLが入力されていないようです🤔"
             })
         
-        # テキスト抽出
-        extracted_text = extract_text_from_url(url)
+        # テキスト抽出（extractMode: main=本文のみ / full=ページ全体）
+        mode = get_extract_mode(body)
+        result, cache_status = extract_text_from_url(url, mode, Deadline.from_context(context))
+        extracted_text = result["text"]
+        metrics.put("OriginalChars", result["originalChars"])
+        metrics.put("OutputChars", len(extracted_text))
+        metrics.set_property("cacheStatus", cache_status)
+        metrics.set_property("extractMode", result["extractMode"])
         
         return create_response(HttpStatus.OK, {
-            "message": extracted_text if extracted_text.strip() else "テキストを抽出できませんでした。URLを確認してください。"
+            "message": extracted_text if extracted_text.strip() else "テキストを抽出できませんでした。URLを確認してください。",
+            "extractMode": result["extractMode"],
+            "originalChars": result["originalChars"],
+            "removedChars": result["removedChars"],
+            "cacheStatus": cache_status
         })
 
+    except URLFetchError as e:
+        print("URLFetchError:", e.code, str(e))
+        return create_response(e.status_code, {
+            "message": str(e),
+            "errorCode": e.code
+        })
     except URLProcessError as e:
         print("URLProcessError:", str(e))
         return create_response(HttpStatus.BAD_REQUEST, {
@@ -1,36 +1,25 @@
+from __future__ import annotations
+
 import json
+import math
 import os
-import requests
 from typing import Dict, Any, Optional, TypedDict, List
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-from langchain_aws import ChatBedrockConverse
-from langfuse import Langfuse
-from langfuse.callback import CallbackHandler
-
+from utils import metrics
+from utils.invocation import Deadline
+from utils.llm import BedrockThrottlingError, LangfuseError, record_trace_metadata, setup_langfuse
+from utils.llm_usage import put_usage_metrics
+from utils.secrets import SecretError, get_secrets
+from utils.telemetry import get_flusher
+from utils.tokens import InputTooLargeError
+from utils.tweet import TweetGenerationError, generate_tweet
+
+# langchain・langfuseなどの重い依存は、共通モジュール（utils.llm・utils.tweet）の関数の中でimportする
 # カスタム例外クラス
 class EnvironmentError(Exception):
     """環境変数関連のエラー"""
     pass
 
-class SecretError(Exception):
-    """シークレット取得関連のエラー"""
-    pass
-
-class LangfuseError(Exception):
-    """Langfuse関連のエラー"""
-    pass
-
-class TweetGenerationError(Exception):
-    """ツイート生成関連のエラー"""
-    pass
-
 # 型定義
-class SecretConfig(TypedDict):
-    """シークレット設定の型定義"""
-    LANGFUSE_SECRET_KEY: str
-    LANGFUSE_PUBLIC_KEY: str
-
 class LambdaResponse(TypedDict):
     """Lambda関数のレスポンス型定義"""
     statusCode: int
@@ -41,18 +30,10 @@ class HttpStatus:
     """HTTPステータスコード定数"""
     OK = 200
     BAD_REQUEST = 400
+    PAYLOAD_TOO_LARGE = 413
+    TOO_MANY_REQUESTS = 429
     SERVER_ERROR = 500
 
-class LangfuseConfig:
-    """Langfuse関連の設定定数"""
-    PROMPT_NAME = "tweet_generation"
-    RUN_NAME = "Tweet Generation"
-    REQUIRED_KEYS = ["LANGFUSE_SECRET_KEY", "LANGFUSE_PUBLIC_KEY"]
-
-class BedrockConfig:
-    """Bedrock関連の設定定数"""
-    MAX_TOKENS = 4096
-
 # 環境変数定義
 REQUIRED_ENV_VARS: List[str] = [
     "LANGFUSE_SECRET_NAME",
@@ -72,13 +53,18 @@ def validate_environment() -> None:
     if missing_vars:
         raise EnvironmentError(f"必要な環境変数が設定されていません: {', '.join(missing_vars)}")
 
-def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse:
+def create_response(
+    status_code: int,
+    message: Dict[str, Any],
+    headers: Optional[Dict[str, str]] = None
+) -> LambdaResponse:
     """
     レスポンスを生成する
     
     Args:
         status_code (int): HTTPステータスコード
         message (Dict[str, Any]): レスポンスメッセージ
+        headers (Optional[Dict[str, str]]): 追加のレスポンスヘッダー
     
     Returns:
         LambdaResponse: Lambda関数のレスポンス
@@ -89,126 +75,33 @@ def create_response(status_code: int, message: Dict[str, Any]) -> LambdaResponse
             "Access-Control-Allow-Origin": "*",
             "Access-Control-Allow-Headers": "Content-Type,Authorization",
             "Access-Control-Allow-Methods": "OPTIONS,POST",
-            "Access-Control-Allow-Credentials": "true"
+            "Access-Control-Allow-Credentials": "true",
+            **(headers or {})
         },
         "body": json.dumps(message)
     }
 
-def get_secrets() -> SecretConfig:
-    """
-    AWS Secrets Managerから設定を取得する
-    
-    Returns:
-        SecretConfig: シークレット設定
-    
-    Raises:
-        SecretError: シークレット取得に失敗した場合
-    """
-    try:
-        headers = {"X-Aws-Parameters-Secrets-Token": os.environ.get('AWS_SESSION_TOKEN')}
-        secrets_extension_endpoint = f"http://localhost:2773/secretsmanager/get?secretId={os.environ['LANGFUSE_SECRET_NAME']}"
-        secrets_response = requests.get(secrets_extension_endpoint, headers=headers)
-        
-        if secrets_response.status_code != HttpStatus.OK:
-            raise SecretError(f"シークレット取得APIが失敗しました。: {secrets_response.status_code} （再実行してみてください🙏）")
-            
-        secret = json.loads(secrets_response.text)["SecretString"]
-        
-        if isinstance(secret, str):
-            secret = json.loads(secret)
-            
-        if not all(key in secret for key in LangfuseConfig.REQUIRED_KEYS):
-            raise SecretError("必要なシークレットキーが見つかりません")
-            
-        return secret
-    except requests.RequestException as e:
-        raise SecretError(f"シークレット取得時にネットワークエラーが発生しました: {str(e)}")
-    except json.JSONDecodeError as e:
-        raise SecretError(f"シークレットのJSONパースに失敗しました: {str(e)}")
-    except SecretError:
-        raise
-    except Exception as e:
-        raise SecretError(f"シークレットの取得に失敗しました: {str(e)}")
-
-def setup_langfuse(
-    secret: SecretConfig,
-    user_email: Optional[str],
-    langfuse_session_id: Optional[str]
-) -> tuple[CallbackHandler, Langfuse]:
-    """
-    Langfuseの設定をセットアップする
-    
-    Args:
-        secret (SecretConfig): シークレット設定
-        user_email (Optional[str]): ユーザーメールアドレス
-        langfuse_session_id (Optional[str]): セッションID
-    
-    Returns:
-        tuple[CallbackHandler, Langfuse]: LangfuseハンドラーとLangfuseインスタンスのタプル
-    
-    Raises:
-        LangfuseError: Langfuseの設定に失敗した場合
-    """
-    try:
-        # Langfuseインスタンスを認証情報付きで初期化
-        langfuse = Langfuse(
-            public_key=secret["LANGFUSE_PUBLIC_KEY"],
-            secret_key=secret["LANGFUSE_SECRET_KEY"],
-            host=os.environ["LANGFUSE_HOST"]
-        )
-        langfuse_handler = CallbackHandler(
-            secret_key=secret["LANGFUSE_SECRET_KEY"],
-            public_key=secret["LANGFUSE_PUBLIC_KEY"],
-            host=os.environ["LANGFUSE_HOST"],
-            user_id=user_email,
-            session_id=langfuse_session_id
-        )
-        return langfuse_handler, langfuse
-    except Exception as e:
-        raise LangfuseError(f"Langfuseの設定に失敗しました: {str(e)}")
-
-def generate_tweet(
-    langfuse: Langfuse,
-    eval_result: str,
-    langfuse_handler: CallbackHandler
-) -> str:
+def create_throttled_response(e: BedrockThrottlingError) -> LambdaResponse:
     """
-    評価結果からツイート文言を生成する
+    スロットリング時のレスポンス（429 + Retry-After）を生成する
     
     Args:
-        langfuse (Langfuse): Langfuseインスタンス
-        eval_result (str): 評価結果
-        langfuse_handler (CallbackHandler): Langfuseハンドラー
+        e (BedrockThrottlingError): スロットリングエラー
     
     Returns:
-        str: 生成されたツイート文言
-    
-    Raises:
-        TweetGenerationError: ツイート生成に失敗した場合
+        LambdaResponse: Lambda関数のレスポンス
     """
-    try:
-        llm = ChatBedrockConverse(
-            model=os.environ["BEDROCK_INFERENCE_PROFILE_ARN"],
-            max_tokens=BedrockConfig.MAX_TOKENS,
-        )
-        
-        prompt_template = langfuse.get_prompt(LangfuseConfig.PROMPT_NAME)
-        prompt = ChatPromptTemplate.from_template(
-            prompt_template.get_langchain_prompt(),
-            metadata={"langfuse_prompt": prompt_template},
-        )
+    return create_response(
+        HttpStatus.TOO_MANY_REQUESTS,
+        {"message": f"エラーが発生しました: {str(e)}"},
+        {"Retry-After": str(math.ceil(e.retry_after))}
+    )
 
-        chain = prompt | llm | StrOutputParser()
-        return chain.invoke(
-            input={"eval_result": eval_result},
-            config={
-                "run_name": LangfuseConfig.RUN_NAME,
-                "callbacks": [langfuse_handler]
-            }
-        )
-    except Exception as e:
-        raise TweetGenerationError(f"ツイート生成に失敗しました: {str(e)}")
+# Langfuseへの送信はレスポンス返却後に行う（TELEMETRY_MODE=sync で従来どおり同期送信）
+_telemetry = get_flusher()
 
+@metrics.instrument_handler("tweet")
+@_telemetry.wrap_handler
 def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
     """
     Lambda関数のメインハンドラー
@@ -229,31 +122,57 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> LambdaResponse:
         validate_environment()
         
         # 入力チェック
-        body = json.loads(event.get("body", "{}"))
+        raw_body = event.get("body") or "{}"
+        metrics.put("RequestBytes", len(raw_body.encode("utf-8")), metrics.MetricUnit.BYTES)
+        body = json.loads(raw_body)
         eval_result = body.get("evalResult")
         if not eval_result:
             return create_response(HttpStatus.BAD_REQUEST, {
                 "message": "アウトプットの内容が入力されていないようです🤔"
             })
+        metrics.put("InputChars", len(eval_result))
 
         # シークレット取得
         secret = get_secrets()
         
         # Langfuseセットアップ
-        langfuse_handler, langfuse = setup_langfuse(
-            secret,
-            body.get("userEmail"),
-            body.get("langfuseSessionId")
-        )
+        with metrics.span("SetupLangfuse"):
+            langfuse_handler, langfuse = setup_langfuse(
+                secret,
+                body.get("userEmail"),
+                body.get("langfuseSessionId")
+            )
         
         # ツイート生成
-        output = generate_tweet(langfuse, eval_result, langfuse_handler)
-        langfuse_handler.flush()
+        result = generate_tweet(langfuse, eval_result, langfuse_handler, Deadline.from_context(context))
+        metrics.put("OutputChars", len(result["output"]))
+        metrics.set_property("trimmed", result["trimmed"])
+        put_usage_metrics(result["usage"])
+        trace_id = langfuse_handler.get_trace_id()
+        metrics.set_property("traceId", trace_id)
+        # テレメトリの失敗ではリクエストを失敗させない（送信の失敗もログに出すだけ）
+        _telemetry.submit(langfuse_handler.flush)
+        if record_trace_metadata(
+            langfuse,
+            trace_id,
+            {"bedrockUsage": result["usage"], "modelRoutes": [result["route"]]}
+        ):
+            _telemetry.submit(langfuse.flush)
         
         return create_response(HttpStatus.OK, {
-            "message": output
+            "message": result["output"],
+            "promptVersion": result["promptVersion"],
+            "inputTokens": result["inputTokens"],
+            "keptRatio": result["keptRatio"],
+            "trimmed": result["trimmed"]
         })
 
+    except InputTooLargeError as e:
+        return create_response(HttpStatus.PAYLOAD_TOO_LARGE, {
+            "message": str(e)
+        })
+    except BedrockThrottlingError as e:
+        return create_throttled_response(e)
     except (EnvironmentError, SecretError, LangfuseError, TweetGenerationError) as e:
         error_message = str(e)
         return create_response(HttpStatus.SERVER_ERROR, {
@@ -1,33 +1,295 @@
-import boto3
-import json
+import math
 import os
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, TypedDict, Union
 
-def get_bedrock_client():
-    """Bedrockクライアントを取得する"""
-    session = boto3.Session()
-    bedrock = session.client(
-        service_name='bedrock-runtime',
-        region_name='us-east-1'
+from utils.llm_usage import empty_usage
+
+# boto3 / botocore / asyncio は、OPTIONSやバリデーションエラーの早期リターンで読み込まないよう
+# 使う関数の中でimportする（コールドスタート短縮のため）
+
+
+class BedrockClientConfig:
+    """Bedrockクライアント関連の設定定数"""
+    # リージョンの指定も環境変数もない場合のリージョン
+    DEFAULT_REGION = "us-east-1"
+    # 1つのクライアントで同時に使うHTTP接続数の上限（チャンクの並列評価の並列数以上にする）
+    MAX_POOL_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_POOL_CONNECTIONS", "16"))
+    CONNECT_TIMEOUT_SECONDS = float(os.environ.get("BEDROCK_CONNECT_TIMEOUT_SECONDS", "3"))
+    # 読み込みのタイムアウトの上限（Lambdaの残り実行時間がわからないローカル実行などではこの値を使う）
+    READ_TIMEOUT_SECONDS = float(os.environ.get("BEDROCK_READ_TIMEOUT_SECONDS", "120"))
+    # Lambdaの残り実行時間から、エラーのレスポンスを返すために残す時間
+    READ_TIMEOUT_MARGIN_SECONDS = 2.0
+    # 残り実行時間から決めるタイムアウトの刻み（刻みごとにクライアントを作るため細かくしない）
+    READ_TIMEOUT_STEP_SECONDS = 5.0
+    # リトライは呼び出し側（invoke_with_retry）で行うため、boto3側のリトライは既定で無効にする
+    MAX_ATTEMPTS = 1
+    # asyncioで同時に呼び出す数の上限
+    MAX_CONCURRENCY = int(os.environ.get("BEDROCK_MAX_CONCURRENCY", "4"))
+
+
+class ConverseResult(TypedDict):
+    """Converse APIの呼び出し結果の型定義"""
+    text: str
+    stopReason: Optional[str]
+    # トークン使用量（llm_usage.empty_usageの形式）
+    usage: Dict[str, int]
+    latencyMs: int
+
+
+def get_region(region_name: Optional[str] = None, model_id: Optional[str] = None) -> str:
+    """
+    呼び出すリージョンを決める
+
+    指定がなければ、モデルIDが推論プロファイルなどのARNの場合はARNのリージョン、
+    それ以外はLambdaの実行リージョン（AWS_REGION）を使う
+
+    Args:
+        region_name (Optional[str]): リージョン
+        model_id (Optional[str]): モデルID（推論プロファイルのARN）
+
+    Returns:
+        str: リージョン
+    """
+    if region_name:
+        return region_name
+    if model_id and model_id.startswith("arn:"):
+        parts = model_id.split(":")
+        if len(parts) > 3 and parts[3]:
+            return parts[3]
+    return os.environ.get("AWS_REGION") or os.environ.get("AWS_DEFAULT_REGION") or BedrockClientConfig.DEFAULT_REGION
+
+
+def get_read_timeout(remaining_seconds: float) -> float:
+    """
+    Lambdaの残り実行時間から、Bedrockの応答を待つ読み込みのタイムアウトを決める
+
+    Lambdaがタイムアウトで強制終了される前に呼び出しを打ち切り、エラーのレスポンスを返せるようにする。
+    タイムアウトごとにクライアントを作るため、READ_TIMEOUT_STEP_SECONDS 刻みに切り捨てる
+
+    Args:
+        remaining_seconds (float): Lambdaの残り実行時間（秒。期限がない場合は無限大）
+
+    Returns:
+        float: 読み込みのタイムアウト（秒）
+    """
+    available = remaining_seconds - BedrockClientConfig.READ_TIMEOUT_MARGIN_SECONDS
+    if available >= BedrockClientConfig.READ_TIMEOUT_SECONDS:
+        return BedrockClientConfig.READ_TIMEOUT_SECONDS
+    step = BedrockClientConfig.READ_TIMEOUT_STEP_SECONDS
+    return max(step, math.floor(available / step) * step)
+
+
+@lru_cache(maxsize=16)
+def _create_client(service_name: str, region_name: str, max_attempts: int, read_timeout: float) -> Any:
+    import boto3
+    from botocore.config import Config
+    # クライアントの生成はスレッドセーフではない既定のセッションを避け、専用のセッションで行う
+    return boto3.session.Session().client(
+        service_name,
+        region_name=region_name,
+        config=Config(
+            max_pool_connections=BedrockClientConfig.MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=BedrockClientConfig.CONNECT_TIMEOUT_SECONDS,
+            read_timeout=read_timeout,
+            retries={"mode": "standard", "total_max_attempts": max_attempts}
+        )
     )
-    return bedrock
-
-def invoke_model(prompt, model_id="anthropic.claude-v2"):
-    """Bedrockモデルを呼び出す"""
-    bedrock = get_bedrock_client()
-    
-    body = json.dumps({
-        "prompt": prompt,
-        "max_tokens_to_sample": 2000,
-        "temperature": 0,
-        "top_p": 1,
-    })
-
-    response = bedrock.invoke_model(
-        body=body,
-        modelId=model_id,
-        accept='application/json',
-        contentType='application/json'
+
+
+def get_bedrock_client(
+    region_name: Optional[str] = None,
+    max_attempts: int = BedrockClientConfig.MAX_ATTEMPTS,
+    read_timeout: float = BedrockClientConfig.READ_TIMEOUT_SECONDS
+) -> Any:
+    """
+    Bedrock Runtimeのクライアントを取得する（リージョンと設定ごとにウォームコンテナ間で使い回す）
+
+    接続プールとTCPキープアライブを有効にしたクライアントを返すため、呼び出しごとの
+    クライアント生成やTLSハンドシェイクが発生しない
+
+    Args:
+        region_name (Optional[str]): リージョン（省略時はget_regionで決める）
+        max_attempts (int): boto3側の試行回数（1はリトライなし）
+        read_timeout (float): 読み込みのタイムアウト（秒）
+
+    Returns:
+        Any: bedrock-runtimeのクライアント
+    """
+    return _create_client("bedrock-runtime", get_region(region_name), max_attempts, read_timeout)
+
+
+def get_bedrock_control_client(region_name: Optional[str] = None) -> Any:
+    """
+    Bedrock（コントロールプレーン）のクライアントを取得する（推論プロファイルの参照などに使う）
+
+    Args:
+        region_name (Optional[str]): リージョン（省略時はget_regionで決める）
+
+    Returns:
+        Any: bedrockのクライアント
+    """
+    return _create_client(
+        "bedrock",
+        get_region(region_name),
+        BedrockClientConfig.MAX_ATTEMPTS,
+        BedrockClientConfig.READ_TIMEOUT_SECONDS
     )
 
-    response_body = json.loads(response.get('body').read())
-    return response_body.get('completion')
+
+# アプリケーション推論プロファイルのARNごとのコピー元のモデルのARN
+_profile_models: Dict[str, str] = {}
+
+
+def resolve_model_name(model_id: str) -> str:
+    """
+    モデルの種類の判定に使う名前を取得する
+
+    モデルIDやシステム定義の推論プロファイルはモデル名を含むためそのまま返す。
+    アプリケーション推論プロファイルはARNからモデルがわからないため、コピー元のモデルのARNを取得する
+    （取得できない場合はそのまま返す）
+
+    Args:
+        model_id (str): モデルID（推論プロファイルのARN）
+
+    Returns:
+        str: モデル名を含む文字列
+    """
+    if ":application-inference-profile/" not in model_id:
+        return model_id
+    if model_id not in _profile_models:
+        try:
+            profile = get_bedrock_control_client(get_region(model_id=model_id)).get_inference_profile(
+                inferenceProfileIdentifier=model_id
+            )
+        except Exception as e:
+            print(f"推論プロファイルのモデルを取得できませんでした: {str(e)}")
+            return model_id
+        models = profile.get("models") or []
+        _profile_models[model_id] = models[0].get("modelArn", model_id) if models else model_id
+    return _profile_models[model_id]
+
+
+def build_converse_request(
+    model_id: str,
+    messages: List[Dict[str, Any]],
+    system: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None
+) -> Dict[str, Any]:
+    """
+    Converse APIのリクエストを組み立てる
+
+    Args:
+        model_id (str): モデルID（推論プロファイルのARN）
+        messages (List[Dict[str, Any]]): メッセージ
+        system (Optional[List[Dict[str, Any]]]): システムプロンプトのブロック
+        max_tokens (Optional[int]): 出力トークン数の上限
+        temperature (Optional[float]): 温度
+
+    Returns:
+        Dict[str, Any]: リクエストのパラメーター
+    """
+    request: Dict[str, Any] = {"modelId": model_id, "messages": messages}
+    if system:
+        request["system"] = system
+    inference_config: Dict[str, Any] = {}
+    if max_tokens is not None:
+        inference_config["maxTokens"] = max_tokens
+    if temperature is not None:
+        inference_config["temperature"] = temperature
+    if inference_config:
+        request["inferenceConfig"] = inference_config
+    return request
+
+
+def to_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Converse APIのusageをトークン使用量の集計値の形式に変換する
+
+    Args:
+        usage (Dict[str, Any]): Converse APIのusage
+
+    Returns:
+        Dict[str, int]: トークン使用量（llm_usage.empty_usageの形式）
+    """
+    result = empty_usage()
+    for key in result:
+        result[key] = usage.get(key, 0)
+    return result
+
+
+def converse(
+    model_id: str,
+    messages: List[Dict[str, Any]],
+    system: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    client: Any = None
+) -> ConverseResult:
+    """
+    Converse APIでモデルを呼び出す
+
+    Args:
+        model_id (str): モデルID（推論プロファイルのARN）
+        messages (List[Dict[str, Any]]): メッセージ
+        system (Optional[List[Dict[str, Any]]]): システムプロンプトのブロック
+        max_tokens (Optional[int]): 出力トークン数の上限
+        temperature (Optional[float]): 温度
+        client (Any): bedrock-runtimeのクライアント（省略時はget_bedrock_clientで取得する）
+
+    Returns:
+        ConverseResult: 生成されたテキスト、停止理由、トークン使用量、モデルの処理時間
+    """
+    client = client or get_bedrock_client(get_region(model_id=model_id))
+    response = client.converse(**build_converse_request(model_id, messages, system, max_tokens, temperature))
+    content = response.get("output", {}).get("message", {}).get("content", [])
+    return {
+        "text": "".join(block.get("text", "") for block in content),
+        "stopReason": response.get("stopReason"),
+        "usage": to_usage(response.get("usage", {})),
+        "latencyMs": response.get("metrics", {}).get("latencyMs", 0)
+    }
+
+
+async def aconverse(**kwargs: Any) -> ConverseResult:
+    """
+    Converse APIをasyncioのイベントループを止めずに呼び出す（boto3の呼び出しはスレッドで実行する）
+
+    Args:
+        **kwargs (Any): converseの引数
+
+    Returns:
+        ConverseResult: 呼び出し結果
+    """
+    import asyncio
+    return await asyncio.to_thread(converse, **kwargs)
+
+
+async def aconverse_many(
+    requests: Sequence[Dict[str, Any]],
+    max_concurrency: int = BedrockClientConfig.MAX_CONCURRENCY,
+    return_exceptions: bool = False
+) -> List[Union[ConverseResult, BaseException]]:
+    """
+    複数のConverse APIの呼び出しを同時実行数を制限して並列に行う
+
+    同じリージョンの呼び出しは1つのクライアントの接続プールを共有する
+
+    Args:
+        requests (Sequence[Dict[str, Any]]): 呼び出しごとのconverseの引数
+        max_concurrency (int): 同時に呼び出す数の上限（接続プールの大きさまで）
+        return_exceptions (bool): Trueの場合は失敗した呼び出しの例外を結果として返し、Falseの場合は送出する
+
+    Returns:
+        List[Union[ConverseResult, BaseException]]: requestsと同じ順番の呼び出し結果
+    """
+    import asyncio
+    semaphore = asyncio.Semaphore(max(1, min(max_concurrency, BedrockClientConfig.MAX_POOL_CONNECTIONS)))
+
+    async def call(request: Dict[str, Any]) -> ConverseResult:
+        async with semaphore:
+            return await aconverse(**request)
+
+    return list(await asyncio.gather(*(call(request) for request in requests), return_exceptions=return_exceptions))
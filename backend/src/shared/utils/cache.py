@@ -0,0 +1,125 @@
+import threading
+import time
+from typing import Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class _CacheEntry(Generic[T]):
+    """キャッシュエントリ"""
+
+    def __init__(self, value: T, loaded_at: float, loader: Callable[[], T]):
+        self.value = value
+        self.loaded_at = loaded_at
+        self.loader = loader
+        self.refreshing = False
+
+
+class RefreshAheadCache(Generic[T]):
+    """
+    ウォームコンテナ内で値を保持するキャッシュ
+
+    - TTLの残りが refresh_ahead_seconds を切るとバックグラウンドで更新する
+    - TTL切れ後も stale_while_revalidate_seconds の間は古い値を返しつつバックグラウンドで更新する
+    - TTL切れ後の再取得に失敗した場合、stale_if_error_seconds の間は最後に取得できた値を返す
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[Hashable], T]],
+        ttl_seconds: float,
+        refresh_ahead_seconds: float = 0,
+        stale_while_revalidate_seconds: float = 0,
+        stale_if_error_seconds: float = 0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self._loader = loader
+        self._ttl = ttl_seconds
+        self._refresh_ahead = min(refresh_ahead_seconds, ttl_seconds)
+        self._stale_while_revalidate = stale_while_revalidate_seconds
+        self._stale_if_error = stale_if_error_seconds
+        self._clock = clock
+        self._entries: Dict[Hashable, _CacheEntry[T]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, loader: Optional[Callable[[], T]] = None) -> T:
+        """
+        キャッシュから値を取得する
+
+        Args:
+            key (Hashable): キャッシュキー
+            loader (Optional[Callable[[], T]]): このキーの値を取得する関数。省略時はコンストラクタのloaderを使う
+
+        Returns:
+            T: キャッシュされた値
+
+        Raises:
+            Exception: 値の取得に失敗し、フォールバックできる値もない場合はloaderの例外をそのまま送出する
+        """
+        if loader is None:
+            if self._loader is None:
+                raise ValueError("loaderが指定されていません")
+            default_loader = self._loader
+            loader = lambda: default_loader(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry is None:
+            return self._load(key, loader)
+
+        # 次回以降のバックグラウンド更新には最新の呼び出し元のloaderを使う
+        entry.loader = loader
+
+        age = self._clock() - entry.loaded_at
+        if age < self._ttl:
+            if age >= self._ttl - self._refresh_ahead:
+                self._refresh_in_background(key, entry)
+            return entry.value
+
+        if age < self._ttl + self._stale_while_revalidate:
+            self._refresh_in_background(key, entry)
+            return entry.value
+
+        try:
+            return self._load(key, loader)
+        except Exception as e:
+            if age < self._ttl + self._stale_if_error:
+                print(f"キャッシュの更新に失敗したため前回の値を使用します: {str(e)}")
+                return entry.value
+            raise
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        キャッシュを破棄する
+
+        Args:
+            key (Optional[Hashable]): 破棄するキー。省略時は全件破棄する
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def _load(self, key: Hashable, loader: Callable[[], T]) -> T:
+        value = loader()
+        with self._lock:
+            self._entries[key] = _CacheEntry(value, self._clock(), loader)
+        return value
+
+    def _refresh_in_background(self, key: Hashable, entry: _CacheEntry[T]) -> None:
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+
+        def refresh() -> None:
+            try:
+                self._load(key, entry.loader)
+            except Exception as e:
+                print(f"キャッシュのバックグラウンド更新に失敗しました: {str(e)}")
+            finally:
+                entry.refreshing = False
+
+        threading.Thread(target=refresh, daemon=True).start()
@@ -0,0 +1,298 @@
+import math
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ErrorKind:
+    """Bedrock呼び出しエラーの分類"""
+    THROTTLED = "throttled"
+    RETRYABLE = "retryable"
+    FATAL = "fatal"
+
+
+# botocoreのエラーコードによる分類
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+}
+RETRYABLE_ERROR_CODES = {
+    "ModelTimeoutException",
+    "ModelNotReadyException",
+    "ServiceUnavailableException",
+    "InternalServerException",
+    "ModelStreamErrorException",
+}
+# 接続断やタイムアウトなど、レスポンスを受け取れなかったbotocoreの例外
+RETRYABLE_EXCEPTION_NAMES = {
+    "EndpointConnectionError",
+    "ConnectionClosedError",
+    "ReadTimeoutError",
+    "ConnectTimeoutError",
+}
+
+
+class AdmissionRejectedError(Exception):
+    """流量制限によりリクエストを受け付けられないエラー"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"リクエストが集中しています。{math.ceil(retry_after)}秒後に再試行してください")
+        self.retry_after = retry_after
+
+
+def get_error_code(e: BaseException) -> Optional[str]:
+    """
+    例外（LangChainなどでラップされたものを含む）からbotocoreのエラーコードを取り出す
+
+    Args:
+        e (BaseException): 例外
+
+    Returns:
+        Optional[str]: エラーコード。botocoreのClientErrorでない場合はNone
+    """
+    current: Optional[BaseException] = e
+    seen = set()
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        response = getattr(current, "response", None)
+        if isinstance(response, dict):
+            code = response.get("Error", {}).get("Code")
+            if code:
+                return code
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def classify_error(e: BaseException) -> str:
+    """
+    Bedrock呼び出しの例外を分類する
+
+    Args:
+        e (BaseException): 例外
+
+    Returns:
+        str: ErrorKindのいずれか
+    """
+    code = get_error_code(e)
+    if code in THROTTLING_ERROR_CODES:
+        return ErrorKind.THROTTLED
+    if code in RETRYABLE_ERROR_CODES:
+        return ErrorKind.RETRYABLE
+
+    current: Optional[BaseException] = e
+    seen = set()
+    while current is not None and id(current) not in seen:
+        seen.add(id(current))
+        if type(current).__name__ in RETRYABLE_EXCEPTION_NAMES:
+            return ErrorKind.RETRYABLE
+        current = current.__cause__ or current.__context__
+    return ErrorKind.FATAL
+
+
+class Deadline:
+    """Lambdaの残り実行時間"""
+
+    def __init__(self, remaining_millis: Optional[Callable[[], int]] = None):
+        self._remaining_millis = remaining_millis
+
+    @classmethod
+    def from_context(cls, context: Any) -> "Deadline":
+        """
+        Lambdaのコンテキストから生成する
+
+        Args:
+            context (Any): Lambda関数のコンテキスト（ローカル実行などでNoneの場合は期限なし）
+
+        Returns:
+            Deadline: 残り実行時間
+        """
+        remaining = getattr(context, "get_remaining_time_in_millis", None)
+        return cls(remaining if callable(remaining) else None)
+
+    def remaining_seconds(self) -> float:
+        """
+        残り実行時間（秒）を返す
+
+        Returns:
+            float: 残り実行時間。期限がない場合は無限大
+        """
+        if self._remaining_millis is None:
+            return math.inf
+        return self._remaining_millis() / 1000
+
+    def with_margin(self, margin_seconds: float) -> "Deadline":
+        """
+        レスポンスを返す時間などを残した、より早い期限を返す
+
+        Args:
+            margin_seconds (float): 残す時間（秒）
+
+        Returns:
+            Deadline: margin_seconds だけ早い期限（期限がない場合は期限なし）
+        """
+        remaining_millis = self._remaining_millis
+        if remaining_millis is None:
+            return self
+        return Deadline(lambda: remaining_millis() - int(margin_seconds * 1000))
+
+
+class AdmissionController:
+    """
+    コンテナ単位のトークンバケット＋同時実行数制限
+
+    トークンが足りない場合は max_wait_seconds までは待つが、それ以上かかる場合は
+    AdmissionRejectedError で早めに断る
+    """
+
+    def __init__(
+        self,
+        rate_per_second: float,
+        burst: int,
+        max_in_flight: int,
+        max_wait_seconds: float = 2.0,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep
+    ):
+        self._rate = rate_per_second
+        self._burst = burst
+        self._tokens = float(burst)
+        self._updated_at = clock()
+        self._max_wait = max_wait_seconds
+        self._clock = clock
+        self._sleep = sleep
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, deadline: Optional[Deadline] = None) -> Iterator[None]:
+        """
+        Bedrockの呼び出し枠を確保する
+
+        Args:
+            deadline (Optional[Deadline]): 残り実行時間。待ち時間はこれを超えない
+
+        Raises:
+            AdmissionRejectedError: 枠を確保できない場合
+        """
+        max_wait = self._max_wait
+        if deadline is not None:
+            max_wait = min(max_wait, max(0.0, deadline.remaining_seconds() - 1.0))
+
+        wait = self._reserve_token(max_wait)
+        if wait > 0:
+            self._sleep(wait)
+        if not self._slots.acquire(timeout=max(max_wait - wait, 0.0)):
+            raise AdmissionRejectedError(max(1.0, 1 / self._rate))
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+    def _reserve_token(self, max_wait: float) -> float:
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self._burst, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+            wait = max(0.0, (1 - self._tokens) / self._rate)
+            if wait > max_wait:
+                raise AdmissionRejectedError(wait)
+            self._tokens -= 1
+            return wait
+
+
+class AdmittedIterator(Iterator[T]):
+    """
+    ストリーミングの応答を読み終わるか閉じられるまで、流量制限の枠を確保しておくイテレーター
+
+    最後まで読まずに捨てられた場合も、ガベージコレクションの時点で枠を解放する
+    """
+
+    def __init__(self, iterator: Iterator[T], release: Callable[[], Any]):
+        self._iterator = iterator
+        self._release: Optional[Callable[[], Any]] = release
+
+    def __next__(self) -> T:
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        """元のイテレーターを閉じて枠を解放する（2回目以降は何もしない）"""
+        release, self._release = self._release, None
+        if release is None:
+            return
+        try:
+            close = getattr(self._iterator, "close", None)
+            if close is not None:
+                close()
+        finally:
+            release()
+
+    def __del__(self) -> None:
+        self.close()
+
+
+def invoke_with_retry(
+    fn: Callable[[], T],
+    deadline: Optional[Deadline] = None,
+    admission: Optional[AdmissionController] = None,
+    max_attempts: int = 4,
+    base_delay_seconds: float = 0.5,
+    max_delay_seconds: float = 8.0,
+    safety_margin_seconds: float = 3.0,
+    sleep: Callable[[float], None] = time.sleep
+) -> T:
+    """
+    Bedrockの呼び出しを指数バックオフ（フルジッター）でリトライする
+
+    スロットリングと一時的なエラーのみリトライし、待ち時間が残り実行時間に収まらない場合は諦める。
+    処理がイテレーター（ストリーミングの応答）を返した場合は、読み終わるか閉じられるまで流量制限の枠を確保しておく
+
+    Args:
+        fn (Callable[[], T]): 呼び出す処理
+        deadline (Optional[Deadline]): 残り実行時間
+        admission (Optional[AdmissionController]): 呼び出しごとに枠を確保する流量制限
+        max_attempts (int): 最大試行回数
+        base_delay_seconds (float): バックオフの基準時間
+        max_delay_seconds (float): バックオフの上限
+        safety_margin_seconds (float): 再試行後の呼び出しのために残しておく時間
+        sleep (Callable[[float], None]): 待機処理
+
+    Returns:
+        T: 処理結果（イテレーターの場合はAdmittedIteratorで包んだもの）
+
+    Raises:
+        AdmissionRejectedError: 流量制限で断られた場合
+        Exception: リトライできない、またはリトライし尽くした場合は最後の例外をそのまま送出する
+    """
+    deadline = deadline or Deadline()
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            if admission is None:
+                return fn()
+            with ExitStack() as slot:
+                slot.enter_context(admission.admit(deadline))
+                result = fn()
+                if isinstance(result, Iterator):
+                    # 枠の解放をイテレーターに引き継ぐ（最初のチャンクを受け取った時点で枠を手放さない）
+                    return AdmittedIterator(result, slot.pop_all().close)
+                return result
+        except AdmissionRejectedError:
+            raise
+        except Exception as e:
+            if classify_error(e) == ErrorKind.FATAL or attempt >= max_attempts:
+                raise
+            delay = random.uniform(0, min(max_delay_seconds, base_delay_seconds * 2 ** (attempt - 1)))
+            if deadline.remaining_seconds() - delay < safety_margin_seconds:
+                raise
+            print(f"Bedrockの呼び出しをリトライします（{attempt}回目, {delay:.2f}秒後）: {get_error_code(e) or type(e).__name__}")
+            sleep(delay)
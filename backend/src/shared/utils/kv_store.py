@@ -0,0 +1,313 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+
+class KeyValueStore(ABC):
+    """
+    JSONシリアライズ可能な値を保存するキャッシュストアの基底クラス
+
+    値は有効期限付きで保存し、期限切れの値は取得時に存在しないものとして扱う
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        値を取得する
+
+        Args:
+            key (str): キー
+
+        Returns:
+            Optional[Dict[str, Any]]: 保存された値。存在しないか期限切れの場合はNone
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        """
+        値を保存する
+
+        Args:
+            key (str): キー
+            value (Dict[str, Any]): 保存する値
+            ttl_seconds (float): 有効期限（秒）
+        """
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """
+        値を削除する
+
+        Args:
+            key (str): キー
+        """
+
+
+class MemoryLRUStore(KeyValueStore):
+    """コンテナ内メモリに保持するLRUストア（件数・サイズ上限付き）"""
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 16 * 1024 * 1024,
+        clock: Callable[[], float] = time.time
+    ):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._clock = clock
+        self._entries: "OrderedDict[str, tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at <= self._clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self._max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (self._clock() + ttl_seconds, size, value)
+            self._size += size
+            while len(self._entries) > self._max_entries or self._size > self._max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+
+class FileStore(KeyValueStore):
+    """ローカルファイルに保存するストア（共有ストアのローカル代替・テスト用）"""
+
+    def __init__(self, directory: str, max_entries: int = 1024, clock: Callable[[], float] = time.time):
+        self._directory = directory
+        self._max_entries = max_entries
+        self._clock = clock
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if record["expiresAt"] <= self._clock():
+            self.delete(key)
+            return None
+        return record["value"]
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        record = {"expiresAt": self._clock() + ttl_seconds, "value": value}
+        path = self._path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, hashlib.sha256(key.encode("utf-8")).hexdigest() + ".json")
+
+    def _evict(self) -> None:
+        files = [
+            os.path.join(self._directory, name)
+            for name in os.listdir(self._directory)
+            if name.endswith(".json")
+        ]
+        if len(files) <= self._max_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self._max_entries]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class DynamoDBStore(KeyValueStore):
+    """
+    DynamoDBテーブルに保存する共有ストア
+
+    テーブルはパーティションキー `pk`（文字列）を持ち、`expiresAt` をTTL属性に設定しておくこと
+    """
+
+    # DynamoDBのアイテムサイズ上限（400KB）に余裕を持たせた値
+    MAX_VALUE_BYTES = 350 * 1024
+
+    def __init__(self, table_name: str, client: Any = None, clock: Callable[[], float] = time.time):
+        if client is None:
+            import boto3
+            client = boto3.client("dynamodb")
+        self._client = client
+        self._table_name = table_name
+        self._clock = clock
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        response = self._client.get_item(
+            TableName=self._table_name,
+            Key={"pk": {"S": key}}
+        )
+        item = response.get("Item")
+        if not item or int(item["expiresAt"]["N"]) <= self._clock():
+            return None
+        return json.loads(item["value"]["S"])
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        serialized = json.dumps(value, ensure_ascii=False)
+        if len(serialized.encode("utf-8")) > self.MAX_VALUE_BYTES:
+            return
+        self._client.put_item(
+            TableName=self._table_name,
+            Item={
+                "pk": {"S": key},
+                "value": {"S": serialized},
+                "expiresAt": {"N": str(int(self._clock() + ttl_seconds))}
+            }
+        )
+
+    def delete(self, key: str) -> None:
+        self._client.delete_item(TableName=self._table_name, Key={"pk": {"S": key}})
+
+
+class S3Store(KeyValueStore):
+    """
+    S3バケットに保存する共有ストア
+
+    件数の上限はバケットのライフサイクルルールで管理すること
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", client: Any = None, clock: Callable[[], float] = time.time):
+        if client is None:
+            import boto3
+            client = boto3.client("s3")
+        self._client = client
+        self._bucket = bucket
+        self._prefix = prefix
+        self._clock = clock
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self._client.get_object(Bucket=self._bucket, Key=self._object_key(key))
+        except self._client.exceptions.NoSuchKey:
+            return None
+        record = json.loads(response["Body"].read())
+        if record["expiresAt"] <= self._clock():
+            return None
+        return record["value"]
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        record = {"expiresAt": self._clock() + ttl_seconds, "value": value}
+        self._client.put_object(
+            Bucket=self._bucket,
+            Key=self._object_key(key),
+            Body=json.dumps(record, ensure_ascii=False).encode("utf-8"),
+            ContentType="application/json"
+        )
+
+    def delete(self, key: str) -> None:
+        self._client.delete_object(Bucket=self._bucket, Key=self._object_key(key))
+
+    def _object_key(self, key: str) -> str:
+        return f"{self._prefix}{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+
+class TieredStore(KeyValueStore):
+    """
+    メモリ上のストアを共有ストアの前段に置く2階層ストア
+
+    共有ストアの障害はキャッシュミスとして扱い、呼び出し元には伝播させない
+    """
+
+    def __init__(self, local: KeyValueStore, shared: KeyValueStore, local_ttl_seconds: float = 300):
+        self._local = local
+        self._shared = shared
+        self._local_ttl = local_ttl_seconds
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = self._shared.get(key)
+        except Exception as e:
+            print(f"共有キャッシュの取得に失敗しました: {str(e)}")
+            return None
+        if value is not None:
+            self._local.set(key, value, self._local_ttl)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl_seconds: float) -> None:
+        self._local.set(key, value, min(ttl_seconds, self._local_ttl))
+        try:
+            self._shared.set(key, value, ttl_seconds)
+        except Exception as e:
+            print(f"共有キャッシュの保存に失敗しました: {str(e)}")
+
+    def delete(self, key: str) -> None:
+        self._local.delete(key)
+        try:
+            self._shared.delete(key)
+        except Exception as e:
+            print(f"共有キャッシュの削除に失敗しました: {str(e)}")
+
+
+def create_store(spec: str, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024) -> KeyValueStore:
+    """
+    設定文字列からストアを生成する
+
+    Args:
+        spec (str): ストアの指定
+            - "memory": コンテナ内メモリのみ
+            - "dynamodb:<テーブル名>": メモリ + DynamoDB
+            - "s3:<バケット名>/<プレフィックス>": メモリ + S3
+            - "file:<ディレクトリ>": メモリ + ローカルファイル
+        max_entries (int): メモリ上に保持する最大件数
+        max_bytes (int): メモリ上に保持する最大サイズ（バイト）
+
+    Returns:
+        KeyValueStore: 生成したストア
+
+    Raises:
+        ValueError: 未知の指定の場合
+    """
+    local = MemoryLRUStore(max_entries=max_entries, max_bytes=max_bytes)
+    kind, _, target = (spec or "memory").partition(":")
+    if kind == "memory":
+        return local
+    if kind == "dynamodb":
+        return TieredStore(local, DynamoDBStore(target))
+    if kind == "s3":
+        bucket, _, prefix = target.partition("/")
+        return TieredStore(local, S3Store(bucket, prefix))
+    if kind == "file":
+        return TieredStore(local, FileStore(target))
+    raise ValueError(f"未知のキャッシュストア指定です: {spec}")
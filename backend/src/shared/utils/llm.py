@@ -0,0 +1,319 @@
+import math
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+from utils import metrics
+from utils.bedrock import get_bedrock_client, get_bedrock_control_client, get_read_timeout, get_region
+from utils.cache import RefreshAheadCache
+from utils.invocation import (
+    AdmissionController,
+    AdmissionRejectedError,
+    Deadline,
+    ErrorKind,
+    classify_error,
+    invoke_with_retry
+)
+from utils.model_routing import ModelRouter, ModelTier, parse_task_tiers
+from utils.prompts import ChatPrompts, build_chat_prompts
+from utils.secrets import SecretConfig
+
+# langchain・langfuseは、OPTIONSやバリデーションエラーの早期リターンで読み込まないよう
+# 使う関数の中でimportする（コールドスタート短縮のため）
+if TYPE_CHECKING:
+    from langchain_core.runnables import Runnable
+    from langchain_aws import ChatBedrockConverse
+    from langfuse import Langfuse
+    from langfuse.callback import CallbackHandler
+
+
+class LangfuseError(Exception):
+    """Langfuse関連のエラー"""
+    pass
+
+
+class BedrockThrottlingError(Exception):
+    """Bedrock APIのスロットリングエラー"""
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class LLMConfig:
+    """Bedrockのチャットモデル呼び出し関連の設定定数"""
+    MAX_TOKENS = 4096
+    # リトライは invoke_with_retry で行うため、boto3側のリトライは無効にする
+    CLIENT_MAX_ATTEMPTS = 1
+    MAX_ATTEMPTS = 4
+    # コンテナ単位の流量制限（超える分は429で早めに断る）
+    RATE_PER_SECOND = float(os.environ.get("BEDROCK_RATE_PER_SECOND", "5"))
+    BURST = int(os.environ.get("BEDROCK_BURST", "8"))
+    MAX_IN_FLIGHT = int(os.environ.get("BEDROCK_MAX_IN_FLIGHT", "4"))
+    THROTTLED_RETRY_AFTER_SECONDS = 60
+    # プロンプトの変数を含まない先頭部分（評価基準や指示文など）をBedrockのプロンプトキャッシュの対象にする
+    PROMPT_CACHE_ENABLED = os.environ.get("BEDROCK_PROMPT_CACHE", "true").lower() == "true"
+
+
+class PromptCacheConfig:
+    """プロンプトキャッシュ関連の設定定数"""
+    TTL_SECONDS = float(os.environ.get("PROMPT_CACHE_TTL_SECONDS", "300"))
+    STALE_WHILE_REVALIDATE_SECONDS = float(os.environ.get("PROMPT_CACHE_STALE_SECONDS", "3600"))
+
+
+class ModelRoutingConfig:
+    """モデルルーティング関連の設定定数"""
+    # 小さいモデル（未設定の場合はすべて BEDROCK_INFERENCE_PROFILE_ARN を使う）
+    SMALL_MODEL_ENV = "BEDROCK_SMALL_INFERENCE_PROFILE_ARN"
+    # 大きいモデルがスロットリングされた場合のフォールバック先（小さいモデルのフォールバック先は大きいモデル）
+    FALLBACK_MODEL_ENV = "BEDROCK_FALLBACK_INFERENCE_PROFILE_ARN"
+    # タスク（プロンプト名）ごとのモデルの区分の上書き（MODEL_ROUTES にJSONで指定する）
+    ROUTE_OVERRIDES: Dict[str, str] = parse_task_tiers(os.environ.get("MODEL_ROUTES", "{}"))
+    # ModelTier.AUTOのタスクで、推定トークン数がこの値以下の入力は小さいモデルを使う
+    SHORT_INPUT_TOKENS = int(os.environ.get("ROUTING_SHORT_INPUT_TOKENS", "2000"))
+
+
+class CompiledPrompt(NamedTuple):
+    """コンパイル済みプロンプト（Langfuseのプロンプトバージョンとプロンプトテンプレート）"""
+    version: int
+    prompt: ChatPrompts
+
+
+def setup_langfuse(
+    secret: SecretConfig,
+    user_email: Optional[str],
+    langfuse_session_id: Optional[str]
+) -> Tuple["CallbackHandler", "Langfuse"]:
+    """
+    Langfuseの設定をセットアップする
+
+    Args:
+        secret (SecretConfig): シークレット設定
+        user_email (Optional[str]): ユーザーメールアドレス
+        langfuse_session_id (Optional[str]): セッションID
+
+    Returns:
+        Tuple[CallbackHandler, Langfuse]: LangfuseハンドラーとLangfuseインスタンスのタプル
+
+    Raises:
+        LangfuseError: Langfuseの設定に失敗した場合
+    """
+    from langfuse import Langfuse
+    from langfuse.callback import CallbackHandler
+    try:
+        # Langfuseインスタンスを認証情報付きで初期化
+        langfuse = Langfuse(
+            public_key=secret["LANGFUSE_PUBLIC_KEY"],
+            secret_key=secret["LANGFUSE_SECRET_KEY"],
+            host=os.environ["LANGFUSE_HOST"]
+        )
+        langfuse_handler = CallbackHandler(
+            secret_key=secret["LANGFUSE_SECRET_KEY"],
+            public_key=secret["LANGFUSE_PUBLIC_KEY"],
+            host=os.environ["LANGFUSE_HOST"],
+            user_id=user_email,
+            session_id=langfuse_session_id
+        )
+        return langfuse_handler, langfuse
+    except Exception as e:
+        raise LangfuseError(f"Langfuseの設定に失敗しました: {str(e)}")
+
+
+def record_trace_metadata(langfuse: "Langfuse", trace_id: Optional[str], metadata: Dict[str, Any]) -> bool:
+    """
+    Bedrockのトークン使用量（プロンプトキャッシュの読み書きを含む）や選んだモデルをトレースのメタデータに記録する
+
+    テレメトリの失敗で生成済みの結果を返せなくならないよう、例外はログに出すだけにする
+
+    Args:
+        langfuse (Langfuse): Langfuseインスタンス
+        trace_id (Optional[str]): トレースID
+        metadata (Dict[str, Any]): メタデータ
+
+    Returns:
+        bool: 記録できた場合はTrue
+    """
+    try:
+        langfuse.trace(id=trace_id, metadata=metadata)
+        return True
+    except Exception as e:
+        print(f"トレースのメタデータの記録に失敗しました: {str(e)}")
+        return False
+
+
+@lru_cache(maxsize=16)
+def get_llm(model_id: str, read_timeout: float) -> "ChatBedrockConverse":
+    """
+    Bedrockのチャットモデルを取得する（モデルと読み込みのタイムアウトごとにウォームコンテナ間で使い回す）
+
+    Bedrockのクライアントはリージョンと読み込みのタイムアウトごとに共有し、モデルごとに接続プールを作らない
+
+    Args:
+        model_id (str): モデルID（推論プロファイルのARN）
+        read_timeout (float): 読み込みのタイムアウト（秒。get_read_timeoutで決める）
+
+    Returns:
+        ChatBedrockConverse: チャットモデル
+    """
+    from langchain_aws import ChatBedrockConverse
+    region = get_region(model_id=model_id)
+    return ChatBedrockConverse(
+        model=model_id,
+        max_tokens=LLMConfig.MAX_TOKENS,
+        region_name=region,
+        client=get_bedrock_client(region, LLMConfig.CLIENT_MAX_ATTEMPTS, read_timeout),
+        bedrock_client=get_bedrock_control_client(region),
+    )
+
+
+# タスクの区分ごとのモデルルーター（ウォームコンテナ間で使い回す）
+_routers: Dict[Tuple[Tuple[str, str], ...], ModelRouter] = {}
+
+
+def get_model_router(task_tiers: Dict[str, str]) -> ModelRouter:
+    """
+    タスクと入力の長さから呼び出すモデルを選ぶルーターを取得する
+
+    Args:
+        task_tiers (Dict[str, str]): タスク（プロンプト名）ごとのモデルの区分（MODEL_ROUTES の指定で上書きする）
+
+    Returns:
+        ModelRouter: モデルルーター
+    """
+    key = tuple(sorted(task_tiers.items()))
+    router = _routers.get(key)
+    if router is None:
+        large_model = os.environ["BEDROCK_INFERENCE_PROFILE_ARN"]
+        small_model = os.environ.get(ModelRoutingConfig.SMALL_MODEL_ENV) or large_model
+        router = ModelRouter(
+            models={ModelTier.SMALL: small_model, ModelTier.LARGE: large_model},
+            task_tiers={**task_tiers, **ModelRoutingConfig.ROUTE_OVERRIDES},
+            fallbacks={
+                ModelTier.SMALL: large_model,
+                ModelTier.LARGE: os.environ.get(ModelRoutingConfig.FALLBACK_MODEL_ENV) or None
+            },
+            short_input_tokens=ModelRoutingConfig.SHORT_INPUT_TOKENS
+        )
+        _routers[key] = router
+    return router
+
+
+# コンテナ内のBedrock呼び出しの流量制限
+_admission = AdmissionController(
+    rate_per_second=LLMConfig.RATE_PER_SECOND,
+    burst=LLMConfig.BURST,
+    max_in_flight=LLMConfig.MAX_IN_FLIGHT
+)
+
+
+def invoke_bedrock(fn: Callable[[], Any], deadline: Optional[Deadline]) -> Any:
+    """
+    流量制限とリトライ付きでBedrockを呼び出す
+
+    Args:
+        fn (Callable[[], Any]): Bedrockを呼び出す処理
+        deadline (Optional[Deadline]): Lambdaの残り実行時間
+
+    Returns:
+        Any: 処理結果
+    """
+    return invoke_with_retry(fn, deadline, _admission, max_attempts=LLMConfig.MAX_ATTEMPTS)
+
+
+def as_throttling_error(e: Exception) -> Optional[BedrockThrottlingError]:
+    """
+    流量制限やBedrockのスロットリングで呼び出せなかった例外を、429で返すためのエラーに変換する
+
+    Args:
+        e (Exception): Bedrock呼び出しで発生した例外
+
+    Returns:
+        Optional[BedrockThrottlingError]: スロットリングエラー（スロットリング以外の例外の場合はNone）
+    """
+    if isinstance(e, AdmissionRejectedError):
+        return BedrockThrottlingError("アクセスが集中しています。少し待ってからリトライください🙏", e.retry_after)
+    if classify_error(e) == ErrorKind.THROTTLED:
+        return BedrockThrottlingError(
+            "Bedrockが高負荷のようです。1分ほど待ってからリトライください🙏",
+            LLMConfig.THROTTLED_RETRY_AFTER_SECONDS
+        )
+    return None
+
+
+# プロンプト名ごとの最新プロンプト（ウォームコンテナ間で共有）
+_prompt_cache: RefreshAheadCache[CompiledPrompt] = RefreshAheadCache(
+    None,
+    ttl_seconds=PromptCacheConfig.TTL_SECONDS,
+    stale_while_revalidate_seconds=PromptCacheConfig.STALE_WHILE_REVALIDATE_SECONDS,
+    stale_if_error_seconds=PromptCacheConfig.STALE_WHILE_REVALIDATE_SECONDS
+)
+
+# プロンプト名・バージョンごとのコンパイル済みプロンプトテンプレート
+_compiled_prompts: Dict[Tuple[str, int], ChatPrompts] = {}
+
+
+def compile_prompt(langfuse: "Langfuse", prompt_name: str) -> CompiledPrompt:
+    """
+    Langfuseからプロンプトを取得してプロンプトテンプレートを構築する
+
+    変数を含まない先頭部分がプロンプトキャッシュの最小トークン数以上の場合は、キャッシュポイント付きの
+    システムメッセージにしたプロンプトも構築する（呼び出すモデルが対応している場合だけ使う）
+
+    Args:
+        langfuse (Langfuse): Langfuseインスタンス
+        prompt_name (str): プロンプト名
+
+    Returns:
+        CompiledPrompt: コンパイル済みプロンプト
+    """
+    prompt_template = langfuse.get_prompt(prompt_name)
+    key = (prompt_name, prompt_template.version)
+    prompt = _compiled_prompts.get(key)
+    if prompt is None:
+        prompt = build_chat_prompts(
+            prompt_template.get_langchain_prompt(),
+            {"langfuse_prompt": prompt_template},
+            LLMConfig.PROMPT_CACHE_ENABLED
+        )
+        _compiled_prompts[key] = prompt
+    return CompiledPrompt(prompt_template.version, prompt)
+
+
+def get_compiled_prompt(langfuse: "Langfuse", prompt_name: str) -> CompiledPrompt:
+    """
+    コンパイル済みプロンプトをキャッシュから取得する（期限切れの場合は古い値を返しつつ裏で更新する）
+
+    Args:
+        langfuse (Langfuse): Langfuseインスタンス
+        prompt_name (str): プロンプト名
+
+    Returns:
+        CompiledPrompt: コンパイル済みプロンプト
+    """
+    with metrics.span("GetPrompt"):
+        return _prompt_cache.get(prompt_name, lambda: compile_prompt(langfuse, prompt_name))
+
+
+def build_chain(
+    compiled: CompiledPrompt,
+    max_tokens: int,
+    model_id: str,
+    deadline: Optional[Deadline] = None
+) -> "Runnable":
+    """
+    コンパイル済みプロンプト・出力トークン数の上限・モデルからチェーンを組み立てる
+
+    Bedrockの応答を待つ時間は、Lambdaの残り実行時間に合わせて短くする
+
+    Args:
+        compiled (CompiledPrompt): コンパイル済みプロンプト
+        max_tokens (int): 出力トークン数の上限
+        model_id (str): モデルID（推論プロファイルのARN）
+        deadline (Optional[Deadline]): Lambdaの残り実行時間（省略時は BEDROCK_READ_TIMEOUT_SECONDS まで待つ）
+
+    Returns:
+        Runnable: チェーン
+    """
+    from langchain_core.output_parsers import StrOutputParser
+    read_timeout = get_read_timeout(deadline.remaining_seconds() if deadline is not None else math.inf)
+    llm = get_llm(model_id, read_timeout).bind(max_tokens=max_tokens)
+    return compiled.prompt.for_model(model_id) | llm | StrOutputParser()
@@ -0,0 +1,78 @@
+import threading
+from typing import TYPE_CHECKING, Any, Dict
+
+from utils import metrics
+
+if TYPE_CHECKING:
+    from langchain_core.callbacks import BaseCallbackHandler
+
+
+def empty_usage() -> Dict[str, int]:
+    """
+    トークン使用量の集計値の初期値を返す
+
+    Returns:
+        Dict[str, int]: 入力・出力・キャッシュ読み込み・キャッシュ書き込みのトークン数（すべて0）
+    """
+    return {
+        "inputTokens": 0,
+        "outputTokens": 0,
+        "cacheReadInputTokens": 0,
+        "cacheWriteInputTokens": 0
+    }
+
+
+def add_usage(total: Dict[str, int], usage_metadata: Dict[str, Any]) -> None:
+    """
+    LangChainのusage_metadataを集計値に加算する
+
+    Args:
+        total (Dict[str, int]): 集計値（empty_usageの形式）
+        usage_metadata (Dict[str, Any]): AIMessageのusage_metadata
+    """
+    details = usage_metadata.get("input_token_details") or {}
+    total["inputTokens"] += usage_metadata.get("input_tokens", 0)
+    total["outputTokens"] += usage_metadata.get("output_tokens", 0)
+    total["cacheReadInputTokens"] += details.get("cache_read", 0)
+    total["cacheWriteInputTokens"] += details.get("cache_creation", 0)
+
+
+def put_usage_metrics(usage: Dict[str, int]) -> None:
+    """
+    トークン使用量を実行中の呼び出しのメトリクスに記録する（メトリクス名は Bedrock<項目名>）
+
+    Args:
+        usage (Dict[str, int]): 集計値（empty_usageの形式）
+    """
+    for key, value in usage.items():
+        metrics.put(f"Bedrock{key[0].upper()}{key[1:]}", value, metrics.MetricUnit.COUNT)
+
+
+def create_usage_collector() -> "BaseCallbackHandler":
+    """
+    LLM呼び出しのトークン使用量（プロンプトキャッシュの読み書きを含む）を集計するコールバックを生成する
+
+    チェーンのconfigのcallbacksに渡すと、並列実行を含むすべてのLLM呼び出しの使用量を
+    usage属性に合算する
+
+    Returns:
+        BaseCallbackHandler: 使用量を集計するコールバック
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class UsageCollector(BaseCallbackHandler):
+        """LLM呼び出しごとのトークン使用量を合算するコールバック"""
+
+        def __init__(self) -> None:
+            self.usage = empty_usage()
+            self._lock = threading.Lock()
+
+        def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+            for generations in response.generations:
+                for generation in generations:
+                    usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                    if usage_metadata:
+                        with self._lock:
+                            add_usage(self.usage, usage_metadata)
+
+    return UsageCollector()
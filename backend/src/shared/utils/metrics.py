@@ -0,0 +1,300 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class MetricUnit:
+    """CloudWatchのメトリクスの単位"""
+    MILLISECONDS = "Milliseconds"
+    BYTES = "Bytes"
+    COUNT = "Count"
+
+
+class MetricsConfig:
+    """メトリクス出力関連の設定定数"""
+    NAMESPACE = os.environ.get("METRICS_NAMESPACE", "AwsLevelChecker")
+    # false の場合はEMFのログを出力しない（計測自体は行う）
+    ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+
+class InvocationMetrics:
+    """
+    1回の呼び出しの処理段階ごとの所要時間・サイズ・トークン数
+
+    同じ処理段階を複数回計測した場合は合計する。
+    emitでCloudWatchのEmbedded Metric Format（EMF）のログを1行出力する。
+    ログにはリクエストの本文などの内容は含めず、数値と識別子だけを出力する。
+    """
+
+    def __init__(self, function_name: str, cold_start: bool):
+        """
+        Args:
+            function_name (str): メトリクスのFunctionディメンションの値
+            cold_start (bool): コンテナの最初の呼び出しかどうか
+        """
+        self.function_name = function_name
+        self.cold_start = cold_start
+        self.thread_id = threading.get_ident()
+        self._values: Dict[str, float] = {}
+        self._units: Dict[str, str] = {}
+        self._properties: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def put(self, name: str, value: float, unit: str = MetricUnit.COUNT) -> None:
+        """
+        メトリクスの値を設定する
+
+        Args:
+            name (str): メトリクス名
+            value (float): 値
+            unit (str): 単位（MetricUnitのいずれか）
+        """
+        with self._lock:
+            self._values[name] = value
+            self._units[name] = unit
+
+    def add(self, name: str, value: float, unit: str = MetricUnit.COUNT) -> None:
+        """
+        メトリクスの値を加算する
+
+        Args:
+            name (str): メトリクス名
+            value (float): 加算する値
+            unit (str): 単位（MetricUnitのいずれか）
+        """
+        with self._lock:
+            self._values[name] = self._values.get(name, 0.0) + value
+            self._units[name] = unit
+
+    def add_duration(self, stage: str, elapsed_ms: float) -> None:
+        """
+        処理段階の所要時間を加算する（メトリクス名は <処理段階>Duration）
+
+        Args:
+            stage (str): 処理段階の名前
+            elapsed_ms (float): 所要時間（ミリ秒）
+        """
+        self.add(f"{stage}Duration", elapsed_ms, MetricUnit.MILLISECONDS)
+
+    def set_property(self, name: str, value: Any) -> None:
+        """
+        メトリクスにしない付加情報（ステータスコードやキャッシュヒット有無など）を設定する
+
+        Args:
+            name (str): 名前
+            value (Any): 値（JSONにできるもの）
+        """
+        with self._lock:
+            self._properties[name] = value
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """
+        withブロックの所要時間を処理段階の所要時間として記録する（例外が発生した場合も記録する）
+
+        Args:
+            stage (str): 処理段階の名前
+        """
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(stage, (time.perf_counter() - started_at) * 1000)
+
+    def to_emf(self) -> Dict[str, Any]:
+        """
+        EMF形式のログを組み立てる
+
+        Returns:
+            Dict[str, Any]: EMF形式のログ
+        """
+        with self._lock:
+            values = {name: round(value, 2) for name, value in self._values.items()}
+            units = dict(self._units)
+            properties = dict(self._properties)
+        return build_emf(
+            self.function_name,
+            values,
+            units,
+            {"ColdStart": "true" if self.cold_start else "false"},
+            properties
+        )
+
+    def emit(self) -> None:
+        """EMF形式のログを1行出力する"""
+        if MetricsConfig.ENABLED:
+            print(json.dumps(self.to_emf(), ensure_ascii=False))
+
+
+def build_emf(
+    function_name: str,
+    values: Dict[str, float],
+    units: Dict[str, str],
+    extra_dimensions: Optional[Dict[str, str]] = None,
+    properties: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    EMF形式のログを組み立てる
+
+    Functionディメンションに加え、extra_dimensionsを指定した場合は Function + 追加ディメンションの組み合わせでも集計する
+
+    Args:
+        function_name (str): Functionディメンションの値
+        values (Dict[str, float]): メトリクス名ごとの値
+        units (Dict[str, str]): メトリクス名ごとの単位
+        extra_dimensions (Optional[Dict[str, str]]): 追加のディメンション
+        properties (Optional[Dict[str, Any]]): メトリクスにしない付加情報
+
+    Returns:
+        Dict[str, Any]: EMF形式のログ
+    """
+    extra_dimensions = extra_dimensions or {}
+    dimension_sets: List[List[str]] = [["Function"]]
+    if extra_dimensions:
+        dimension_sets.append(["Function", *extra_dimensions])
+    return {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": MetricsConfig.NAMESPACE,
+                "Dimensions": dimension_sets,
+                "Metrics": [{"Name": name, "Unit": units[name]} for name in values]
+            }]
+        },
+        **(properties or {}),
+        "Function": function_name,
+        **extra_dimensions,
+        **values
+    }
+
+
+# コンテナの最初の呼び出しかどうか（instrument_handlerで呼び出しごとに更新する）
+_cold_start = True
+# 実行中の呼び出しのメトリクス（Lambdaは1コンテナで同時に1つの呼び出しだけを処理する）
+_current: Optional[InvocationMetrics] = None
+# instrument_handlerに渡された関数名（呼び出しの外で記録するメトリクスに使う）
+_function_name: Optional[str] = None
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    実行中の呼び出しの処理段階の所要時間を記録する（ハンドラーの外では何もしない）
+
+    Args:
+        stage (str): 処理段階の名前
+    """
+    metrics = _current
+    if metrics is None:
+        yield
+        return
+    with metrics.span(stage):
+        yield
+
+
+def put(name: str, value: float, unit: str = MetricUnit.COUNT) -> None:
+    """
+    実行中の呼び出しのメトリクスの値を設定する（ハンドラーの外では何もしない）
+
+    Args:
+        name (str): メトリクス名
+        value (float): 値
+        unit (str): 単位（MetricUnitのいずれか）
+    """
+    if _current is not None:
+        _current.put(name, value, unit)
+
+
+def set_property(name: str, value: Any) -> None:
+    """
+    実行中の呼び出しの付加情報を設定する（ハンドラーの外では何もしない）
+
+    Args:
+        name (str): 名前
+        value (Any): 値（JSONにできるもの）
+    """
+    if _current is not None:
+        _current.set_property(name, value)
+
+
+def record(name: str, value: float, unit: str = MetricUnit.COUNT) -> None:
+    """
+    呼び出しの中でも外でも実行される処理（テレメトリの送信など）のメトリクスを記録する
+
+    ハンドラーのスレッドで実行された場合は実行中の呼び出しのメトリクスに加算し、
+    レスポンス返却後に別スレッドで実行された場合はその値だけのEMFログを出力する
+
+    Args:
+        name (str): メトリクス名
+        value (float): 値
+        unit (str): 単位（MetricUnitのいずれか）
+    """
+    metrics = _current
+    if metrics is not None and metrics.thread_id == threading.get_ident():
+        metrics.add(name, value, unit)
+        return
+    if _function_name is None or not MetricsConfig.ENABLED:
+        return
+    print(json.dumps(
+        build_emf(_function_name, {name: round(value, 2)}, {name: unit}),
+        ensure_ascii=False
+    ))
+
+
+def record_stage(stage: str, elapsed_ms: float) -> None:
+    """
+    呼び出しの中でも外でも実行される処理の所要時間を記録する（メトリクス名は <処理段階>Duration）
+
+    Args:
+        stage (str): 処理段階の名前
+        elapsed_ms (float): 所要時間（ミリ秒）
+    """
+    record(f"{stage}Duration", elapsed_ms, MetricUnit.MILLISECONDS)
+
+
+def instrument_handler(function_name: str) -> Callable[[F], F]:
+    """
+    Lambdaハンドラーの呼び出しごとにメトリクスを計測し、終了時にEMF形式のログを出力するデコレーター
+
+    ハンドラー全体の所要時間（HandlerDuration）・コールドスタートかどうか・ステータスコード・
+    リクエストIDを記録する。処理段階ごとの所要時間はハンドラー内で span / put を使って記録する
+
+    Args:
+        function_name (str): メトリクスのFunctionディメンションの値
+
+    Returns:
+        Callable[[F], F]: デコレーター
+    """
+    def decorator(handler: F) -> F:
+        @functools.wraps(handler)
+        def wrapper(event: Any, context: Any) -> Any:
+            global _cold_start, _current, _function_name
+            metrics = InvocationMetrics(function_name, _cold_start)
+            _cold_start = False
+            _current = metrics
+            _function_name = function_name
+            request_id = getattr(context, "aws_request_id", None)
+            if request_id:
+                metrics.set_property("requestId", request_id)
+            if isinstance(event, dict) and event.get("httpMethod"):
+                metrics.set_property("httpMethod", event["httpMethod"])
+            try:
+                with metrics.span("Handler"):
+                    response = handler(event, context)
+                if isinstance(response, dict) and "statusCode" in response:
+                    metrics.set_property("statusCode", response["statusCode"])
+                return response
+            except Exception as e:
+                metrics.set_property("error", type(e).__name__)
+                raise
+            finally:
+                _current = None
+                metrics.emit()
+        return wrapper  # type: ignore[return-value]
+    return decorator
@@ -0,0 +1,158 @@
+import json
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+
+from utils.invocation import ErrorKind, classify_error, get_error_code
+
+T = TypeVar("T")
+
+
+class ModelTier:
+    """モデルの区分"""
+    # 速く安い小さいモデル（ツイート生成や短い入力向け）
+    SMALL = "small"
+    # 長い技術コンテンツの評価に使う大きいモデル
+    LARGE = "large"
+    # 入力の推定トークン数で SMALL / LARGE を選ぶ
+    AUTO = "auto"
+
+
+# タスクごとに指定できる区分
+MODEL_TIERS = (ModelTier.SMALL, ModelTier.LARGE, ModelTier.AUTO)
+
+
+def parse_task_tiers(raw: str) -> Dict[str, str]:
+    """
+    タスク（プロンプト名）ごとのモデルの区分の上書き（MODEL_ROUTES のJSON）を読み込む
+
+    設定の誤りでコールドスタートが失敗しないよう、JSONとして読めない場合は上書きせず、
+    区分が MODEL_TIERS にないタスクは無視する（どちらもログに出す）
+
+    Args:
+        raw (str): {"タスク名": "small" | "large" | "auto"} 形式のJSON
+
+    Returns:
+        Dict[str, str]: 有効なタスクごとの区分
+    """
+    try:
+        overrides = json.loads(raw or "{}")
+    except json.JSONDecodeError as e:
+        print(f"MODEL_ROUTESのJSONパースに失敗したため無視します: {str(e)}")
+        return {}
+    if not isinstance(overrides, dict):
+        print(f"MODEL_ROUTESはタスク名と区分のオブジェクトで指定してください（無視します）: {raw}")
+        return {}
+    task_tiers: Dict[str, str] = {}
+    for task, tier in overrides.items():
+        if tier in MODEL_TIERS:
+            task_tiers[task] = tier
+        else:
+            print(f"MODEL_ROUTESの区分が不正なため無視します: {task} -> {tier}（{' / '.join(MODEL_TIERS)}）")
+    return task_tiers
+
+
+class ModelRoute(NamedTuple):
+    """タスクに対して選んだモデル"""
+    task: str
+    tier: str
+    model_id: str
+    # 主モデルがスロットリングされた場合に使うモデル（なければNone）
+    fallback_model_id: Optional[str]
+    reason: str
+
+
+class ModelRouter:
+    """
+    タスクごとのモデル表と入力の長さから、呼び出すモデルを選ぶ
+
+    モデル表にないタスクは大きいモデルを使う
+    """
+
+    def __init__(
+        self,
+        models: Dict[str, str],
+        task_tiers: Dict[str, str],
+        fallbacks: Optional[Dict[str, Optional[str]]] = None,
+        short_input_tokens: int = 2000
+    ):
+        """
+        Args:
+            models (Dict[str, str]): 区分（ModelTier.SMALL / LARGE）ごとのモデルID（推論プロファイルのARN）
+            task_tiers (Dict[str, str]): タスク名ごとの区分（ModelTier.AUTOで入力の長さから選ぶ）
+            fallbacks (Optional[Dict[str, Optional[str]]]): 区分ごとのフォールバック先のモデルID
+            short_input_tokens (int): ModelTier.AUTOのタスクで小さいモデルを使う推定トークン数の上限
+        """
+        self._models = models
+        self._task_tiers = task_tiers
+        self._fallbacks = fallbacks or {}
+        self._short_input_tokens = short_input_tokens
+
+    def route(self, task: str, input_tokens: Optional[int] = None) -> ModelRoute:
+        """
+        タスクに使うモデルを選ぶ
+
+        Args:
+            task (str): タスク名
+            input_tokens (Optional[int]): 入力の推定トークン数（ModelTier.AUTOのタスクで使う）
+
+        Returns:
+            ModelRoute: 選んだモデルと理由
+        """
+        tier = self._task_tiers.get(task, ModelTier.LARGE)
+        if tier == ModelTier.AUTO:
+            if input_tokens is not None and input_tokens <= self._short_input_tokens:
+                tier = ModelTier.SMALL
+                reason = f"short input ({input_tokens:,} <= {self._short_input_tokens:,} tokens)"
+            else:
+                tier = ModelTier.LARGE
+                reason = f"long input ({input_tokens or 0:,} > {self._short_input_tokens:,} tokens)"
+        else:
+            reason = f"task default ({task} -> {tier})"
+
+        model_id = self._models.get(tier) or self._models[ModelTier.LARGE]
+        fallback_model_id = self._fallbacks.get(tier)
+        if fallback_model_id == model_id:
+            fallback_model_id = None
+        return ModelRoute(task, tier, model_id, fallback_model_id, reason)
+
+
+def invoke_with_fallback(route: ModelRoute, call: Callable[[str], T]) -> Tuple[T, str]:
+    """
+    選んだモデルで呼び出し、スロットリングされた場合はフォールバック先のモデルで1回だけ呼び直す
+
+    invoke_with_retryに渡す処理の中で使う（フォールバック先もスロットリングされた場合はリトライに任せる）
+
+    Args:
+        route (ModelRoute): 選んだモデル
+        call (Callable[[str], T]): モデルIDを受け取って呼び出す処理
+
+    Returns:
+        Tuple[T, str]: 処理結果と、実際に応答したモデルID
+    """
+    try:
+        return call(route.model_id), route.model_id
+    except Exception as e:
+        if route.fallback_model_id is None or classify_error(e) != ErrorKind.THROTTLED:
+            raise
+        print(f"モデルがスロットリングされたためフォールバックします（{route.task}）: {get_error_code(e) or type(e).__name__}")
+        return call(route.fallback_model_id), route.fallback_model_id
+
+
+def describe_route(route: ModelRoute, served_by: List[str]) -> Dict[str, Any]:
+    """
+    選んだモデルと理由をトレースのメタデータ用に整形する
+
+    Args:
+        route (ModelRoute): 選んだモデル
+        served_by (List[str]): 実際に応答したモデルID（呼び出しごと）
+
+    Returns:
+        Dict[str, Any]: メタデータ
+    """
+    return {
+        "task": route.task,
+        "tier": route.tier,
+        "modelId": route.model_id,
+        "reason": route.reason,
+        "fallbackModelId": route.fallback_model_id,
+        "fallbackUsed": any(model_id != route.model_id for model_id in served_by)
+    }
@@ -0,0 +1,131 @@
+import re
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional, Tuple
+
+from utils.bedrock import resolve_model_name
+from utils.tokens import estimate_tokens
+
+if TYPE_CHECKING:
+    from langchain_core.prompts import ChatPromptTemplate
+
+# LangChainのf-string形式のテンプレート変数（{{ }} はエスケープされた波括弧なので対象外）
+TEMPLATE_VARIABLE_PATTERN = re.compile(r"(?<!\{)\{[A-Za-z_][A-Za-z0-9_]*\}(?!\})")
+
+# プロンプトキャッシュに対応するモデルと、キャッシュできるプレフィックスの最小トークン数
+# （モデル名に含まれる文字列で判定し、先に一致したものを使う。一致しないモデルは非対応として扱う）
+PROMPT_CACHE_MIN_TOKENS: List[Tuple[str, int]] = [
+    ("anthropic.claude-opus-4-5", 4096),
+    ("anthropic.claude-haiku-4-5", 4096),
+    ("anthropic.claude-3-5-haiku", 2048),
+    ("anthropic.claude-opus-4", 1024),
+    ("anthropic.claude-sonnet-4", 1024),
+    ("anthropic.claude-3-7-sonnet", 1024),
+    ("amazon.nova", 1000),
+]
+
+
+def split_static_prefix(template: str) -> Tuple[str, str]:
+    """
+    プロンプトテンプレートを、変数を含まない先頭部分と、最初の変数を含む段落以降に分ける
+
+    先頭部分はリクエストごとに変わらないため、Bedrockのプロンプトキャッシュの対象にできる
+
+    Args:
+        template (str): LangChainのf-string形式のプロンプトテンプレート
+
+    Returns:
+        Tuple[str, str]: 先頭部分（エスケープを戻したプレーンテキスト）と残りのテンプレート。
+            分けられない場合は先頭部分が空文字列になる
+    """
+    match = TEMPLATE_VARIABLE_PATTERN.search(template)
+    if match is None:
+        return "", template
+    # 最初の変数を含む段落（空行区切り）の手前で分ける
+    paragraph_start = template.rfind("\n\n", 0, match.start())
+    if paragraph_start < 0:
+        return "", template
+    prefix = template[:paragraph_start].strip()
+    return prefix.replace("{{", "{").replace("}}", "}"), template[paragraph_start:].strip()
+
+
+def get_prompt_cache_min_tokens(model_id: str) -> Optional[int]:
+    """
+    モデルのプロンプトキャッシュの最小トークン数を取得する
+
+    Args:
+        model_id (str): モデルID（推論プロファイルのARN）
+
+    Returns:
+        Optional[int]: 最小トークン数。プロンプトキャッシュに対応していないモデルの場合はNone
+    """
+    model_name = resolve_model_name(model_id)
+    for pattern, min_tokens in PROMPT_CACHE_MIN_TOKENS:
+        if pattern in model_name:
+            return min_tokens
+    return None
+
+
+class ChatPrompts(NamedTuple):
+    """プロンプトテンプレートから構築した、プロンプトキャッシュを使う場合と使わない場合のチャットプロンプト"""
+    # テンプレートをそのまま1つのユーザーメッセージにしたプロンプト
+    plain: "ChatPromptTemplate"
+    # 先頭部分をキャッシュポイント付きのシステムメッセージにしたプロンプト（キャッシュできない場合はNone）
+    cached: Optional["ChatPromptTemplate"]
+    # 先頭部分の推定トークン数
+    prefix_tokens: int
+
+    def for_model(self, model_id: str) -> "ChatPromptTemplate":
+        """
+        呼び出すモデルに合わせてプロンプトを選ぶ
+
+        モデルがプロンプトキャッシュに対応し、先頭部分がモデルの最小トークン数以上の場合だけ
+        キャッシュポイント付きのプロンプトを使い、それ以外はテンプレートの構成を変えない
+
+        Args:
+            model_id (str): モデルID（推論プロファイルのARN）
+
+        Returns:
+            ChatPromptTemplate: チャットプロンプト
+        """
+        if self.cached is None:
+            return self.plain
+        min_tokens = get_prompt_cache_min_tokens(model_id)
+        if min_tokens is None or self.prefix_tokens < min_tokens:
+            return self.plain
+        return self.cached
+
+
+def build_chat_prompts(template: str, metadata: Dict[str, Any], cache_static_prefix: bool = True) -> ChatPrompts:
+    """
+    プロンプトテンプレートからチャットプロンプトを構築する
+
+    cache_static_prefixがTrueで、変数を含まない先頭部分がいずれかのモデルの最小トークン数以上の場合は、
+    先頭部分をキャッシュポイント付きのシステムメッセージにし、変数を含む残りをユーザーメッセージにした
+    プロンプトも構築する
+
+    Args:
+        template (str): LangChainのf-string形式のプロンプトテンプレート
+        metadata (Dict[str, Any]): プロンプトに付与するメタデータ（Langfuseのプロンプト紐づけなど）
+        cache_static_prefix (bool): 先頭部分をBedrockのプロンプトキャッシュの対象にするか
+
+    Returns:
+        ChatPrompts: キャッシュポイントを付けない・付けたチャットプロンプト
+    """
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import ChatPromptTemplate
+
+    plain = ChatPromptTemplate.from_template(template, metadata=metadata)
+    static_prefix, variable_part = split_static_prefix(template) if cache_static_prefix else ("", template)
+    prefix_tokens = estimate_tokens(static_prefix)
+    if not static_prefix or prefix_tokens < min(min_tokens for _, min_tokens in PROMPT_CACHE_MIN_TOKENS):
+        return ChatPrompts(plain, None, prefix_tokens)
+    cached = ChatPromptTemplate(
+        [
+            SystemMessage(content=[
+                {"type": "text", "text": static_prefix},
+                {"cachePoint": {"type": "default"}}
+            ]),
+            ("human", variable_part)
+        ],
+        metadata=metadata
+    )
+    return ChatPrompts(plain, cached, prefix_tokens)
@@ -0,0 +1,117 @@
+import json
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, TypedDict
+
+from utils import metrics
+from utils.cache import RefreshAheadCache
+
+# requestsは、OPTIONSやバリデーションエラーの早期リターンで読み込まないよう
+# 使う関数の中でimportする（コールドスタート短縮のため）
+if TYPE_CHECKING:
+    import requests
+
+
+class SecretError(Exception):
+    """シークレット取得関連のエラー"""
+    pass
+
+
+class SecretConfig(TypedDict):
+    """シークレット設定の型定義"""
+    LANGFUSE_SECRET_KEY: str
+    LANGFUSE_PUBLIC_KEY: str
+
+
+class SecretCacheConfig:
+    """シークレットキャッシュ関連の設定定数"""
+    TTL_SECONDS = float(os.environ.get("SECRET_CACHE_TTL_SECONDS", "300"))
+    REFRESH_AHEAD_SECONDS = 60
+    STALE_IF_ERROR_SECONDS = 900
+    CONNECT_TIMEOUT_SECONDS = 1.0
+    READ_TIMEOUT_SECONDS = 3.0
+    # Secrets拡張機能のエンドポイント
+    EXTENSION_ENDPOINT = "http://localhost:2773/secretsmanager/get"
+
+
+# シークレットに必要なキー
+REQUIRED_SECRET_KEYS: List[str] = ["LANGFUSE_SECRET_KEY", "LANGFUSE_PUBLIC_KEY"]
+
+
+@lru_cache(maxsize=1)
+def get_secrets_session() -> "requests.Session":
+    """
+    Secrets拡張機能への接続を取得する（ウォームコンテナ間で使い回す）
+
+    Returns:
+        requests.Session: HTTPセッション
+    """
+    import requests
+    return requests.Session()
+
+
+def fetch_secrets(secret_name: str) -> SecretConfig:
+    """
+    Secrets拡張機能経由でAWS Secrets Managerから設定を取得する
+
+    Args:
+        secret_name (str): シークレット名
+
+    Returns:
+        SecretConfig: シークレット設定
+
+    Raises:
+        SecretError: シークレット取得に失敗した場合
+    """
+    import requests
+    try:
+        headers = {"X-Aws-Parameters-Secrets-Token": os.environ.get('AWS_SESSION_TOKEN')}
+        secrets_response = get_secrets_session().get(
+            f"{SecretCacheConfig.EXTENSION_ENDPOINT}?secretId={secret_name}",
+            headers=headers,
+            timeout=(SecretCacheConfig.CONNECT_TIMEOUT_SECONDS, SecretCacheConfig.READ_TIMEOUT_SECONDS)
+        )
+
+        if secrets_response.status_code != 200:
+            raise SecretError(f"シークレット取得APIが失敗しました。: {secrets_response.status_code} （再実行してみてください🙏）")
+
+        secret = json.loads(secrets_response.text)["SecretString"]
+
+        if isinstance(secret, str):
+            secret = json.loads(secret)
+
+        if not all(key in secret for key in REQUIRED_SECRET_KEYS):
+            raise SecretError("必要なシークレットキーが見つかりません")
+
+        return secret
+    except requests.RequestException as e:
+        raise SecretError(f"シークレット取得時にネットワークエラーが発生しました: {str(e)}")
+    except json.JSONDecodeError as e:
+        raise SecretError(f"シークレットのJSONパースに失敗しました: {str(e)}")
+    except SecretError:
+        raise
+    except Exception as e:
+        raise SecretError(f"シークレットの取得に失敗しました: {str(e)}")
+
+
+# シークレット名ごとのシークレット（ウォームコンテナ間で共有し、期限の少し前に裏で更新する）
+_secret_cache: RefreshAheadCache[SecretConfig] = RefreshAheadCache(
+    fetch_secrets,
+    ttl_seconds=SecretCacheConfig.TTL_SECONDS,
+    refresh_ahead_seconds=SecretCacheConfig.REFRESH_AHEAD_SECONDS,
+    stale_if_error_seconds=SecretCacheConfig.STALE_IF_ERROR_SECONDS
+)
+
+
+def get_secrets() -> SecretConfig:
+    """
+    AWS Secrets Managerから設定を取得する（ウォームコンテナではキャッシュを返す）
+
+    Returns:
+        SecretConfig: シークレット設定
+
+    Raises:
+        SecretError: シークレット取得に失敗し、フォールバックできる値もない場合
+    """
+    with metrics.span("GetSecrets"):
+        return _secret_cache.get(os.environ['LANGFUSE_SECRET_NAME'])
@@ -0,0 +1,182 @@
+import atexit
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional, TypeVar
+
+from utils import metrics
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class TelemetryMode:
+    """テレメトリ送信モード"""
+    # ハンドラー内で同期的に送信する（従来の動作）
+    SYNC = "sync"
+    # レスポンス返却後に送信する
+    DEFERRED = "deferred"
+
+
+class DeferredFlusher:
+    """
+    Langfuseなどのテレメトリ送信（flush）をレスポンスのクリティカルパスから外すキュー
+
+    Lambda上では内部拡張機能としてExtensions APIに登録し、ハンドラーがレスポンスを返した後、
+    次の呼び出しを受け付ける前にキューを処理する。拡張機能として登録できない環境では
+    バックグラウンドスレッドで処理し、凍結で残った分は次の呼び出しの開始時と終了時に処理する。
+
+    キューは上限付きで、溢れた送信は破棄して破棄件数を数える。
+    """
+
+    EXTENSION_NAME = "deferred-telemetry"
+
+    def __init__(self, mode: str = TelemetryMode.DEFERRED, max_pending: int = 32):
+        self.mode = mode
+        self.dropped_count = 0
+        self._queue: "queue.Queue[tuple[Callable[[], None], str]]" = queue.Queue(maxsize=max_pending)
+        self._invocation_done = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._extension_registered = False
+
+        if mode == TelemetryMode.DEFERRED:
+            self._extension_registered = self._register_extension()
+            if not self._extension_registered:
+                threading.Thread(target=self._run_worker, daemon=True).start()
+            atexit.register(self.drain)
+
+    def submit(self, flush: Callable[[], None], stage: str = "Flush") -> bool:
+        """
+        送信処理をキューに積む（SYNCモードではその場で実行する）
+
+        Args:
+            flush (Callable[[], None]): 送信処理
+            stage (str): 所要時間を記録するメトリクスの処理段階の名前
+
+        Returns:
+            bool: 受け付けた場合はTrue。キューが溢れて破棄した場合はFalse
+        """
+        if self.mode == TelemetryMode.SYNC:
+            self._run(flush, stage)
+            return True
+        try:
+            self._queue.put_nowait((flush, stage))
+            return True
+        except queue.Full:
+            self.dropped_count += 1
+            print(f"テレメトリの送信キューが溢れたため破棄しました（累計{self.dropped_count}件）")
+            metrics.record("TelemetryDropped", 1)
+            return False
+
+    def drain(self) -> None:
+        """キューに積まれた送信処理をすべて実行する"""
+        with self._drain_lock:
+            while True:
+                try:
+                    flush, stage = self._queue.get_nowait()
+                except queue.Empty:
+                    return
+                self._run(flush, stage)
+
+    def wrap_handler(self, handler: F) -> F:
+        """
+        Lambdaハンドラーをラップし、呼び出しの終了を拡張機能スレッドに通知する
+
+        Args:
+            handler (F): Lambdaハンドラー
+
+        Returns:
+            F: ラップしたハンドラー
+        """
+        @functools.wraps(handler)
+        def wrapper(event: Any, context: Any) -> Any:
+            if self.mode == TelemetryMode.DEFERRED and not self._extension_registered:
+                # 前回の呼び出しの後に凍結されて送れなかった分を先に送る
+                self.drain()
+            try:
+                return handler(event, context)
+            finally:
+                self._invocation_done.set()
+        return wrapper  # type: ignore[return-value]
+
+    def _run(self, flush: Callable[[], None], stage: str) -> None:
+        started_at = time.perf_counter()
+        try:
+            flush()
+        except Exception as e:
+            print(f"テレメトリの送信に失敗しました: {str(e)}")
+        finally:
+            metrics.record_stage(stage, (time.perf_counter() - started_at) * 1000)
+
+    def _run_worker(self) -> None:
+        while True:
+            self._invocation_done.wait()
+            self._invocation_done.clear()
+            self.drain()
+
+    def _register_extension(self) -> bool:
+        runtime_api = os.environ.get("AWS_LAMBDA_RUNTIME_API")
+        if not runtime_api:
+            return False
+        import urllib.request
+        base_url = f"http://{runtime_api}/2020-01-01/extension"
+        try:
+            request = urllib.request.Request(
+                f"{base_url}/register",
+                data=json.dumps({"events": ["INVOKE"]}).encode("utf-8"),
+                headers={"Lambda-Extension-Name": self.EXTENSION_NAME},
+                method="POST"
+            )
+            with urllib.request.urlopen(request, timeout=1) as response:
+                extension_id = response.headers["Lambda-Extension-Identifier"]
+        except Exception as e:
+            print(f"テレメトリ用の拡張機能の登録に失敗しました: {str(e)}")
+            return False
+
+        threading.Thread(
+            target=self._run_extension,
+            args=(base_url, extension_id),
+            daemon=True
+        ).start()
+        return True
+
+    def _run_extension(self, base_url: str, extension_id: str) -> None:
+        import urllib.request
+        while True:
+            # 次の呼び出しが来るまでブロックする。このリクエストを送ることで前回の呼び出しの処理完了をLambdaに伝える
+            request = urllib.request.Request(
+                f"{base_url}/event/next",
+                headers={"Lambda-Extension-Identifier": extension_id}
+            )
+            try:
+                with urllib.request.urlopen(request) as response:
+                    response.read()
+            except Exception as e:
+                print(f"拡張機能のイベント取得に失敗しました: {str(e)}")
+                time.sleep(0.1)
+                continue
+            # ハンドラーがレスポンスを返すのを待ってから送信する
+            self._invocation_done.wait()
+            self._invocation_done.clear()
+            self.drain()
+
+
+_default_flusher: Optional[DeferredFlusher] = None
+
+
+def get_flusher() -> DeferredFlusher:
+    """
+    コンテナで共有するDeferredFlusherを取得する（TELEMETRY_MODE環境変数でモードを切り替える）
+
+    Returns:
+        DeferredFlusher: 共有インスタンス
+    """
+    global _default_flusher
+    if _default_flusher is None:
+        _default_flusher = DeferredFlusher(
+            mode=os.environ.get("TELEMETRY_MODE", TelemetryMode.DEFERRED),
+            max_pending=int(os.environ.get("TELEMETRY_MAX_PENDING", "32"))
+        )
+    return _default_flusher
@@ -0,0 +1,216 @@
+import math
+import re
+from typing import List, TypedDict
+
+# 行中の連続する空白（全角スペースを含む）
+INLINE_SPACES_PATTERN = re.compile(r"[ \t\u3000]+")
+# Markdownのコードブロックの開始・終了（``` または ~~~）
+CODE_FENCE_PATTERN = re.compile(r"^[ \t]*(`{3,}|~{3,})")
+
+
+class InputTooLargeError(Exception):
+    """入力が推定トークン数の上限を超えるエラー"""
+    pass
+
+
+class OverflowMode:
+    """入力が推定トークン数の上限を超えた場合の扱い"""
+    # 上限まで切り詰める
+    TRIM = "trim"
+    # InputTooLargeErrorを送出する（ハンドラーは413を返す）
+    REJECT = "reject"
+
+
+class PreflightResult(TypedDict):
+    """Bedrock呼び出し前の入力チェック結果の型定義"""
+    text: str
+    inputTokens: int
+    # 正規化・切り詰め後に残った割合（推定トークン数ベース）
+    keptRatio: float
+    trimmed: bool
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する
+
+    日本語などの非ASCII文字は1文字あたり約1トークン、英数字や記号は約4文字で1トークンとして数える
+    （Claudeのトークナイザーより少し多めに見積もる）
+
+    Args:
+        text (str): 対象のテキスト
+
+    Returns:
+        int: 推定トークン数
+    """
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return non_ascii_chars + math.ceil(ascii_chars / 4)
+
+
+def split_text_by_tokens(text: str, max_tokens: int) -> List[str]:
+    """
+    テキストを推定トークン数の上限以下のチャンクに分割する
+
+    なるべく行の区切りで分割し、1行で上限を超える場合のみ行の途中で分割する
+
+    Args:
+        text (str): 対象のテキスト
+        max_tokens (int): チャンクあたりの最大推定トークン数
+
+    Returns:
+        List[str]: 分割したチャンク
+    """
+    chunks: List[str] = []
+    current: List[str] = []
+    current_tokens = 0
+
+    for line in text.splitlines(keepends=True):
+        line_tokens = estimate_tokens(line)
+        if line_tokens > max_tokens:
+            # 1文字1トークン以下なので、max_tokens文字ずつ区切れば必ず上限に収まる
+            pieces = [line[i:i + max_tokens] for i in range(0, len(line), max_tokens)]
+        else:
+            pieces = [line]
+
+        for piece in pieces:
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("".join(current))
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def normalize_text(text: str, min_duplicate_chars: int = 20) -> str:
+    """
+    Bedrockに送る前にテキストの空白と重複行を取り除く
+
+    - 改行コードを統一し、行末の空白を削除する（行頭のインデントは残す）
+    - 行中の連続する空白を1つにまとめ、連続する空行を1行にまとめる
+    - min_duplicate_chars文字以上の行が（空行を挟んで）直前の行と同じ場合は削除する（ナビゲーションの繰り返しなど）
+    - コードブロック（``` / ~~~ で囲んだ部分）の中は変更しない。表の行（| で始まる行）は重複していても削除しない
+
+    Args:
+        text (str): 対象のテキスト
+        min_duplicate_chars (int): 重複として削除する行の最小文字数
+
+    Returns:
+        str: 正規化したテキスト
+    """
+    lines: List[str] = []
+    previous = None
+    fence = None
+    for line in text.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        match = CODE_FENCE_PATTERN.match(line)
+        if fence is not None:
+            lines.append(line)
+            if match and match.group(1)[0] == fence[0] and len(match.group(1)) >= len(fence):
+                fence = None
+            continue
+        if match:
+            fence = match.group(1)
+            previous = None
+            lines.append(line.rstrip())
+            continue
+        line = line.rstrip()
+        body = line.lstrip(" \t")
+        indent = line[:len(line) - len(body)]
+        body = INLINE_SPACES_PATTERN.sub(" ", body)
+        if not body:
+            if lines and lines[-1]:
+                lines.append("")
+            continue
+        if body == previous and len(body) >= min_duplicate_chars and not body.startswith("|"):
+            continue
+        previous = body
+        lines.append(indent + body)
+    return "\n".join(lines).strip()
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    テキストを推定トークン数の上限以下になるよう先頭から切り詰める（なるべく行の区切りで切る）
+
+    Args:
+        text (str): 対象のテキスト
+        max_tokens (int): 推定トークン数の上限
+
+    Returns:
+        str: 切り詰めたテキスト（上限以下の場合はそのまま）
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return split_text_by_tokens(text, max_tokens)[0]
+
+
+def preflight_input(
+    text: str,
+    budget_tokens: int,
+    overflow_mode: str = OverflowMode.TRIM,
+    min_duplicate_chars: int = 20
+) -> PreflightResult:
+    """
+    Bedrockに送る前に入力を正規化し、推定トークン数が上限に収まるか確認する
+
+    Args:
+        text (str): 入力テキスト
+        budget_tokens (int): 推定トークン数の上限
+        overflow_mode (str): 上限を超えた場合の扱い（OverflowModeのいずれか）
+        min_duplicate_chars (int): 重複として削除する行の最小文字数
+
+    Returns:
+        PreflightResult: 正規化・切り詰め後のテキストと推定トークン数
+
+    Raises:
+        InputTooLargeError: 上限を超え、overflow_modeがrejectの場合
+    """
+    original_tokens = estimate_tokens(text)
+    normalized = normalize_text(text, min_duplicate_chars)
+    tokens = estimate_tokens(normalized)
+    trimmed = False
+    if tokens > budget_tokens:
+        if overflow_mode == OverflowMode.REJECT:
+            raise InputTooLargeError(
+                f"入力が長すぎます（推定{tokens:,}トークン / 上限{budget_tokens:,}トークン）。内容を減らしてから送信してね🙏"
+            )
+        normalized = trim_to_tokens(normalized, budget_tokens).rstrip()
+        tokens = estimate_tokens(normalized)
+        trimmed = True
+    return {
+        "text": normalized,
+        "inputTokens": tokens,
+        "keptRatio": round(tokens / original_tokens, 3) if original_tokens else 1.0,
+        "trimmed": trimmed
+    }
+
+
+def compute_max_tokens(
+    input_tokens: int,
+    min_tokens: int,
+    max_tokens: int,
+    output_ratio: float = 0.0,
+    context_window: int = 200000
+) -> int:
+    """
+    入力の推定トークン数から出力トークン数の上限（max_tokens）を決める
+
+    入力が長いほど出力の上限を大きくし（output_ratio）、入力と合わせてコンテキストウィンドウに収まるようにする
+
+    Args:
+        input_tokens (int): 入力の推定トークン数
+        min_tokens (int): 出力トークン数の下限
+        max_tokens (int): 出力トークン数の上限
+        output_ratio (float): 入力1トークンあたりに追加する出力トークン数
+        context_window (int): モデルのコンテキストウィンドウ
+
+    Returns:
+        int: 出力トークン数の上限
+    """
+    wanted = min(max_tokens, min_tokens + math.ceil(input_tokens * output_ratio))
+    return max(1, min(wanted, context_window - input_tokens))
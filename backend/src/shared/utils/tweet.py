@@ -0,0 +1,130 @@
+import os
+from typing import TYPE_CHECKING, Any, Dict, Optional, TypedDict
+
+from utils import metrics
+from utils.invocation import Deadline
+from utils.llm import as_throttling_error, build_chain, get_compiled_prompt, get_model_router, invoke_bedrock
+from utils.llm_usage import create_usage_collector
+from utils.model_routing import ModelTier, describe_route, invoke_with_fallback
+from utils.tokens import OverflowMode, compute_max_tokens, preflight_input
+
+# langchain・langfuseは、OPTIONSやバリデーションエラーの早期リターンで読み込まないよう
+# 使う関数の中でimportする（コールドスタート短縮のため）
+if TYPE_CHECKING:
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langfuse import Langfuse
+
+
+class TweetGenerationError(Exception):
+    """ツイート生成関連のエラー"""
+    pass
+
+
+class TweetResult(TypedDict):
+    """ツイート生成結果の型定義"""
+    output: str
+    promptVersion: int
+    # Bedrockのトークン使用量（プロンプトキャッシュの読み書きを含む）
+    usage: Dict[str, int]
+    # 選んだモデルと理由
+    route: Dict[str, Any]
+    # 評価結果の正規化・切り詰め後の推定トークン数と、元の評価結果に対して残った割合
+    inputTokens: int
+    keptRatio: float
+    trimmed: bool
+
+
+class TweetConfig:
+    """ツイート生成関連の設定定数"""
+    PROMPT_NAME = "tweet_generation"
+    RUN_NAME = "Tweet Generation"
+    # ツイート生成は小さいモデルで行い、スロットリングされた場合は大きいモデルにフォールバックする
+    TASK_TIERS = {PROMPT_NAME: ModelTier.SMALL}
+    # ツイートの元にする評価結果の推定トークン数の上限
+    INPUT_BUDGET_TOKENS = int(os.environ.get("TWEET_INPUT_BUDGET_TOKENS", "8000"))
+    # 上限を超えた場合の扱い（trim: 上限まで切り詰める / reject: InputTooLargeErrorを送出する）
+    OVERFLOW_MODE = os.environ.get("INPUT_OVERFLOW_MODE", OverflowMode.TRIM)
+    # 直前の行と同じこの文字数以上の行は重複として削除する
+    MIN_DUPLICATE_LINE_CHARS = 20
+    CONTEXT_WINDOW_TOKENS = 200000
+    # プロンプトテンプレート自体の推定トークン数の見込み
+    PROMPT_OVERHEAD_TOKENS = 1000
+    # ツイートは短いため、出力トークン数の上限を小さくして生成を早めに打ち切る
+    MIN_OUTPUT_TOKENS = 256
+    MAX_OUTPUT_TOKENS = 512
+
+
+def generate_tweet(
+    langfuse: "Langfuse",
+    eval_result: str,
+    langfuse_handler: "BaseCallbackHandler",
+    deadline: Optional[Deadline] = None,
+    stage_prefix: str = ""
+) -> TweetResult:
+    """
+    評価結果からツイート文言を生成する（/tweet と、withTweet指定時の /evaluate で共通）
+
+    Args:
+        langfuse (Langfuse): Langfuseインスタンス
+        eval_result (str): 評価結果
+        langfuse_handler (BaseCallbackHandler): Langfuseハンドラー
+        deadline (Optional[Deadline]): Lambdaの残り実行時間（リトライの待ち時間の上限）
+        stage_prefix (str): メトリクス名の接頭辞（評価と同じ呼び出しで生成する場合に評価のメトリクスと分ける）
+
+    Returns:
+        TweetResult: 生成されたツイート文言、使用したプロンプトのバージョン、トークン使用量、選んだモデル、入力チェック結果
+
+    Raises:
+        InputTooLargeError: 評価結果が上限を超え、TweetConfig.OVERFLOW_MODEがrejectの場合
+        TweetGenerationError: ツイート生成に失敗した場合
+        BedrockThrottlingError: Bedrockのスロットリングまたは流量制限で生成できなかった場合
+    """
+    # 評価結果を正規化し、長すぎる場合は切り詰めて（rejectの場合は断って）から送る
+    with metrics.span(f"{stage_prefix}Preflight"):
+        preflight = preflight_input(
+            eval_result,
+            TweetConfig.INPUT_BUDGET_TOKENS,
+            TweetConfig.OVERFLOW_MODE,
+            TweetConfig.MIN_DUPLICATE_LINE_CHARS
+        )
+    eval_result = preflight["text"]
+    input_tokens = preflight["inputTokens"]
+    try:
+        compiled = get_compiled_prompt(langfuse, TweetConfig.PROMPT_NAME)
+        max_tokens = compute_max_tokens(
+            input_tokens + TweetConfig.PROMPT_OVERHEAD_TOKENS,
+            TweetConfig.MIN_OUTPUT_TOKENS,
+            TweetConfig.MAX_OUTPUT_TOKENS,
+            context_window=TweetConfig.CONTEXT_WINDOW_TOKENS
+        )
+        route = get_model_router(TweetConfig.TASK_TIERS).route(TweetConfig.PROMPT_NAME, input_tokens)
+        usage_collector = create_usage_collector()
+        metrics.put(f"{stage_prefix}InputTokens", input_tokens)
+        with metrics.span(f"{stage_prefix}Bedrock"):
+            output, served_by = invoke_bedrock(
+                lambda: invoke_with_fallback(
+                    route,
+                    lambda model_id: build_chain(compiled, max_tokens, model_id, deadline).invoke(
+                        input={"eval_result": eval_result},
+                        config={
+                            "run_name": TweetConfig.RUN_NAME,
+                            "callbacks": [langfuse_handler, usage_collector]
+                        }
+                    )
+                ),
+                deadline
+            )
+        return {
+            "output": output,
+            "promptVersion": compiled.version,
+            "usage": usage_collector.usage,
+            "route": describe_route(route, [served_by]),
+            "inputTokens": input_tokens,
+            "keptRatio": preflight["keptRatio"],
+            "trimmed": preflight["trimmed"]
+        }
+    except Exception as e:
+        throttled = as_throttling_error(e)
+        if throttled is not None:
+            raise throttled
+        raise TweetGenerationError(f"ツイート生成に失敗しました: {str(e)}")
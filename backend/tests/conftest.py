@@ -0,0 +1,41 @@
+"""
+テストの共通設定
+
+Lambdaと同じく src/shared（SharedUtilsLayer）をimportパスに追加し、
+ハンドラー（どれもモジュール名がappになる）はハンドラー名ごとに別のモジュールとして読み込む。
+ハンドラーのディレクトリ（Lambdaの /var/task に相当）もimportパスに追加する
+"""
+import importlib.util
+import os
+import sys
+from types import ModuleType
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS_DIR = os.path.join(BACKEND_DIR, "src", "handlers")
+SHARED_DIR = os.path.join(BACKEND_DIR, "src", "shared")
+
+if SHARED_DIR not in sys.path:
+    sys.path.insert(0, SHARED_DIR)
+
+
+def load_handler(name: str) -> ModuleType:
+    """
+    ハンドラーのapp.pyを handler_<名前> というモジュールとして読み込む
+
+    Args:
+        name (str): ハンドラー名（src/handlers 配下のディレクトリ名）
+
+    Returns:
+        ModuleType: 読み込んだモジュール
+    """
+    module_name = f"handler_{name}"
+    if module_name in sys.modules:
+        return sys.modules[module_name]
+    handler_dir = os.path.join(HANDLERS_DIR, name)
+    if handler_dir not in sys.path:
+        sys.path.insert(0, handler_dir)
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(handler_dir, "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,98 @@
+import asyncio
+import math
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+
+from utils.bedrock import BedrockClientConfig, aconverse_many, converse, get_read_timeout
+
+
+def test_read_timeout_fits_in_remaining_invocation_time() -> None:
+    # 30秒のLambdaの呼び出し直後は、レスポンスを返す時間を残した5秒刻みの値になる
+    assert get_read_timeout(29.5) == 25
+    assert get_read_timeout(12.0) == 10
+    # 残りがほとんどなくても最小の刻みは待つ
+    assert get_read_timeout(1.0) == BedrockClientConfig.READ_TIMEOUT_STEP_SECONDS
+
+
+def test_read_timeout_without_deadline_uses_configured_cap() -> None:
+    assert get_read_timeout(math.inf) == BedrockClientConfig.READ_TIMEOUT_SECONDS
+
+
+class FakeConverseClient:
+    """Converse APIの代わりに、メッセージのテキストを大文字にして返す（同時に呼ばれた数も記録する）"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.requests: List[Dict[str, Any]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def converse(self, **request: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.requests.append(request)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency_seconds)
+            text = request["messages"][0]["content"][0]["text"]
+            if text == "fail":
+                raise RuntimeError("ThrottlingException")
+            return {
+                "output": {"message": {"role": "assistant", "content": [{"text": text.upper()}, {"text": "!"}]}},
+                "stopReason": "end_turn",
+                "usage": {"inputTokens": 10, "outputTokens": 2, "cacheReadInputTokens": 4, "totalTokens": 12},
+                "metrics": {"latencyMs": 42}
+            }
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def user_message(text: str) -> Dict[str, Any]:
+    return {"role": "user", "content": [{"text": text}]}
+
+
+def test_converse_builds_request_and_parses_response() -> None:
+    client = FakeConverseClient()
+
+    result = converse("model", [user_message("hello")], system=[{"text": "sys"}], max_tokens=100, client=client)
+
+    assert client.requests == [{
+        "modelId": "model",
+        "messages": [user_message("hello")],
+        "system": [{"text": "sys"}],
+        "inferenceConfig": {"maxTokens": 100}
+    }]
+    assert result == {
+        "text": "HELLO!",
+        "stopReason": "end_turn",
+        "usage": {"inputTokens": 10, "outputTokens": 2, "cacheReadInputTokens": 4, "cacheWriteInputTokens": 0},
+        "latencyMs": 42
+    }
+
+
+def test_aconverse_many_keeps_order_and_limits_concurrency() -> None:
+    client = FakeConverseClient(latency_seconds=0.02)
+    requests = [{"model_id": "model", "messages": [user_message(f"item{i}")], "client": client} for i in range(8)]
+
+    results = asyncio.run(aconverse_many(requests, max_concurrency=3))
+
+    assert [result["text"] for result in results] == [f"ITEM{i}!" for i in range(8)]
+    assert client.max_in_flight <= 3
+
+
+def test_aconverse_many_returns_failures_in_place() -> None:
+    client = FakeConverseClient()
+    requests = [{"model_id": "model", "messages": [user_message(text)], "client": client} for text in ["a", "fail", "b"]]
+
+    results = asyncio.run(aconverse_many(requests, return_exceptions=True))
+
+    assert results[0]["text"] == "A!"
+    assert isinstance(results[1], RuntimeError)
+    assert results[2]["text"] == "B!"
+    with pytest.raises(RuntimeError):
+        asyncio.run(aconverse_many(requests))
@@ -0,0 +1,42 @@
+"""
+tools/bulk_evaluate.py の converse サブコマンドの並列呼び出しと結果の変換のテスト
+"""
+import os
+import sys
+from typing import Any, Dict
+
+from conftest import BACKEND_DIR
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tools"))
+import bulk_evaluate  # noqa: E402
+from local_stubs import StubBedrockClient  # noqa: E402
+
+ROUTE: Dict[str, Any] = {"task": "output_evaluation", "modelId": "stub", "reason": "converse"}
+
+
+class FailingClient:
+    def converse(self, **request: Any) -> Dict[str, Any]:
+        raise RuntimeError("ThrottlingException")
+
+
+def converse_request(text: str, client: Any) -> Dict[str, Any]:
+    return {"model_id": "stub", "messages": [{"role": "user", "content": [{"text": text}]}], "client": client}
+
+
+def test_converse_items_writes_results_in_request_order() -> None:
+    client = StubBedrockClient(latency_seconds=0.01)
+    requests = [
+        ("a", converse_request("短い記事", client)),
+        ("b", converse_request("失敗する記事", FailingClient())),
+        ("c", converse_request("もう少し長い記事です", client))
+    ]
+
+    records = bulk_evaluate.converse_items(requests, workers=2, prompt_version=3, route=ROUTE)
+
+    assert [record["id"] for record in records] == ["a", "b", "c"]
+    assert records[0]["output"].startswith("Level 200")
+    assert records[0]["promptVersion"] == 3
+    assert records[0]["routes"] == [ROUTE]
+    assert records[0]["usage"]["outputTokens"] == 16
+    assert records[1] == {"id": "b", "error": "RuntimeError: ThrottlingException"}
+    assert "error" not in records[2]
@@ -0,0 +1,235 @@
+import json
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils import secrets
+from utils.cache import RefreshAheadCache
+
+
+class FakeClock:
+    """時刻を手動で進める時計"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class CountingLoader:
+    """呼ばれた回数を値として返すloader（failをTrueにすると失敗する）"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.fail = False
+        self.called = threading.Event()
+
+    def __call__(self, key: object) -> str:
+        self.calls += 1
+        self.called.set()
+        if self.fail:
+            raise RuntimeError("loader failed")
+        return f"{key}-{self.calls}"
+
+    def wait_for_call(self) -> None:
+        """バックグラウンド更新でloaderが呼ばれるまで待つ"""
+        assert self.called.wait(timeout=5)
+        self.called.clear()
+
+
+def wait_until(condition: Callable[[], bool]) -> None:
+    event = threading.Event()
+    for _ in range(500):
+        if condition():
+            return
+        event.wait(0.01)
+    raise AssertionError("条件を満たしませんでした")
+
+
+def create_cache(loader: CountingLoader, clock: FakeClock, **kwargs: float) -> RefreshAheadCache[str]:
+    return RefreshAheadCache(loader, ttl_seconds=10, clock=clock, **kwargs)
+
+
+def test_value_is_reloaded_after_ttl() -> None:
+    loader, clock = CountingLoader(), FakeClock()
+    cache = create_cache(loader, clock)
+
+    assert cache.get("key") == "key-1"
+    clock.now = 9.9
+    assert cache.get("key") == "key-1"
+    assert loader.calls == 1
+
+    clock.now = 10.0
+    assert cache.get("key") == "key-2"
+    assert loader.calls == 2
+
+
+def test_refresh_ahead_returns_cached_value_and_reloads_in_background() -> None:
+    loader, clock = CountingLoader(), FakeClock()
+    cache = create_cache(loader, clock, refresh_ahead_seconds=3)
+    cache.get("key")
+    loader.called.clear()
+
+    # TTLの残りが3秒を切ると、キャッシュの値を返しつつ裏で更新する
+    clock.now = 7.5
+    assert cache.get("key") == "key-1"
+    loader.wait_for_call()
+    wait_until(lambda: cache.get("key") == "key-2")
+    assert loader.calls == 2
+
+
+def test_stale_while_revalidate_returns_expired_value_while_reloading() -> None:
+    loader, clock = CountingLoader(), FakeClock()
+    cache = create_cache(loader, clock, stale_while_revalidate_seconds=5)
+    cache.get("key")
+    loader.called.clear()
+
+    clock.now = 12.0
+    assert cache.get("key") == "key-1"
+    loader.wait_for_call()
+    wait_until(lambda: cache.get("key") == "key-2")
+
+
+def test_stale_if_error_falls_back_until_window_ends() -> None:
+    loader, clock = CountingLoader(), FakeClock()
+    cache = create_cache(loader, clock, stale_if_error_seconds=5)
+    cache.get("key")
+    loader.fail = True
+
+    clock.now = 14.9
+    assert cache.get("key") == "key-1"
+
+    clock.now = 15.0
+    with pytest.raises(RuntimeError, match="loader failed"):
+        cache.get("key")
+
+
+def test_first_load_failure_is_raised() -> None:
+    loader, clock = CountingLoader(), FakeClock()
+    loader.fail = True
+    cache = create_cache(loader, clock, stale_if_error_seconds=5)
+
+    with pytest.raises(RuntimeError):
+        cache.get("key")
+
+
+class FakeSession:
+    """Secrets拡張機能の代わりに固定の応答を返す"""
+
+    def __init__(self, status_code: int = 200):
+        self.status_code = status_code
+        self.urls: List[str] = []
+
+    def get(self, url: str, headers: Dict[str, Any], timeout: Tuple[float, float]) -> SimpleNamespace:
+        self.urls.append(url)
+        secret = json.dumps({"LANGFUSE_SECRET_KEY": "sk", "LANGFUSE_PUBLIC_KEY": "pk"})
+        return SimpleNamespace(status_code=self.status_code, text=json.dumps({"SecretString": secret}))
+
+
+@pytest.fixture
+def secret_session(monkeypatch: pytest.MonkeyPatch) -> Iterator[FakeSession]:
+    pytest.importorskip("requests")
+    session = FakeSession()
+    monkeypatch.setenv("LANGFUSE_SECRET_NAME", "langfuse")
+    monkeypatch.setattr(secrets, "get_secrets_session", lambda: session)
+    secrets._secret_cache.invalidate()
+    yield session
+    secrets._secret_cache.invalidate()
+
+
+def test_secrets_are_fetched_once_per_warm_container(secret_session: FakeSession) -> None:
+    assert secrets.get_secrets() == {"LANGFUSE_SECRET_KEY": "sk", "LANGFUSE_PUBLIC_KEY": "pk"}
+    assert secrets.get_secrets()["LANGFUSE_PUBLIC_KEY"] == "pk"
+    assert len(secret_session.urls) == 1
+    assert secret_session.urls[0].endswith("secretId=langfuse")
+
+
+def test_secret_fetch_failure_without_cached_value_is_raised(secret_session: FakeSession) -> None:
+    secret_session.status_code = 500
+
+    with pytest.raises(secrets.SecretError):
+        secrets.get_secrets()
+
+
+class FakePromptSource:
+    """Langfuseの代わりに、現在のバージョンのプロンプトを返す（downをTrueにすると失敗する）"""
+
+    def __init__(self) -> None:
+        self.version = 1
+        self.down = False
+        self.calls = 0
+        self.called = threading.Event()
+
+    def get_prompt(self, name: str) -> SimpleNamespace:
+        self.calls += 1
+        self.called.set()
+        if self.down:
+            raise ConnectionError("langfuse unavailable")
+        return SimpleNamespace(version=self.version)
+
+
+@pytest.fixture
+def prompt_cache(monkeypatch: pytest.MonkeyPatch) -> FakeClock:
+    """プロンプトのキャッシュを時計を差し替えたものにし、プロンプトテンプレートの構築を省く"""
+    from utils import llm
+
+    clock = FakeClock()
+    monkeypatch.setattr(llm, "_prompt_cache", RefreshAheadCache(
+        None,
+        ttl_seconds=llm.PromptCacheConfig.TTL_SECONDS,
+        stale_while_revalidate_seconds=llm.PromptCacheConfig.STALE_WHILE_REVALIDATE_SECONDS,
+        stale_if_error_seconds=llm.PromptCacheConfig.STALE_WHILE_REVALIDATE_SECONDS,
+        clock=clock
+    ))
+    monkeypatch.setattr(
+        llm,
+        "compile_prompt",
+        lambda langfuse, name: llm.CompiledPrompt(langfuse.get_prompt(name).version, None)
+    )
+    return clock
+
+
+def test_prompt_is_fetched_once_within_ttl(prompt_cache: FakeClock) -> None:
+    from utils.llm import PromptCacheConfig, get_compiled_prompt
+
+    langfuse = FakePromptSource()
+    assert get_compiled_prompt(langfuse, "output_evaluation").version == 1
+    langfuse.version = 2
+    prompt_cache.now = PromptCacheConfig.TTL_SECONDS - 1
+    assert get_compiled_prompt(langfuse, "output_evaluation").version == 1
+    assert langfuse.calls == 1
+
+
+def test_expired_prompt_is_served_stale_while_revalidating(prompt_cache: FakeClock) -> None:
+    from utils.llm import PromptCacheConfig, get_compiled_prompt
+
+    langfuse = FakePromptSource()
+    get_compiled_prompt(langfuse, "output_evaluation")
+    langfuse.called.clear()
+    langfuse.version = 2
+
+    # 期限切れ直後は古いバージョンをすぐに返し、裏で新しいバージョンを取得する
+    prompt_cache.now = PromptCacheConfig.TTL_SECONDS + 1
+    assert get_compiled_prompt(langfuse, "output_evaluation").version == 1
+    assert langfuse.called.wait(timeout=5)
+    wait_until(lambda: get_compiled_prompt(langfuse, "output_evaluation").version == 2)
+
+
+def test_stale_prompt_is_used_while_langfuse_is_down(prompt_cache: FakeClock) -> None:
+    from utils.llm import PromptCacheConfig, get_compiled_prompt
+
+    langfuse = FakePromptSource()
+    get_compiled_prompt(langfuse, "output_evaluation")
+    langfuse.down = True
+
+    prompt_cache.now = PromptCacheConfig.TTL_SECONDS + 1
+    assert get_compiled_prompt(langfuse, "output_evaluation").version == 1
+
+    # 古い値を使える期間を過ぎたら取得の失敗をそのまま送出する
+    prompt_cache.now = PromptCacheConfig.TTL_SECONDS + PromptCacheConfig.STALE_WHILE_REVALIDATE_SECONDS
+    with pytest.raises(ConnectionError):
+        get_compiled_prompt(langfuse, "output_evaluation")
@@ -0,0 +1,126 @@
+from types import SimpleNamespace
+from typing import Any, List
+
+import pytest
+
+from conftest import load_handler
+from utils.model_routing import ModelRoute
+
+app = load_handler("evaluate")
+
+
+@pytest.fixture
+def served_by(monkeypatch: pytest.MonkeyPatch) -> List[str]:
+    """invoke_bedrockを置き換え、リストの先頭のモデルが応答したことにする"""
+    models: List[str] = []
+    route = ModelRoute("evaluate", "small", "primary-model", "fallback-model", "test")
+    router = SimpleNamespace(route=lambda task, tokens: route)
+
+    def invoke_bedrock(call: Any, deadline: Any = None) -> tuple:
+        model_id = models.pop(0)
+        return f"{model_id}の評価", model_id
+
+    monkeypatch.setattr(app, "_result_cache", app.create_store("memory", 16))
+    monkeypatch.setattr(app, "get_model_router", lambda task_tiers: router)
+    monkeypatch.setattr(app, "get_compiled_prompt", lambda langfuse, name: SimpleNamespace(version=1))
+    monkeypatch.setattr(app, "create_usage_collector", lambda: SimpleNamespace(usage=app.empty_usage()))
+    monkeypatch.setattr(app, "invoke_bedrock", invoke_bedrock)
+    return models
+
+
+def test_fallback_result_is_not_cached_for_primary_model(served_by: List[str]) -> None:
+    served_by.extend(["fallback-model", "primary-model"])
+
+    first = app.evaluate_output(None, "短いブログ記事", None)
+    assert first["output"] == "fallback-modelの評価"
+    assert first["cacheHit"] is False
+
+    second = app.evaluate_output(None, "短いブログ記事", None)
+    assert second["output"] == "primary-modelの評価"
+    assert second["cacheHit"] is False
+
+    third = app.evaluate_output(None, "短いブログ記事", None)
+    assert third["output"] == "primary-modelの評価"
+    assert third["cacheHit"] is True
+
+
+class StubChain:
+    """build_chainの代わりに、チャンク番号つきの評価メモか、全体評価に渡された入力をそのまま返す"""
+
+    def __init__(self, calls: List[Any], fail_chunk: int = 0):
+        self.calls = calls
+        self.fail_chunk = fail_chunk
+
+    def invoke(self, input: Any, config: Any = None) -> str:
+        self.calls.append(input)
+        if "chunk_evaluations" in input:
+            return input["chunk_evaluations"]
+        if input["chunk_index"] == self.fail_chunk:
+            raise RuntimeError("chunk failed")
+        return f"メモ{input['chunk_index']}:{input['blog_content'][:1]}"
+
+
+@pytest.fixture
+def long_input(monkeypatch: pytest.MonkeyPatch) -> str:
+    """長文評価のしきい値を下げ、1行10トークンの行を40行並べたコンテンツを返す"""
+    monkeypatch.setattr(app.LongInputConfig, "THRESHOLD_TOKENS", 100)
+    monkeypatch.setattr(app.LongInputConfig, "CHUNK_TOKENS", 50)
+    monkeypatch.setattr(app.LongInputConfig, "MAX_CONCURRENCY", 4)
+    return "".join(f"{chr(ord('あ') + i)}" * 9 + "\n" for i in range(40))
+
+
+@pytest.fixture
+def stub_llm(monkeypatch: pytest.MonkeyPatch) -> SimpleNamespace:
+    """Bedrockを呼ばずにスタブのチェーンで評価し、チェーンに渡した入力を記録する"""
+    callbacks = pytest.importorskip("langchain_core.callbacks")
+    calls: List[Any] = []
+    route = ModelRoute("evaluate", "large", "primary-model", "fallback-model", "test")
+    monkeypatch.setattr(app, "_result_cache", app.create_store("memory", 16))
+    monkeypatch.setattr(app, "get_model_router", lambda task_tiers: SimpleNamespace(route=lambda task, tokens: route))
+    monkeypatch.setattr(app, "get_compiled_prompt", lambda langfuse, name: SimpleNamespace(version=1))
+    monkeypatch.setattr(app, "invoke_bedrock", lambda call, deadline=None: call())
+    monkeypatch.setattr(app, "build_chain", lambda compiled, max_tokens, model_id, deadline=None: StubChain(calls))
+    return SimpleNamespace(calls=calls, handler=callbacks.BaseCallbackHandler())
+
+
+def test_plan_chunks_fits_in_one_wave(long_input: str) -> None:
+    # 400トークンを50トークンずつに分けると8個になるため、4個に収まるようチャンクを大きくする
+    chunks = app.plan_chunks(long_input, app.estimate_tokens(long_input))
+    assert len(chunks) == 4
+    assert "".join(chunks) == long_input
+
+
+def test_long_input_collects_chunk_evaluations_in_order(long_input: str, stub_llm: SimpleNamespace) -> None:
+    result = app.evaluate_output(None, long_input, stub_llm.handler)
+
+    assert result["chunkCount"] == 4
+    map_calls = [call for call in stub_llm.calls if "chunk_index" in call]
+    assert sorted(call["chunk_index"] for call in map_calls) == [1, 2, 3, 4]
+    assert all(call["chunk_count"] == 4 for call in map_calls)
+    # 並列実行の完了順に関わらず、チャンクの順番どおりに結合して全体評価に渡す
+    chunks = app.plan_chunks(long_input, app.estimate_tokens(long_input))
+    assert result["output"] == "\n\n".join(
+        f"<パート{index}>\nメモ{index}:{chunk[0]}\n</パート{index}>"
+        for index, chunk in enumerate(chunks, start=1)
+    )
+
+
+def test_failed_chunk_fails_the_evaluation(
+    long_input: str, stub_llm: SimpleNamespace, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(
+        app, "build_chain", lambda compiled, max_tokens, model_id, deadline=None: StubChain(stub_llm.calls, fail_chunk=2)
+    )
+
+    with pytest.raises(app.EvaluationError, match="chunk failed"):
+        app.evaluate_output(None, long_input, stub_llm.handler)
+    # 全体評価は呼ばない
+    assert not any("chunk_evaluations" in call for call in stub_llm.calls)
+
+
+def test_long_input_without_enough_time_is_rejected(long_input: str, stub_llm: SimpleNamespace) -> None:
+    deadline = app.Deadline(lambda: 5000)
+
+    with pytest.raises(app.InputTooLargeError):
+        app.evaluate_output(None, long_input, stub_llm.handler, deadline)
+    assert stub_llm.calls == []
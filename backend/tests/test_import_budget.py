@@ -0,0 +1,28 @@
+"""
+tools/import_budget.py のチェック（import時間の予算と遅延importのルール）をpytestから実行する
+
+Lambdaレイヤーを展開済みの場合は layers/langchain/python もimportパスに追加する。
+追加のパスは環境変数 IMPORT_BUDGET_PATHS（os.pathsep区切り）でも指定できる
+"""
+import os
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tools"))
+import import_budget  # noqa: E402
+
+LAYER_PATH = os.path.join(BACKEND_DIR, "layers", "langchain", "python")
+EXTRA_PATHS = [
+    *(path for path in os.environ.get("IMPORT_BUDGET_PATHS", "").split(os.pathsep) if path),
+    *([LAYER_PATH] if os.path.isdir(LAYER_PATH) else [])
+]
+
+
+@pytest.mark.parametrize("handler", list(import_budget.DEFAULT_BUDGETS_MS))
+def test_handler_import_budget(handler: str) -> None:
+    reports = [import_budget.measure_handler(handler, EXTRA_PATHS) for _ in range(3)]
+    report = min(reports, key=lambda r: r.total_ms)
+    assert import_budget.check_handler(report, import_budget.DEFAULT_BUDGETS_MS[handler]) == []
@@ -0,0 +1,220 @@
+from typing import Iterator, List
+
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils import invocation
+from utils.invocation import (
+    AdmissionController,
+    AdmissionRejectedError,
+    Deadline,
+    ErrorKind,
+    classify_error,
+    invoke_with_retry
+)
+
+
+class FakeClock:
+    """時刻を手動で進める時計（sleepすると進む）"""
+
+    def __init__(self) -> None:
+        self.now = 0.0
+        self.sleeps: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def create_admission(max_in_flight: int = 1) -> AdmissionController:
+    clock = FakeClock()
+    return AdmissionController(
+        rate_per_second=100,
+        burst=100,
+        max_in_flight=max_in_flight,
+        max_wait_seconds=0.0,
+        clock=clock,
+        sleep=clock.sleep
+    )
+
+
+def stream(chunks: List[str], closed: List[bool]) -> Iterator[str]:
+    try:
+        yield from chunks
+    finally:
+        closed.append(True)
+
+
+def test_stream_holds_admission_slot_until_exhausted() -> None:
+    admission = create_admission()
+    closed: List[bool] = []
+
+    iterator = invoke_with_retry(lambda: stream(["a", "b"], closed), Deadline(), admission)
+    assert next(iterator) == "a"
+    # 読み終わるまでは次の呼び出しが枠を確保できない
+    with pytest.raises(AdmissionRejectedError):
+        invoke_with_retry(lambda: "other", Deadline(), admission)
+
+    assert list(iterator) == ["b"]
+    assert closed == [True]
+    assert invoke_with_retry(lambda: "other", Deadline(), admission) == "other"
+
+
+def test_closed_or_failed_stream_releases_admission_slot() -> None:
+    admission = create_admission()
+    closed: List[bool] = []
+
+    iterator = invoke_with_retry(lambda: stream(["a", "b"], closed), Deadline(), admission)
+    next(iterator)
+    iterator.close()
+    assert closed == [True]
+    assert invoke_with_retry(lambda: "other", Deadline(), admission) == "other"
+
+    def failing_stream() -> Iterator[str]:
+        yield "a"
+        raise RuntimeError("stream broken")
+
+    iterator = invoke_with_retry(failing_stream, Deadline(), admission)
+    with pytest.raises(RuntimeError):
+        list(iterator)
+    assert invoke_with_retry(lambda: "other", Deadline(), admission) == "other"
+
+
+def test_unread_stream_releases_admission_slot_when_discarded() -> None:
+    admission = create_admission()
+
+    invoke_with_retry(lambda: iter(["a"]), Deadline(), admission)
+
+    assert invoke_with_retry(lambda: "other", Deadline(), admission) == "other"
+
+
+class FakeClientError(Exception):
+    """botocoreのClientErrorと同じ形のエラー"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class ReadTimeoutError(Exception):
+    """botocoreの同名の例外の代わり（分類は例外のクラス名で行う）"""
+
+
+class FlakyCall:
+    """指定した例外を順に送出してから成功する呼び出し"""
+
+    def __init__(self, errors: List[Exception]):
+        self.errors = errors
+        self.calls = 0
+
+    def __call__(self) -> str:
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def max_jitter(monkeypatch: pytest.MonkeyPatch) -> None:
+    """フルジッターの待ち時間を常に上限にする"""
+    monkeypatch.setattr(invocation.random, "uniform", lambda low, high: high)
+
+
+def test_classify_error() -> None:
+    assert classify_error(FakeClientError("ThrottlingException")) == ErrorKind.THROTTLED
+    assert classify_error(FakeClientError("ModelTimeoutException")) == ErrorKind.RETRYABLE
+    assert classify_error(FakeClientError("ValidationException")) == ErrorKind.FATAL
+    assert classify_error(ReadTimeoutError()) == ErrorKind.RETRYABLE
+    # LangChainなどでラップされた例外も元の例外で分類する
+    try:
+        try:
+            raise FakeClientError("ThrottlingException")
+        except FakeClientError as e:
+            raise RuntimeError("wrapped") from e
+    except RuntimeError as wrapped:
+        assert classify_error(wrapped) == ErrorKind.THROTTLED
+    assert classify_error(ValueError("bug")) == ErrorKind.FATAL
+
+
+def test_retries_with_exponential_backoff(max_jitter: None) -> None:
+    clock = FakeClock()
+    call = FlakyCall([FakeClientError("ThrottlingException"), ReadTimeoutError(), FakeClientError("ServiceUnavailableException")])
+
+    assert invoke_with_retry(call, max_attempts=4, base_delay_seconds=0.5, max_delay_seconds=1.5, sleep=clock.sleep) == "ok"
+    assert call.calls == 4
+    assert clock.sleeps == [0.5, 1.0, 1.5]
+
+
+def test_fatal_error_is_not_retried() -> None:
+    clock = FakeClock()
+    call = FlakyCall([FakeClientError("ValidationException")])
+
+    with pytest.raises(FakeClientError):
+        invoke_with_retry(call, sleep=clock.sleep)
+    assert call.calls == 1
+    assert clock.sleeps == []
+
+
+def test_retries_stop_at_max_attempts(max_jitter: None) -> None:
+    clock = FakeClock()
+    call = FlakyCall([FakeClientError("ThrottlingException") for _ in range(5)])
+
+    with pytest.raises(FakeClientError):
+        invoke_with_retry(call, max_attempts=3, sleep=clock.sleep)
+    assert call.calls == 3
+    assert len(clock.sleeps) == 2
+
+
+def test_retry_is_abandoned_when_deadline_is_near(max_jitter: None) -> None:
+    clock = FakeClock()
+    call = FlakyCall([FakeClientError("ThrottlingException")])
+
+    # 待ち時間（0.5秒）の後に安全マージン（3秒）が残らない
+    with pytest.raises(FakeClientError):
+        invoke_with_retry(call, Deadline(lambda: 3400), sleep=clock.sleep)
+    assert call.calls == 1
+
+
+def test_admission_slot_is_released_when_call_fails() -> None:
+    admission = create_admission(max_in_flight=1)
+
+    with pytest.raises(FakeClientError):
+        invoke_with_retry(FlakyCall([FakeClientError("ValidationException")]), Deadline(), admission)
+
+    assert invoke_with_retry(lambda: "next", Deadline(), admission) == "next"
+
+
+def test_admission_waits_for_tokens_then_rejects() -> None:
+    clock = FakeClock()
+    sleeps: List[float] = []
+    # 待っても時計を進めず、同時に届いたリクエストとして扱う
+    admission = AdmissionController(
+        rate_per_second=2,
+        burst=1,
+        max_in_flight=4,
+        max_wait_seconds=0.5,
+        clock=clock,
+        sleep=sleeps.append
+    )
+
+    with admission.admit():
+        pass
+    # 次のトークンが貯まるまでの0.5秒は待つ
+    with admission.admit():
+        pass
+    assert sleeps == [0.5]
+
+    # 3件目は待ち時間（1秒）が上限を超えるため、待たずに断る
+    with pytest.raises(AdmissionRejectedError) as rejected:
+        with admission.admit():
+            pass
+    assert rejected.value.retry_after == 1.0
+    assert sleeps == [0.5]
+
+    # トークンが貯まれば再び受け付ける
+    clock.now = 1.0
+    with admission.admit():
+        pass
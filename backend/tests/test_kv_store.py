@@ -0,0 +1,18 @@
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils.kv_store import KeyValueStore, MemoryLRUStore
+
+
+def test_base_store_cannot_be_instantiated() -> None:
+    with pytest.raises(TypeError):
+        KeyValueStore()  # type: ignore[abstract]
+
+
+def test_memory_store_expires_entries() -> None:
+    now = [0.0]
+    store = MemoryLRUStore(clock=lambda: now[0])
+    store.set("key", {"value": 1}, ttl_seconds=10)
+    assert store.get("key") == {"value": 1}
+    now[0] = 10
+    assert store.get("key") is None
@@ -0,0 +1,115 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("PDF_BUCKET_NAME", "test-bucket")
+
+from conftest import BACKEND_DIR, load_handler
+
+sys.path.insert(0, os.path.join(BACKEND_DIR, "tools"))
+from benchmark_handlers import build_pdf  # noqa: E402
+from local_stubs import InMemoryS3  # noqa: E402
+
+app = load_handler("load_pdf")
+
+
+def test_budget_defaults_to_unlimited() -> None:
+    assert app.ExtractConfig.TOKEN_BUDGET == 0
+    assert app.get_extract_options({})["budget_tokens"] == 0
+    assert app.get_extract_options({"budgetTokens": 0})["budget_tokens"] == 0
+    assert app.get_extract_options({"budgetTokens": 500})["budget_tokens"] == 500
+
+
+def test_server_budget_caps_requests(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app.ExtractConfig, "TOKEN_BUDGET", 1000)
+    assert app.get_extract_options({})["budget_tokens"] == 1000
+    assert app.get_extract_options({"budgetTokens": 0})["budget_tokens"] == 1000
+    assert app.get_extract_options({"budgetTokens": 500})["budget_tokens"] == 500
+
+
+def test_response_reports_applied_budget() -> None:
+    import json
+    result = {"text": "本文", "pages": [1], "pageCount": 1, "estimatedTokens": 2, "truncated": False}
+    response = app.create_extraction_response(result, "pdfs/example.pdf", 1000)
+    assert json.loads(response["body"])["budgetTokens"] == 1000
+
+
+@pytest.fixture
+def two_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(app.ExtractConfig, "WORKERS", 2)
+    monkeypatch.setattr(app.ExtractConfig, "MIN_PAGES_PER_WORKER", 2)
+
+
+def test_parallel_extraction_keeps_page_order(two_workers: None) -> None:
+    pdf = build_pdf(10, lines_per_page=2)
+    serial = app.extract_page_texts(app.PdfReader(app.BytesIO(pdf)), list(range(10)))
+    result = app.extract_text_from_pdf(pdf, budget_tokens=0)
+    assert result["pages"] == list(range(1, 11))
+    assert result["text"] == "\n".join(serial).strip()
+
+
+def test_budgeted_extraction_uses_parallel_workers(two_workers: None, monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    original = app.extract_pages_parallel
+
+    def spy(reader, pdf_content, indices, workers):  # type: ignore[no-untyped-def]
+        calls.append(list(indices))
+        return original(reader, pdf_content, indices, workers)
+
+    monkeypatch.setattr(app, "extract_pages_parallel", spy)
+    pdf = build_pdf(20, lines_per_page=2)
+    page_tokens = app.estimate_tokens(app.extract_page_texts(app.PdfReader(app.BytesIO(pdf)), [0])[0])
+
+    result = app.extract_text_from_pdf(pdf, budget_tokens=page_tokens * 5)
+    assert result["truncated"] is True
+    assert result["pages"] == [1, 2, 3, 4, 5]
+    # 予算に達した後のまとまり（5ページ目以降）は抽出しない
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7]]
+
+
+@pytest.fixture
+def s3(monkeypatch: pytest.MonkeyPatch) -> InMemoryS3:
+    client = InMemoryS3()
+    monkeypatch.setattr(app, "get_s3_client", lambda: client)
+    return client
+
+
+def test_upload_url_limits_size_and_checksum(s3: InMemoryS3, monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    original = s3.generate_presigned_post
+
+    def spy(**kwargs):  # type: ignore[no-untyped-def]
+        calls.append(kwargs)
+        return original(**kwargs)
+
+    monkeypatch.setattr(s3, "generate_presigned_post", spy)
+    pdf_hash = "ab" * 32
+
+    upload = app.create_upload_url(pdf_hash)
+
+    assert upload["objectKey"] == f"uploads/{pdf_hash}.pdf"
+    assert upload["fields"]["Content-Type"] == "application/pdf"
+    assert ["content-length-range", 1, app.UploadConfig.MAX_BYTES] in calls[0]["Conditions"]
+    assert {"x-amz-checksum-sha256": upload["fields"]["x-amz-checksum-sha256"]} in calls[0]["Conditions"]
+
+
+def test_uploaded_non_pdf_is_rejected_and_deleted(s3: InMemoryS3) -> None:
+    import json
+    s3.put_object(Bucket="test-bucket", Key="uploads/not-a-pdf.pdf", Body=b"<html>not a pdf</html>")
+
+    response = app.lambda_handler({"body": json.dumps({"objectKey": "uploads/not-a-pdf.pdf"})}, None)
+
+    assert response["statusCode"] == 400
+    assert not app.object_exists("uploads/not-a-pdf.pdf")
+
+
+def test_uploaded_pdf_over_limit_is_rejected_and_deleted(s3: InMemoryS3, monkeypatch: pytest.MonkeyPatch) -> None:
+    import json
+    monkeypatch.setattr(app.UploadConfig, "MAX_BYTES", 100)
+    s3.put_object(Bucket="test-bucket", Key="uploads/large.pdf", Body=build_pdf(2))
+
+    response = app.lambda_handler({"body": json.dumps({"objectKey": "uploads/large.pdf"})}, None)
+
+    assert response["statusCode"] == 413
+    assert not app.object_exists("uploads/large.pdf")
@@ -0,0 +1,146 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, Tuple
+
+import pytest
+
+from conftest import load_handler
+
+app = load_handler("load_url")
+
+JAPANESE_TEXT = "Amazon S3 のバケットポリシーと IAM ロールを組み合わせて、アカウント間のアクセスを制御する手順を説明します。"
+
+
+def build_html(body: str, meta: str = "") -> str:
+    return f"<html><head>{meta}<title>テスト</title></head><body><p>{body}</p></body></html>"
+
+
+@pytest.fixture
+def serve() -> Iterator[Dict[str, Tuple[str, bytes]]]:
+    """パスごとに（Content-Type, ボディ）を返すHTTPサーバーを起動し、そのURLを pages["url"] に入れる（/slow で始まるパスは2秒待ってから返す）"""
+    pages: Dict[str, Tuple[str, bytes]] = {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.startswith("/slow"):
+                time.sleep(2)
+            content_type, body = pages[self.path.split("?")[0]]
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: object) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    pages["url"] = ("", f"http://127.0.0.1:{server.server_address[1]}".encode())
+    yield pages
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(pages: Dict[str, Tuple[str, bytes]], path: str) -> str:
+    html = app.fetch_page(pages["url"][1].decode() + path)["html"]
+    assert html is not None
+    return html
+
+
+def test_fetch_page_without_charset_utf8(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    serve["/utf8"] = ("text/html", build_html(JAPANESE_TEXT).encode("utf-8"))
+    assert JAPANESE_TEXT in fetch(serve, "/utf8")
+
+
+def test_fetch_page_without_charset_shift_jis(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    serve["/sjis"] = ("text/html", build_html(JAPANESE_TEXT * 20).encode("shift_jis"))
+    assert JAPANESE_TEXT in fetch(serve, "/sjis")
+
+
+def test_fetch_page_with_meta_charset(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    html = build_html(JAPANESE_TEXT, '<meta charset="euc-jp">')
+    serve["/meta"] = ("text/html", html.encode("euc-jp"))
+    assert JAPANESE_TEXT in fetch(serve, "/meta")
+
+
+def test_fetch_page_with_header_charset(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    serve["/header"] = ("text/html; charset=shift_jis", build_html(JAPANESE_TEXT).encode("shift_jis"))
+    assert JAPANESE_TEXT in fetch(serve, "/header")
+
+
+def invoke(body: Dict[str, object]) -> Dict[str, object]:
+    import json
+    response = app.lambda_handler({"httpMethod": "POST", "body": json.dumps(body)}, None)
+    return {"statusCode": response["statusCode"], **json.loads(response["body"])}
+
+
+def test_extract_mode_defaults_to_full(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    paragraphs = "".join(f"<p>{JAPANESE_TEXT}</p>" for _ in range(5))
+    html = f"<html><body><nav>メニュー</nav><article>{paragraphs}</article><footer>フッター</footer></body></html>"
+    serve["/article"] = ("text/html; charset=utf-8", html.encode("utf-8"))
+    url = serve["url"][1].decode() + "/article"
+
+    result = invoke({"url": url})
+    assert result["statusCode"] == 200
+    assert result["extractMode"] == "full"
+    assert "フッター" in result["message"]
+
+    result = invoke({"url": url, "extractMode": "main"})
+    assert result["extractMode"] == "main"
+    assert "フッター" not in result["message"]
+
+
+def test_page_wrapped_in_form_keeps_body_text() -> None:
+    paragraphs = "".join(f"<p>{JAPANESE_TEXT}</p>" for _ in range(5))
+    html = (
+        "<html><head><title>T</title></head><body><form><div><h1>見出し</h1>"
+        f"{paragraphs}</div><button>送信</button></form><form><input name='q'>検索</form></body></html>"
+    )
+
+    full = app.extract_text_from_html(html, "https://example.com/", "full")
+    assert "見出し" in full["text"]
+    assert JAPANESE_TEXT in full["text"]
+    assert "送信" in full["text"]
+
+    main = app.extract_text_from_html(html, "https://example.com/", "main")
+    assert main["extractMode"] == "main"
+    assert JAPANESE_TEXT in main["text"]
+    assert "検索" not in main["text"]
+
+
+def test_invalid_extract_mode_is_rejected() -> None:
+    result = invoke({"url": "http://127.0.0.1:9/", "extractMode": "summary"})
+    assert result["statusCode"] == 400
+
+
+class FakeContext:
+    def __init__(self, remaining_seconds: float):
+        self.deadline = time.monotonic() + remaining_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def test_batch_returns_partial_results_at_deadline(serve: Dict[str, Tuple[str, bytes]]) -> None:
+    import json
+    serve["/fast"] = ("text/html; charset=utf-8", build_html(JAPANESE_TEXT).encode("utf-8"))
+    serve["/slow"] = ("text/html; charset=utf-8", build_html(JAPANESE_TEXT).encode("utf-8"))
+    base = serve["url"][1].decode()
+    context = FakeContext(app.BatchConfig.RESPONSE_MARGIN_SECONDS + 0.5)
+
+    started_at = time.monotonic()
+    response = app.lambda_handler(
+        {"httpMethod": "POST", "body": json.dumps({"urls": [base + "/fast", base + "/slow"]})},
+        context
+    )
+    elapsed = time.monotonic() - started_at
+    result = json.loads(response["body"])
+
+    assert response["statusCode"] == 200
+    assert elapsed < 1.5
+    assert result["succeeded"] == 1
+    assert result["timedOut"] == 1
+    assert result["results"][0]["ok"] is True
+    assert result["results"][1]["errorCode"] == app.FetchErrorCode.TIMED_OUT
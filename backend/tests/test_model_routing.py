@@ -0,0 +1,20 @@
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils.model_routing import ModelTier, parse_task_tiers
+
+
+def test_parse_task_tiers_keeps_known_tiers() -> None:
+    assert parse_task_tiers('{"output_evaluation": "small", "tweet_generation": "auto"}') == {
+        "output_evaluation": ModelTier.SMALL,
+        "tweet_generation": ModelTier.AUTO
+    }
+    assert parse_task_tiers("") == {}
+
+
+def test_parse_task_tiers_ignores_invalid_settings() -> None:
+    # JSONとして読めない設定や、オブジェクトでない設定は上書きしない
+    assert parse_task_tiers('{"output_evaluation": "small"') == {}
+    assert parse_task_tiers('["small"]') == {}
+    # 不正な区分のタスクだけを無視する
+    assert parse_task_tiers('{"output_evaluation": "medium", "tweet_generation": "large"}') == {
+        "tweet_generation": ModelTier.LARGE
+    }
@@ -0,0 +1,35 @@
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils.prompts import build_chat_prompts, get_prompt_cache_min_tokens
+
+pytest.importorskip("langchain_core")
+
+SONNET = "us.anthropic.claude-sonnet-4-20250514-v1:0"
+HAIKU_3 = "us.anthropic.claude-3-haiku-20240307-v1:0"
+
+
+def build_template(prefix_chars: int) -> str:
+    return "あ" * prefix_chars + "\n\n# 評価対象\n{blog_content}"
+
+
+def test_short_prefix_keeps_single_user_message() -> None:
+    prompts = build_chat_prompts(build_template(400), {})
+    assert prompts.cached is None
+    messages = prompts.for_model(SONNET).format_messages(blog_content="本文")
+    assert [message.type for message in messages] == ["human"]
+
+
+def test_long_prefix_uses_cache_point_only_for_supported_models() -> None:
+    prompts = build_chat_prompts(build_template(1500), {})
+    assert prompts.cached is not None
+    assert [m.type for m in prompts.for_model(SONNET).format_messages(blog_content="本文")] == ["system", "human"]
+    # 最小トークン数が大きいモデル・キャッシュ非対応のモデルでは構成を変えない
+    assert prompts.for_model("us.anthropic.claude-3-5-haiku-20241022-v1:0") is prompts.plain
+    assert prompts.for_model(HAIKU_3) is prompts.plain
+
+
+def test_prompt_cache_min_tokens() -> None:
+    assert get_prompt_cache_min_tokens(SONNET) == 1024
+    assert get_prompt_cache_min_tokens("us.anthropic.claude-haiku-4-5-20251001-v1:0") == 4096
+    assert get_prompt_cache_min_tokens(HAIKU_3) is None
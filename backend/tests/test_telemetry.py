@@ -0,0 +1,26 @@
+import json
+
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils import metrics
+from utils.telemetry import DeferredFlusher, TelemetryMode
+
+
+def emf_lines(output: str) -> list:
+    return [json.loads(line) for line in output.splitlines() if line.startswith("{")]
+
+
+def test_dropped_flush_is_emitted_as_metric(capsys: pytest.CaptureFixture[str]) -> None:
+    flusher = DeferredFlusher(mode=TelemetryMode.DEFERRED, max_pending=1)
+
+    @metrics.instrument_handler("telemetry_test")
+    def handler(event: object, context: object) -> dict:
+        assert flusher.submit(lambda: None) is True
+        assert flusher.submit(lambda: None) is False
+        return {"statusCode": 200}
+
+    handler({}, None)
+    flusher.drain()
+    assert flusher.dropped_count == 1
+    assert [line["TelemetryDropped"] for line in emf_lines(capsys.readouterr().out) if "TelemetryDropped" in line] == [1]
@@ -0,0 +1,35 @@
+import pytest
+
+import conftest  # noqa: F401  src/shared をimportパスに追加する
+from utils.tokens import InputTooLargeError, OverflowMode, normalize_text, preflight_input
+
+NAV = "ホーム | ブログ | お問い合わせ | プライバシーポリシー"
+
+
+def test_consecutive_duplicate_lines_are_collapsed() -> None:
+    assert normalize_text(f"{NAV}\n{NAV}\n\n{NAV}\n本文") == f"{NAV}\n\n本文"
+
+
+def test_non_consecutive_duplicate_lines_are_kept() -> None:
+    text = f"{NAV}\n本文の段落です。\n{NAV}"
+    assert normalize_text(text) == text
+
+
+def test_fenced_code_is_kept_verbatim() -> None:
+    code = "```python\nfor bucket in s3.buckets.all():\n\n\n    print(bucket.name)   \n    print(bucket.name)   \n```"
+    assert normalize_text(f"説明\n{code}\n後書き") == f"説明\n{code}\n後書き"
+
+
+def test_table_rows_are_kept() -> None:
+    table = "| サービス | 料金 | 備考 |\n|---|---|---|\n| Lambda   | 0 円 | 無料枠 |\n| Lambda   | 0 円 | 無料枠 |"
+    assert normalize_text(table).count("| Lambda | 0 円 | 無料枠 |") == 2
+
+
+def test_preflight_trims_or_rejects_over_budget() -> None:
+    text = "あ" * 100
+    result = preflight_input(text, 40)
+    assert result["trimmed"] is True
+    assert result["inputTokens"] <= 40
+    assert result["keptRatio"] == pytest.approx(0.4)
+    with pytest.raises(InputTooLargeError):
+        preflight_input(text, 40, OverflowMode.REJECT)
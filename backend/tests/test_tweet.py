@@ -0,0 +1,45 @@
+import pytest
+
+from conftest import load_handler
+from utils import tweet
+from utils.llm_usage import empty_usage
+from utils.tokens import OverflowMode
+
+app = load_handler("tweet")
+
+
+def test_overlong_evaluation_is_rejected(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(tweet.TweetConfig, "INPUT_BUDGET_TOKENS", 10)
+    monkeypatch.setattr(tweet.TweetConfig, "OVERFLOW_MODE", OverflowMode.REJECT)
+    with pytest.raises(app.InputTooLargeError):
+        app.generate_tweet(None, "評価結果" * 10, None)
+
+
+def test_trace_metadata_failure_does_not_fail_request(monkeypatch: pytest.MonkeyPatch) -> None:
+    import json
+    from types import SimpleNamespace
+
+    for name in app.REQUIRED_ENV_VARS:
+        monkeypatch.setenv(name, "test")
+
+    def failing_trace(**kwargs):  # type: ignore[no-untyped-def]
+        raise RuntimeError("langfuse unavailable")
+
+    langfuse = SimpleNamespace(trace=failing_trace, flush=lambda: None)
+    handler = SimpleNamespace(get_trace_id=lambda: "trace-1", flush=lambda: None)
+    monkeypatch.setattr(app, "get_secrets", lambda: {})
+    monkeypatch.setattr(app, "setup_langfuse", lambda secret, email, session_id: (handler, langfuse))
+    monkeypatch.setattr(app, "generate_tweet", lambda *args: {
+        "output": "ツイート",
+        "promptVersion": 1,
+        "usage": empty_usage(),
+        "route": {},
+        "inputTokens": 3,
+        "keptRatio": 1.0,
+        "trimmed": False
+    })
+
+    response = app.lambda_handler({"body": json.dumps({"evalResult": "評価結果"})}, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["message"] == "ツイート"
@@ -0,0 +1,475 @@
+"""
+4つのLambdaハンドラー（evaluate / tweet / load_url / load_pdf）をローカルで実行して性能を計測するスクリプト
+
+AWSやLangfuseにはつながず、tools/local_stubs.py の代替実装を使う。
+- Secrets拡張機能: localhost:2773 のHTTPサーバー
+- Bedrock: 応答時間を指定できる固定応答のチャットモデル（--llm-latency-ms）
+- Langfuse: プロンプト取得とトレース送信を受け付けるHTTPサーバー（プロンプトは prompts/*.txt）
+- S3: moto（インストールされていない場合はメモリ上の代替）
+- URLの取得先: 固定のHTMLを返すHTTPサーバー
+
+ハンドラーと入力サイズの組み合わせごとに別プロセスで実行し、
+- コールドスタート時のimport時間（coldImportMs）と最初の呼び出し時間（firstInvokeMs）
+- ウォーム呼び出しのp50 / p95 / p99（キャッシュに当たらないよう、呼び出しごとに入力を少し変える）
+- レスポンス返却後に行うテレメトリ送信の時間のp50（deferredFlushP50Ms。Lambdaの拡張機能と同じく、
+  次の呼び出しの前に計測対象外で済ませる）
+- プロセスの最大RSS（peakRssMb。ページ抽出の子プロセスを含む）
+を計測する。--baseline を指定すると保存済みの結果と比較し、悪化していれば終了コード1で終了する。
+
+使い方（backendディレクトリで実行）:
+    python tools/benchmark_handlers.py --path layers/langchain/python
+    python tools/benchmark_handlers.py evaluate load_pdf --iterations 50 --llm-latency-ms 800
+    python tools/benchmark_handlers.py --save-baseline tools/benchmark_baseline.json
+    python tools/benchmark_handlers.py --baseline tools/benchmark_baseline.json --tolerance 0.2
+"""
+import argparse
+import base64
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS_DIR = os.path.join(BACKEND_DIR, "src", "handlers")
+SHARED_DIR = os.path.join(BACKEND_DIR, "src", "shared")
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+PROMPTS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "prompts")
+
+# ハンドラーごとの入力サイズ（evaluate / tweet は文字数、load_url はHTMLのバイト数、load_pdf はページ数）
+FIXTURE_SIZES: Dict[str, Dict[str, int]] = {
+    # long は LONG_INPUT_THRESHOLD_TOKENS を超え、チャンクごとに評価するmap-reduce方式になる
+    "evaluate": {"small": 1500, "medium": 20000, "long": 70000},
+    "tweet": {"small": 500, "medium": 3000},
+    "load_url": {"small": 10 * 1024, "medium": 200 * 1024, "large": 2 * 1024 * 1024},
+    "load_pdf": {"small": 5, "medium": 50, "large": 300},
+}
+
+# template.yaml のハンドラーごとのメモリサイズ（ページ抽出のワーカー数の決定に使われる）
+MEMORY_SIZES_MB: Dict[str, int] = {
+    "evaluate": 512,
+    "tweet": 512,
+    "load_url": 256,
+    "load_pdf": 3008,
+}
+
+# 比較する指標と、悪化とみなさない絶対値の差（ミリ秒またはMB）
+COMPARED_METRICS: Dict[str, float] = {
+    "coldImportMs": 20.0,
+    "firstInvokeMs": 20.0,
+    "p50Ms": 5.0,
+    "p95Ms": 10.0,
+    "p99Ms": 10.0,
+    "deferredFlushP50Ms": 10.0,
+    "peakRssMb": 10.0,
+}
+
+LANGFUSE_SECRET_NAME = "benchmark-langfuse"
+PDF_BUCKET_NAME = "benchmark-pdf"
+STUB_MODEL_ID = "stub"
+
+
+def build_evaluate_text(chars: int) -> str:
+    """
+    評価対象のブログ記事の代わりのテキストを生成する（重複行として削除されないよう行ごとに変える）
+
+    Args:
+        chars (int): おおよその文字数
+
+    Returns:
+        str: テキスト
+    """
+    lines = []
+    total = 0
+    index = 0
+    while total < chars:
+        index += 1
+        line = f"{index}. Amazon S3 のバケットポリシーと IAM ロールを組み合わせて、アカウント間のアクセスを制御する手順を説明します。"
+        lines.append(line)
+        total += len(line) + 1
+    return "\n".join(lines)
+
+
+def build_html(size_bytes: int) -> bytes:
+    """
+    本文・ナビゲーション・フッターを持つHTMLを生成する
+
+    Args:
+        size_bytes (int): おおよそのバイト数
+
+    Returns:
+        bytes: HTML
+    """
+    paragraphs = []
+    total = 0
+    index = 0
+    while total < size_bytes:
+        index += 1
+        paragraph = (
+            f"<p>段落{index}: AWS Lambda のコールドスタートを短くするには、依存ライブラリの読み込みを遅らせ、"
+            f"初期化処理をハンドラーの外に置いてコンテナ間で使い回します。</p>"
+        )
+        paragraphs.append(paragraph)
+        total += len(paragraph.encode("utf-8"))
+    nav = "".join(f'<li><a href="/post/{i}">関連記事{i}</a></li>' for i in range(30))
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>ベンチマーク用の記事</title></head><body>"
+        f"<header><nav><ul>{nav}</ul></nav></header>"
+        f"<main><article><h1>ベンチマーク用の記事</h1>{''.join(paragraphs)}</article></main>"
+        "<footer>© benchmark</footer></body></html>"
+    ).encode("utf-8")
+
+
+def build_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """
+    各ページに英文のテキストを持つPDFを生成する
+
+    Args:
+        pages (int): ページ数
+        lines_per_page (int): 1ページあたりの行数
+
+    Returns:
+        bytes: PDF
+    """
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # ページツリーは後で埋める
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for page in range(pages):
+        lines = [
+            f"({page + 1}-{line + 1} Amazon DynamoDB partition keys spread write traffic across partitions.) Tj T*"
+            for line in range(lines_per_page)
+        ]
+        stream = ("BT /F1 10 Tf 12 TL 40 800 Td " + " ".join(lines) + " ET").encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        pdf += b"%010d 00000 n \n" % offset
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    return bytes(pdf)
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    """
+    パーセンタイルを求める（最近傍法）
+
+    Args:
+        values (List[float]): 値の一覧
+        ratio (float): 0〜1の割合
+
+    Returns:
+        float: パーセンタイル値
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(ratio * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb() -> float:
+    """
+    このプロセスと子プロセスの最大RSS（MB）を返す
+
+    Returns:
+        float: 最大RSS
+    """
+    # Linuxのru_maxrssはKB単位（macOSはバイト単位）
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    )
+    return round(peak * unit / (1024 * 1024), 1)
+
+
+def setup_fakes(handler: str, size: int, llm_latency_seconds: float) -> Callable[[Any, int], Dict[str, Any]]:
+    """
+    代替実装を起動して環境変数を設定し、呼び出しごとのイベントを返す関数を用意する（ハンドラーのimport前に呼ぶ）
+
+    Args:
+        handler (str): ハンドラー名
+        size (int): 入力サイズ
+        llm_latency_seconds (float): スタブモデルの応答時間（秒）
+
+    Returns:
+        Callable[[Any, int], Dict[str, Any]]: ハンドラーのモジュールと呼び出し番号を受け取り、イベントを返す関数
+    """
+    from local_stubs import start_fake_langfuse, start_fake_s3, start_fixture_server, start_secrets_extension
+
+    os.environ["AWS_LAMBDA_FUNCTION_MEMORY_SIZE"] = str(MEMORY_SIZES_MB[handler])
+    os.environ.setdefault("AWS_SESSION_TOKEN", "benchmark")
+
+    if handler in ("evaluate", "tweet"):
+        langfuse = start_fake_langfuse(PROMPTS_DIR)
+        start_secrets_extension({
+            LANGFUSE_SECRET_NAME: {"LANGFUSE_PUBLIC_KEY": "pk-benchmark", "LANGFUSE_SECRET_KEY": "sk-benchmark"}
+        })
+        os.environ.update({
+            "LANGFUSE_SECRET_NAME": LANGFUSE_SECRET_NAME,
+            "LANGFUSE_HOST": langfuse.url,
+            "BEDROCK_INFERENCE_PROFILE_ARN": STUB_MODEL_ID,
+        })
+        stub_llm_holder: Dict[str, Any] = {}
+
+        def patch_llm(app: Any) -> None:
+            if "llm" not in stub_llm_holder:
+                from local_stubs import create_stub_llm
+                from utils import llm
+                stub_llm_holder["llm"] = create_stub_llm(llm_latency_seconds)
+                # チェーンは utils.llm.build_chain が組み立てるため、共通モジュールのモデルを置き換える
+                llm.get_llm = lambda model_id, read_timeout: stub_llm_holder["llm"]
+
+        if handler == "evaluate":
+            text = build_evaluate_text(size)
+
+            def evaluate_event(app: Any, index: int) -> Dict[str, Any]:
+                patch_llm(app)
+                return {
+                    "httpMethod": "POST",
+                    "body": json.dumps({"blogContent": f"{text}\n（計測 {index}）"}, ensure_ascii=False),
+                    "requestContext": {"authorizer": {"claims": {"email": "benchmark@example.com"}}}
+                }
+            return evaluate_event
+
+        text = build_evaluate_text(size)
+
+        def tweet_event(app: Any, index: int) -> Dict[str, Any]:
+            patch_llm(app)
+            return {
+                "httpMethod": "POST",
+                "body": json.dumps({
+                    "evalResult": f"{text}\n（計測 {index}）",
+                    "userEmail": "benchmark@example.com",
+                    "langfuseSessionId": f"benchmark-{index}"
+                }, ensure_ascii=False)
+            }
+        return tweet_event
+
+    if handler == "load_url":
+        server = start_fixture_server({"/article.html": build_html(size)})
+
+        def load_url_event(app: Any, index: int) -> Dict[str, Any]:
+            # URLキャッシュに当たらないよう、呼び出しごとにクエリ文字列を変える
+            return {"httpMethod": "POST", "body": json.dumps({"url": f"{server.url}/article.html?n={index}"})}
+        return load_url_event
+
+    if handler == "load_pdf":
+        os.environ["PDF_BUCKET_NAME"] = PDF_BUCKET_NAME
+        get_client, implementation = start_fake_s3(PDF_BUCKET_NAME)
+        print(f"S3の代替: {implementation}", file=sys.stderr)
+        pdf = build_pdf(size)
+
+        def load_pdf_event(app: Any, index: int) -> Dict[str, Any]:
+            app.get_s3_client = get_client
+            # 重複排除と抽出キャッシュに当たらないよう、呼び出しごとにPDFの末尾のコメントを変える
+            content = pdf + f"%benchmark {index}\n".encode("ascii")
+            return {
+                "httpMethod": "POST",
+                "body": json.dumps({
+                    "pdfBase64": base64.b64encode(content).decode("ascii"),
+                    "userEmail": "benchmark@example.com"
+                })
+            }
+        return load_pdf_event
+
+    raise ValueError(f"未知のハンドラーです: {handler}")
+
+
+def run_worker(handler: str, size_name: str, iterations: int, llm_latency_seconds: float, extra_paths: List[str]) -> Dict[str, Any]:
+    """
+    1つのハンドラーと入力サイズを、このプロセスの中で計測する
+
+    Args:
+        handler (str): ハンドラー名
+        size_name (str): 入力サイズの名前
+        iterations (int): ウォーム呼び出しの回数
+        llm_latency_seconds (float): スタブモデルの応答時間（秒）
+        extra_paths (List[str]): 追加のPYTHONPATH
+
+    Returns:
+        Dict[str, Any]: 計測結果
+    """
+    sys.path[:0] = [os.path.join(HANDLERS_DIR, handler), SHARED_DIR, *extra_paths]
+    build_event = setup_fakes(handler, FIXTURE_SIZES[handler][size_name], llm_latency_seconds)
+
+    started_at = time.perf_counter()
+    import app
+    cold_import_ms = (time.perf_counter() - started_at) * 1000
+
+    from utils.telemetry import get_flusher
+    flusher = get_flusher()
+    flush_latencies: List[float] = []
+
+    def invoke(index: int) -> float:
+        event = build_event(app, index)
+        started_at = time.perf_counter()
+        response = app.lambda_handler(event, None)
+        elapsed_ms = (time.perf_counter() - started_at) * 1000
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"{handler}/{size_name} がステータス{response['statusCode']}を返しました: {response['body'][:300]}")
+        # レスポンス返却後の送信を次の呼び出しの前に済ませる（Lambdaの拡張機能と同じ順序）
+        started_at = time.perf_counter()
+        flusher.drain()
+        flush_latencies.append((time.perf_counter() - started_at) * 1000)
+        return elapsed_ms
+
+    first_invoke_ms = invoke(0)
+    latencies = [invoke(index) for index in range(1, iterations + 1)]
+    return {
+        "handler": handler,
+        "size": size_name,
+        "iterations": iterations,
+        "coldImportMs": round(cold_import_ms, 1),
+        "firstInvokeMs": round(first_invoke_ms, 1),
+        "p50Ms": round(percentile(latencies, 0.50), 1),
+        "p95Ms": round(percentile(latencies, 0.95), 1),
+        "p99Ms": round(percentile(latencies, 0.99), 1),
+        "deferredFlushP50Ms": round(percentile(flush_latencies[1:], 0.50), 1),
+        "peakRssMb": peak_rss_mb(),
+    }
+
+
+def measure(handler: str, size_name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    1つのハンドラーと入力サイズを別プロセスで計測する（import済みのモジュールが混ざらないようにする）
+
+    Args:
+        handler (str): ハンドラー名
+        size_name (str): 入力サイズの名前
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        Dict[str, Any]: 計測結果（失敗した場合は error を持つ）
+    """
+    command = [
+        sys.executable, os.path.abspath(__file__),
+        "--worker", handler, size_name,
+        "--iterations", str(args.iterations),
+        "--llm-latency-ms", str(args.llm_latency_ms),
+    ]
+    for path in args.path:
+        command += ["--path", path]
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([TOOLS_DIR, env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    result = subprocess.run(command, capture_output=True, text=True, env=env)
+    # ハンドラーが出力するEMFのログ（"_aws"キーを持つ）と区別する
+    lines = [
+        line for line in result.stdout.splitlines()
+        if line.startswith("{\"handler\"")
+    ]
+    if result.returncode != 0 or not lines:
+        error = next(
+            (line for line in reversed(result.stderr.splitlines()) if line.strip()),
+            f"終了コード{result.returncode}"
+        )
+        return {"handler": handler, "size": size_name, "error": error}
+    return json.loads(lines[-1])
+
+
+def compare(results: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """
+    計測結果を保存済みの結果と比較する
+
+    Args:
+        results (List[Dict[str, Any]]): 今回の計測結果
+        baseline (List[Dict[str, Any]]): 保存済みの計測結果
+        tolerance (float): 悪化とみなさない割合（0.2なら20%まで）
+
+    Returns:
+        List[str]: 悪化した指標の一覧
+    """
+    baseline_by_key = {(item["handler"], item["size"]): item for item in baseline if "error" not in item}
+    regressions = []
+    for result in results:
+        base = baseline_by_key.get((result["handler"], result["size"]))
+        if base is None or "error" in result:
+            continue
+        for metric, min_delta in COMPARED_METRICS.items():
+            current, previous = result.get(metric), base.get(metric)
+            if current is None or previous is None:
+                continue
+            if current > previous * (1 + tolerance) and current - previous > min_delta:
+                regressions.append(
+                    f"{result['handler']}/{result['size']} {metric}: {previous} → {current} (+{(current / previous - 1) * 100 if previous else 0:.0f}%)"
+                )
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lambdaハンドラーをローカルで実行して性能を計測する")
+    parser.add_argument("handlers", nargs="*", default=list(FIXTURE_SIZES), help="計測するハンドラー")
+    parser.add_argument("--sizes", nargs="+", help="計測する入力サイズ（small / medium / long / large）")
+    parser.add_argument("--iterations", type=int, default=20, help="ウォーム呼び出しの回数")
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="スタブモデルの応答時間（ミリ秒）")
+    parser.add_argument("--path", action="append", default=[], help="追加のPYTHONPATH（複数指定可）")
+    parser.add_argument("--baseline", help="比較する保存済みの結果（JSON）")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="悪化とみなさない割合")
+    parser.add_argument("--save-baseline", help="今回の結果を保存するパス")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    parser.add_argument("--worker", nargs=2, metavar=("HANDLER", "SIZE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.path = [os.path.abspath(path) for path in args.path]
+
+    if args.worker:
+        handler, size_name = args.worker
+        result = run_worker(handler, size_name, args.iterations, args.llm_latency_ms / 1000, args.path)
+        print(json.dumps(result, ensure_ascii=False))
+        sys.stdout.flush()
+        # バックグラウンドのスレッドやモックの後始末を待たずに終了する
+        os._exit(0)
+
+    results = []
+    for handler in args.handlers:
+        for size_name in FIXTURE_SIZES[handler]:
+            if args.sizes and size_name not in args.sizes:
+                continue
+            results.append(measure(handler, size_name, args))
+
+    regressions: List[str] = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": regressions}, ensure_ascii=False, indent=2))
+    else:
+        print(f"{'handler/size':<20}{'import':>9}{'first':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'flush':>9}{'RSS(MB)':>9}")
+        for result in results:
+            name = f"{result['handler']}/{result['size']}"
+            if "error" in result:
+                print(f"{name:<20}  ! {result['error']}")
+                continue
+            print(
+                f"{name:<20}{result['coldImportMs']:>9.1f}{result['firstInvokeMs']:>9.1f}"
+                f"{result['p50Ms']:>9.1f}{result['p95Ms']:>9.1f}{result['p99Ms']:>9.1f}"
+                f"{result['deferredFlushP50Ms']:>9.1f}{result['peakRssMb']:>9.1f}"
+            )
+        for regression in regressions:
+            print(f"    ! {regression}")
+    failed = any("error" in result for result in results) or bool(regressions)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
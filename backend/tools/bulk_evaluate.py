@@ -0,0 +1,760 @@
+"""
+過去に投稿された記事のコーパス（JSONL）をまとめて評価し直すスクリプト
+
+プロンプトを更新したとき（prompts/update_prompts.py で output_evaluation を更新したときなど）に、
+/evaluate を1件ずつ呼ぶ代わりに使う。評価は evaluate ハンドラーの evaluate_output() をそのまま使い、
+- 同時実行数を制限したスレッドプールと、Bedrock呼び出しごとのトークンバケットで流量を制限する
+- 評価済みの記事を出力ファイルに1行ずつ追記し、再実行時は成功済みの記事を飛ばして再開する
+- Bedrockのバッチ推論ジョブの入力形式への変換と、ジョブ出力からの結果の取り込みができる
+- converse では、LangChainを通さずConverse APIを直接asyncioで並列に呼んで短文を評価できる
+- --backend stub でBedrockとLangfuseを使わずに動作確認できる（ローカルのプロンプトと固定応答のモデル）
+
+コーパスは1行1件のJSONで、id と blogContent を持つ（--id-field / --text-field で変更可）。
+結果は1行1件のJSONで、id・output・promptVersion・cacheHit・chunkCount・usage・routes（失敗時は error）を持つ。
+同じidの行が複数ある場合は最後の行が有効。
+
+使い方（backendディレクトリで実行）:
+    # Bedrockで評価する（プロンプトはLangfuseから取得。LANGFUSE_PUBLIC_KEY / LANGFUSE_SECRET_KEY / LANGFUSE_HOST が必要）
+    python tools/bulk_evaluate.py run corpus.jsonl results.jsonl --workers 16 --rate 10 \\
+        --path layers/langchain/python
+
+    # Bedrockを呼ばずに動作確認する
+    python tools/bulk_evaluate.py run corpus.jsonl results.jsonl --backend stub --stub-latency-ms 200
+
+    # バッチ推論ジョブの入力を作り、ジョブの出力から結果を取り込む
+    python tools/bulk_evaluate.py batch-prepare corpus.jsonl batch_input.jsonl --prompts-dir ../prompts
+    aws bedrock create-model-invocation-job ...（batch_input.jsonl をS3に置いて実行する）
+    python tools/bulk_evaluate.py batch-collect batch_input.jsonl batch_output/ results.jsonl
+
+    # バッチ推論ジョブの出力をローカルの固定応答で作る（batch-collectの動作確認用）
+    python tools/bulk_evaluate.py batch-stub batch_input.jsonl batch_output/
+
+    # Converse APIを直接並列に呼んで評価する（Langfuseのトレースは記録しない）
+    python tools/bulk_evaluate.py converse corpus.jsonl results.jsonl --prompts-dir ../prompts --workers 8 \
+        --path layers/langchain/python
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import ModuleType
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from local_stubs import LocalPromptSource, StubBedrockClient, create_stub_llm
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVALUATE_DIR = os.path.join(BACKEND_DIR, "src", "handlers", "evaluate")
+SHARED_DIR = os.path.join(BACKEND_DIR, "src", "shared")
+DEFAULT_PROMPTS_DIR = os.path.join(os.path.dirname(BACKEND_DIR), "prompts")
+
+# スタブモデルのモデルID（ルーティングやキャッシュキーに使われる）
+STUB_MODEL_ID = "stub"
+# 流量制限で待てる最大秒数（超える場合はその記事を後で再試行する）
+RATE_LIMIT_MAX_WAIT_SECONDS = 60.0
+# スロットリングで評価できなかった記事を再試行するまでの最大待ち時間（秒）
+MAX_THROTTLE_BACKOFF_SECONDS = 60.0
+# Bedrockのバッチ推論（Anthropic Messages API形式）のバージョン
+ANTHROPIC_VERSION = "bedrock-2023-05-31"
+
+
+class CorpusItem(NamedTuple):
+    """コーパスの1件"""
+    id: str
+    text: str
+
+
+def load_evaluate_app(extra_paths: List[str], env: Dict[str, str]) -> ModuleType:
+    """
+    evaluateハンドラーを読み込む
+
+    ハンドラーの設定定数はimport時に環境変数から読まれるため、環境変数を設定してからimportする
+
+    Args:
+        extra_paths (List[str]): 追加のPYTHONPATH（Lambdaレイヤーの展開先など）
+        env (Dict[str, str]): 未設定の場合に設定する環境変数
+
+    Returns:
+        ModuleType: evaluateハンドラーのモジュール
+    """
+    for key, value in env.items():
+        os.environ.setdefault(key, value)
+    for path in [EVALUATE_DIR, SHARED_DIR, *extra_paths]:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    import app
+    return app
+
+
+def read_corpus(path: str, id_field: str, text_field: str) -> Iterator[CorpusItem]:
+    """
+    コーパスを1件ずつ読み込む
+
+    Args:
+        path (str): コーパス（JSONL）のパス
+        id_field (str): idのフィールド名（ない場合は行番号を使う）
+        text_field (str): 評価するテキストのフィールド名
+
+    Returns:
+        Iterator[CorpusItem]: コーパスの各件
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            yield CorpusItem(str(record.get(id_field, line_number)), record.get(text_field) or "")
+
+
+def load_completed_ids(path: str) -> Set[str]:
+    """
+    出力ファイルから評価に成功済みのidを読み込む（再開用のチェックポイント）
+
+    Args:
+        path (str): 結果（JSONL）のパス
+
+    Returns:
+        Set[str]: 成功済みのid
+    """
+    completed: Set[str] = set()
+    if not os.path.exists(path):
+        return completed
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 中断時に書きかけになった最終行は無視する
+                continue
+            if record.get("error"):
+                completed.discard(record["id"])
+            else:
+                completed.add(record["id"])
+    return completed
+
+
+class ResultWriter:
+    """結果を1件ずつ追記し、すぐにディスクに書き出す（中断しても評価済みの分は残る）"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class Progress:
+    """進捗と処理速度を定期的に表示する"""
+
+    def __init__(self, interval: int):
+        self._interval = interval
+        self._started_at = time.monotonic()
+        self.succeeded = 0
+        self.failed = 0
+
+    def record(self, ok: bool) -> None:
+        if ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+        if (self.succeeded + self.failed) % self._interval == 0:
+            self.report()
+
+    def report(self) -> None:
+        done = self.succeeded + self.failed
+        elapsed = time.monotonic() - self._started_at
+        print(f"{done}件完了（成功: {self.succeeded}, 失敗: {self.failed}, {done / elapsed if elapsed else 0:.1f}件/秒）")
+
+
+def evaluate_item(
+    evaluate_app: ModuleType,
+    langfuse: Any,
+    callback_handler: Any,
+    item: CorpusItem,
+    max_attempts: int
+) -> Dict[str, Any]:
+    """
+    1件を評価する（スロットリングで評価できなかった場合は待ってから再試行する）
+
+    Args:
+        evaluate_app (ModuleType): evaluateハンドラーのモジュール
+        langfuse (Any): Langfuseインスタンス（またはプロンプトの取得元）
+        callback_handler (Any): LangChainのコールバック（Langfuseハンドラー）
+        item (CorpusItem): 評価する記事
+        max_attempts (int): 最大試行回数
+
+    Returns:
+        Dict[str, Any]: 結果の1行
+    """
+    try:
+        preflight = evaluate_app.preflight_input(
+            item.text,
+            evaluate_app.PreflightConfig.INPUT_BUDGET_TOKENS,
+            evaluate_app.PreflightConfig.OVERFLOW_MODE
+        )
+        if not preflight["text"]:
+            return {"id": item.id, "error": "評価するテキストが空です"}
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = evaluate_app.evaluate_output(
+                    langfuse,
+                    preflight["text"],
+                    callback_handler,
+                    deadline=evaluate_app.Deadline()
+                )
+                break
+            except evaluate_app.BedrockThrottlingError as e:
+                if attempt >= max_attempts:
+                    raise
+                time.sleep(min(e.retry_after, MAX_THROTTLE_BACKOFF_SECONDS))
+        return {
+            "id": item.id,
+            **result,
+            "inputTokens": preflight["inputTokens"],
+            "trimmed": preflight["trimmed"]
+        }
+    except Exception as e:
+        return {"id": item.id, "error": f"{type(e).__name__}: {str(e)}"}
+
+
+def setup_run_backend(evaluate_app: ModuleType, args: argparse.Namespace) -> tuple[Any, Any]:
+    """
+    評価に使うプロンプトの取得元・コールバック・モデルを用意する
+
+    Args:
+        evaluate_app (ModuleType): evaluateハンドラーのモジュール
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        tuple[Any, Any]: プロンプトの取得元（Langfuseインスタンスなど）とLangChainのコールバック
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+    from utils import llm
+    from utils.invocation import AdmissionController
+
+    # チェーンの組み立てと流量制限は共通モジュール（utils.llm）で行うため、共通モジュールの値を置き換える
+    if args.backend == "stub":
+        stub_llm = create_stub_llm(args.stub_latency_ms / 1000)
+        llm.get_llm = lambda model_id, read_timeout: stub_llm
+
+    # Bedrock呼び出しごとの流量制限（枠が空くまで待つ）
+    llm._admission = AdmissionController(
+        rate_per_second=args.rate,
+        burst=max(1, int(args.rate)),
+        max_in_flight=args.max_in_flight or args.workers,
+        max_wait_seconds=RATE_LIMIT_MAX_WAIT_SECONDS
+    )
+
+    prompts_dir = args.prompts_dir or (DEFAULT_PROMPTS_DIR if args.backend == "stub" else None)
+    if prompts_dir:
+        return LocalPromptSource(prompts_dir), BaseCallbackHandler()
+    langfuse_session_id = str(uuid.uuid4())
+    langfuse_handler, langfuse = evaluate_app.setup_langfuse(
+        {
+            "LANGFUSE_PUBLIC_KEY": os.environ["LANGFUSE_PUBLIC_KEY"],
+            "LANGFUSE_SECRET_KEY": os.environ["LANGFUSE_SECRET_KEY"]
+        },
+        args.user_id,
+        langfuse_session_id
+    )
+    print(f"LangfuseセッションID: {langfuse_session_id}")
+    return langfuse, langfuse_handler
+
+
+def run(args: argparse.Namespace) -> int:
+    """
+    コーパスを評価して結果を追記する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード（失敗した記事がある場合は1）
+    """
+    env = {"BEDROCK_INFERENCE_PROFILE_ARN": STUB_MODEL_ID} if args.backend == "stub" else {}
+    evaluate_app = load_evaluate_app([os.path.abspath(path) for path in args.path], env)
+    langfuse, callback_handler = setup_run_backend(evaluate_app, args)
+
+    completed = load_completed_ids(args.output)
+    if completed:
+        print(f"評価済みの{len(completed)}件を飛ばして再開します")
+    writer = ResultWriter(args.output)
+    progress = Progress(args.progress_interval)
+    # 投入済みで未完了の件数をワーカー数の2倍までに抑え、コーパス全体をメモリに載せない
+    max_pending = args.workers * 2
+    pending: Set[Future] = set()
+
+    def collect(futures: Set[Future]) -> None:
+        for future in futures:
+            record = future.result()
+            writer.write(record)
+            progress.record("error" not in record)
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            for item in read_corpus(args.corpus, args.id_field, args.text_field):
+                if item.id in completed:
+                    continue
+                if args.limit and progress.succeeded + progress.failed + len(pending) >= args.limit:
+                    break
+                pending.add(executor.submit(
+                    evaluate_item, evaluate_app, langfuse, callback_handler, item, args.max_attempts
+                ))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            done, _ = wait(pending)
+            collect(done)
+    finally:
+        writer.close()
+        for flush in (getattr(callback_handler, "flush", None), getattr(langfuse, "flush", None)):
+            if flush is not None:
+                flush()
+    progress.report()
+    return 1 if progress.failed else 0
+
+
+def load_prompt_source(prompts_dir: Optional[str]) -> Any:
+    """
+    プロンプトの取得元を用意する
+
+    Args:
+        prompts_dir (Optional[str]): プロンプトを読み込むディレクトリ（省略時はLangfuseから取得する）
+
+    Returns:
+        Any: プロンプトの取得元（LocalPromptSourceまたはLangfuseインスタンス）
+    """
+    if prompts_dir:
+        return LocalPromptSource(prompts_dir)
+    from langfuse import Langfuse
+    return Langfuse(
+        public_key=os.environ["LANGFUSE_PUBLIC_KEY"],
+        secret_key=os.environ["LANGFUSE_SECRET_KEY"],
+        host=os.environ["LANGFUSE_HOST"]
+    )
+
+
+def format_evaluation_prompt(
+    evaluate_app: ModuleType,
+    compiled: Any,
+    model_id: str,
+    preflight: Dict[str, Any]
+) -> Tuple[List[Any], int]:
+    """
+    1件分の評価のプロンプトと出力トークン数の上限を、evaluateハンドラーと同じ設定で組み立てる
+
+    Args:
+        evaluate_app (ModuleType): evaluateハンドラーのモジュール
+        compiled (Any): 評価用のコンパイル済みプロンプト
+        model_id (str): モデルID
+        preflight (Dict[str, Any]): preflight_inputの結果
+
+    Returns:
+        Tuple[List[Any], int]: LangChainのメッセージと出力トークン数の上限
+    """
+    messages = compiled.prompt.for_model(model_id).format_messages(blog_content=preflight["text"])
+    max_tokens = evaluate_app.compute_max_tokens(
+        preflight["inputTokens"] + evaluate_app.BedrockConfig.PROMPT_OVERHEAD_TOKENS,
+        evaluate_app.BedrockConfig.EVALUATION_MIN_OUTPUT_TOKENS,
+        evaluate_app.LLMConfig.MAX_TOKENS,
+        evaluate_app.BedrockConfig.OUTPUT_TOKENS_PER_INPUT_TOKEN,
+        evaluate_app.BedrockConfig.CONTEXT_WINDOW_TOKENS
+    )
+    return messages, max_tokens
+
+
+def to_batch_content(content: Any) -> List[Dict[str, str]]:
+    """
+    LangChainのメッセージの内容をAnthropic Messages API形式のテキストブロックに変換する
+
+    キャッシュポイントなどテキスト以外のブロックは除く（バッチ推論では使わない）
+
+    Args:
+        content (Any): メッセージの内容（文字列またはブロックのリスト）
+
+    Returns:
+        List[Dict[str, str]]: テキストブロックのリスト
+    """
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}]
+    return [
+        {"type": "text", "text": block["text"]}
+        for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    ]
+
+
+def batch_prepare(args: argparse.Namespace) -> int:
+    """
+    コーパスをBedrockのバッチ推論ジョブの入力（JSONL）に変換する
+
+    長文（map-reduce方式で評価する入力）はバッチ推論の対象外とし、run で評価するよう表示する。
+    プロンプトのバージョンなど結果の取り込みに必要な情報は <出力>.manifest.json に保存する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    evaluate_app = load_evaluate_app(
+        [os.path.abspath(path) for path in args.path],
+        {"BEDROCK_INFERENCE_PROFILE_ARN": args.model_id or STUB_MODEL_ID}
+    )
+    compiled = evaluate_app.compile_prompt(load_prompt_source(args.prompts_dir), evaluate_app.LangfuseConfig.PROMPT_NAME)
+    completed = load_completed_ids(args.results) if args.results else set()
+
+    written = 0
+    skipped_long: List[str] = []
+    with open(args.output, "w", encoding="utf-8") as f:
+        for item in read_corpus(args.corpus, args.id_field, args.text_field):
+            if item.id in completed:
+                continue
+            preflight = evaluate_app.preflight_input(
+                item.text,
+                evaluate_app.PreflightConfig.INPUT_BUDGET_TOKENS,
+                evaluate_app.PreflightConfig.OVERFLOW_MODE
+            )
+            if not preflight["text"]:
+                continue
+            if preflight["inputTokens"] > evaluate_app.LongInputConfig.THRESHOLD_TOKENS:
+                skipped_long.append(item.id)
+                continue
+            messages, max_tokens = format_evaluation_prompt(evaluate_app, compiled, args.model_id or STUB_MODEL_ID, preflight)
+            system = [block for message in messages if message.type == "system" for block in to_batch_content(message.content)]
+            model_input: Dict[str, Any] = {
+                "anthropic_version": ANTHROPIC_VERSION,
+                "max_tokens": max_tokens,
+                "messages": [
+                    {"role": "user", "content": to_batch_content(message.content)}
+                    for message in messages
+                    if message.type == "human"
+                ]
+            }
+            if system:
+                model_input["system"] = system
+            f.write(json.dumps({"recordId": item.id, "modelInput": model_input}, ensure_ascii=False) + "\n")
+            written += 1
+
+    with open(f"{args.output}.manifest.json", "w", encoding="utf-8") as f:
+        json.dump({
+            "promptName": evaluate_app.LangfuseConfig.PROMPT_NAME,
+            "promptVersion": compiled.version,
+            "modelId": args.model_id
+        }, f, ensure_ascii=False, indent=2)
+
+    print(f"{written}件をバッチ推論の入力に書き出しました: {args.output}")
+    if skipped_long:
+        print(f"長文の{len(skipped_long)}件はバッチ推論の対象外です（run で評価してください）: {', '.join(skipped_long[:10])}")
+    return 0
+
+
+def read_batch_output(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    バッチ推論ジョブの出力（ファイルまたは *.jsonl.out を含むディレクトリ）を1件ずつ読み込む
+
+    Args:
+        path (str): 出力のパス
+
+    Returns:
+        Iterator[Dict[str, Any]]: 出力の各レコード
+    """
+    paths = sorted(glob.glob(os.path.join(path, "**", "*.jsonl.out"), recursive=True)) if os.path.isdir(path) else [path]
+    for output_path in paths:
+        with open(output_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def batch_collect(args: argparse.Namespace) -> int:
+    """
+    バッチ推論ジョブの出力を run と同じ形式の結果に変換して追記する
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード（失敗したレコードがある場合は1）
+    """
+    with open(f"{args.batch_input}.manifest.json", encoding="utf-8") as f:
+        manifest = json.load(f)
+    route = {
+        "task": manifest["promptName"],
+        "tier": None,
+        "modelId": manifest.get("modelId"),
+        "reason": "batch inference",
+        "fallbackModelId": None,
+        "fallbackUsed": False
+    }
+    writer = ResultWriter(args.output)
+    progress = Progress(args.progress_interval)
+    try:
+        for record in read_batch_output(args.batch_output):
+            if "error" in record or "modelOutput" not in record:
+                error = record.get("error") or {}
+                writer.write({"id": record["recordId"], "error": error.get("errorMessage") or json.dumps(error, ensure_ascii=False)})
+                progress.record(False)
+                continue
+            model_output = record["modelOutput"]
+            usage = model_output.get("usage") or {}
+            writer.write({
+                "id": record["recordId"],
+                "output": "".join(block.get("text", "") for block in model_output.get("content", [])),
+                "promptVersion": manifest["promptVersion"],
+                "cacheHit": False,
+                "chunkCount": 1,
+                "usage": {
+                    "inputTokens": usage.get("input_tokens", 0),
+                    "outputTokens": usage.get("output_tokens", 0),
+                    "cacheReadInputTokens": usage.get("cache_read_input_tokens", 0),
+                    "cacheWriteInputTokens": usage.get("cache_creation_input_tokens", 0)
+                },
+                "routes": [route]
+            })
+            progress.record(True)
+    finally:
+        writer.close()
+    progress.report()
+    return 1 if progress.failed else 0
+
+
+def batch_stub(args: argparse.Namespace) -> int:
+    """
+    バッチ推論ジョブの出力と同じ形式のファイルを固定応答で作る（batch-collectの動作確認用）
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード
+    """
+    os.makedirs(args.batch_output, exist_ok=True)
+    output_path = os.path.join(args.batch_output, f"{os.path.basename(args.batch_input)}.out")
+    with open(args.batch_input, encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as dst:
+        for line in src:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            prompt_chars = len(json.dumps(record["modelInput"], ensure_ascii=False))
+            record["modelOutput"] = {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "text", "text": f"Level 200（スタブ応答: 入力{prompt_chars}文字）"}],
+                "stop_reason": "end_turn",
+                "usage": {"input_tokens": max(1, prompt_chars // 2), "output_tokens": 16}
+            }
+            dst.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"スタブの出力を書き出しました: {output_path}")
+    return 0
+
+
+def converse_items(
+    requests: List[Tuple[str, Dict[str, Any]]],
+    workers: int,
+    prompt_version: int,
+    route: Dict[str, Any]
+) -> List[Dict[str, Any]]:
+    """
+    Converse APIを同時実行数を制限して並列に呼び、run と同じ形式の結果に変換する
+
+    Args:
+        requests (List[Tuple[str, Dict[str, Any]]]): 記事のidと、utils.bedrock.converseの引数
+        workers (int): 同時に呼び出す数の上限
+        prompt_version (int): 評価に使ったプロンプトのバージョン
+        route (Dict[str, Any]): 結果に記録するモデル
+
+    Returns:
+        List[Dict[str, Any]]: requestsと同じ順番の結果（失敗した記事は error を持つ）
+    """
+    from utils.bedrock import aconverse_many
+
+    results = asyncio.run(aconverse_many([request for _, request in requests], workers, return_exceptions=True))
+    records: List[Dict[str, Any]] = []
+    for (item_id, _), result in zip(requests, results):
+        if isinstance(result, BaseException):
+            records.append({"id": item_id, "error": f"{type(result).__name__}: {str(result)}"})
+            continue
+        records.append({
+            "id": item_id,
+            "output": result["text"],
+            "promptVersion": prompt_version,
+            "cacheHit": False,
+            "chunkCount": 1,
+            "usage": result["usage"],
+            "routes": [route]
+        })
+    return records
+
+
+def converse_run(args: argparse.Namespace) -> int:
+    """
+    LangChainを通さずConverse APIを直接asyncioで並列に呼んでコーパスを評価し、結果を追記する
+
+    batch-prepareと同じプロンプトで短文だけを評価する（長文は run で評価する）。
+    Langfuseのトレースは記録せず、スロットリングなどで失敗した記事は error として書き出して再実行時に評価し直す
+
+    Args:
+        args (argparse.Namespace): コマンドライン引数
+
+    Returns:
+        int: 終了コード（失敗した記事がある場合は1）
+    """
+    model_id = STUB_MODEL_ID if args.backend == "stub" else args.model_id
+    if not model_id:
+        print("--model-id または環境変数 BEDROCK_INFERENCE_PROFILE_ARN を指定してください")
+        return 2
+    evaluate_app = load_evaluate_app(
+        [os.path.abspath(path) for path in args.path],
+        {"BEDROCK_INFERENCE_PROFILE_ARN": model_id}
+    )
+    prompts_dir = args.prompts_dir or (DEFAULT_PROMPTS_DIR if args.backend == "stub" else None)
+    compiled = evaluate_app.compile_prompt(load_prompt_source(prompts_dir), evaluate_app.LangfuseConfig.PROMPT_NAME)
+    # スタブ以外はリージョンごとに共有するクライアント（utils.bedrock.get_bedrock_client）を使う
+    client = StubBedrockClient(args.stub_latency_ms / 1000) if args.backend == "stub" else None
+    route = {
+        "task": evaluate_app.LangfuseConfig.PROMPT_NAME,
+        "tier": None,
+        "modelId": model_id,
+        "reason": "converse",
+        "fallbackModelId": None,
+        "fallbackUsed": False
+    }
+
+    completed = load_completed_ids(args.output)
+    if completed:
+        print(f"評価済みの{len(completed)}件を飛ばして再開します")
+    writer = ResultWriter(args.output)
+    progress = Progress(args.progress_interval)
+    skipped_long: List[str] = []
+    # コーパス全体をメモリに載せないよう、同時実行数の数倍ずつまとめて呼び出す
+    group_size = args.workers * 4
+    group: List[Tuple[str, Dict[str, Any]]] = []
+
+    def flush_group() -> None:
+        for record in converse_items(group, args.workers, compiled.version, route):
+            writer.write(record)
+            progress.record("error" not in record)
+        group.clear()
+
+    try:
+        for item in read_corpus(args.corpus, args.id_field, args.text_field):
+            if item.id in completed:
+                continue
+            if args.limit and progress.succeeded + progress.failed + len(group) >= args.limit:
+                break
+            preflight = evaluate_app.preflight_input(
+                item.text,
+                evaluate_app.PreflightConfig.INPUT_BUDGET_TOKENS,
+                evaluate_app.PreflightConfig.OVERFLOW_MODE
+            )
+            if not preflight["text"]:
+                continue
+            if preflight["inputTokens"] > evaluate_app.LongInputConfig.THRESHOLD_TOKENS:
+                skipped_long.append(item.id)
+                continue
+            messages, max_tokens = format_evaluation_prompt(evaluate_app, compiled, model_id, preflight)
+            group.append((item.id, {
+                "model_id": model_id,
+                "messages": [
+                    {"role": "user", "content": [{"text": block["text"]} for block in to_batch_content(message.content)]}
+                    for message in messages
+                    if message.type == "human"
+                ],
+                "system": [
+                    {"text": block["text"]}
+                    for message in messages
+                    if message.type == "system"
+                    for block in to_batch_content(message.content)
+                ],
+                "max_tokens": max_tokens,
+                "client": client
+            }))
+            if len(group) >= group_size:
+                flush_group()
+        if group:
+            flush_group()
+    finally:
+        writer.close()
+    progress.report()
+    if skipped_long:
+        print(f"長文の{len(skipped_long)}件は対象外です（run で評価してください）: {', '.join(skipped_long[:10])}")
+    return 1 if progress.failed else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="記事のコーパスをまとめて評価する")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_corpus_options(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument("--id-field", default="id", help="idのフィールド名")
+        subparser.add_argument("--text-field", default="blogContent", help="評価するテキストのフィールド名")
+        subparser.add_argument("--path", action="append", default=[], help="追加のPYTHONPATH（複数指定可）")
+        subparser.add_argument("--prompts-dir", help="Langfuseの代わりにプロンプトを読み込むディレクトリ")
+
+    run_parser = subparsers.add_parser("run", help="evaluate_output()でコーパスを評価する")
+    run_parser.add_argument("corpus", help="コーパス（JSONL）")
+    run_parser.add_argument("output", help="結果（JSONL）。既にある場合は成功済みの記事を飛ばして追記する")
+    add_corpus_options(run_parser)
+    run_parser.add_argument("--backend", choices=["bedrock", "stub"], default="bedrock", help="評価に使うモデル")
+    run_parser.add_argument("--stub-latency-ms", type=float, default=0, help="スタブモデルの応答時間（ミリ秒）")
+    run_parser.add_argument("--workers", type=int, default=8, help="同時に評価する記事数")
+    run_parser.add_argument("--rate", type=float, default=5, help="1秒あたりのBedrock呼び出し回数の上限")
+    run_parser.add_argument("--max-in-flight", type=int, help="同時に実行するBedrock呼び出し数の上限（既定: --workers）")
+    run_parser.add_argument("--max-attempts", type=int, default=3, help="スロットリング時の記事ごとの最大試行回数")
+    run_parser.add_argument("--limit", type=int, help="今回評価する最大件数")
+    run_parser.add_argument("--user-id", default="bulk-evaluate", help="Langfuseのトレースに記録するユーザーID")
+    run_parser.add_argument("--progress-interval", type=int, default=100, help="進捗を表示する間隔（件数）")
+    run_parser.set_defaults(handler=run)
+
+    prepare_parser = subparsers.add_parser("batch-prepare", help="バッチ推論ジョブの入力を作る")
+    prepare_parser.add_argument("corpus", help="コーパス（JSONL）")
+    prepare_parser.add_argument("output", help="バッチ推論ジョブの入力（JSONL）")
+    add_corpus_options(prepare_parser)
+    prepare_parser.add_argument("--model-id", default=os.environ.get("BEDROCK_INFERENCE_PROFILE_ARN"), help="ジョブで使うモデルID")
+    prepare_parser.add_argument("--results", help="既存の結果（JSONL）。成功済みの記事は入力に含めない")
+    prepare_parser.set_defaults(handler=batch_prepare)
+
+    collect_parser = subparsers.add_parser("batch-collect", help="バッチ推論ジョブの出力から結果を取り込む")
+    collect_parser.add_argument("batch_input", help="batch-prepareで作った入力（JSONL）")
+    collect_parser.add_argument("batch_output", help="ジョブの出力（*.jsonl.out またはそれを含むディレクトリ）")
+    collect_parser.add_argument("output", help="結果（JSONL）。追記する")
+    collect_parser.add_argument("--progress-interval", type=int, default=1000, help="進捗を表示する間隔（件数）")
+    collect_parser.set_defaults(handler=batch_collect)
+
+    stub_parser = subparsers.add_parser("batch-stub", help="バッチ推論ジョブの出力を固定応答で作る")
+    stub_parser.add_argument("batch_input", help="batch-prepareで作った入力（JSONL）")
+    stub_parser.add_argument("batch_output", help="出力先のディレクトリ")
+    stub_parser.set_defaults(handler=batch_stub)
+
+    converse_parser = subparsers.add_parser("converse", help="Converse APIを直接並列に呼んでコーパスを評価する")
+    converse_parser.add_argument("corpus", help="コーパス（JSONL）")
+    converse_parser.add_argument("output", help="結果（JSONL）。既にある場合は成功済みの記事を飛ばして追記する")
+    add_corpus_options(converse_parser)
+    converse_parser.add_argument("--backend", choices=["bedrock", "stub"], default="bedrock", help="評価に使うモデル")
+    converse_parser.add_argument("--stub-latency-ms", type=float, default=0, help="スタブモデルの応答時間（ミリ秒）")
+    converse_parser.add_argument("--model-id", default=os.environ.get("BEDROCK_INFERENCE_PROFILE_ARN"), help="評価に使うモデルID")
+    converse_parser.add_argument("--workers", type=int, default=4, help="同時に呼び出す数（接続プールの大きさまで）")
+    converse_parser.add_argument("--limit", type=int, help="今回評価する最大件数")
+    converse_parser.add_argument("--progress-interval", type=int, default=100, help="進捗を表示する間隔（件数）")
+    converse_parser.set_defaults(handler=converse_run)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
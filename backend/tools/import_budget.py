@@ -0,0 +1,187 @@
+"""
+Lambdaハンドラーのimport時間を計測し、予算を超えていないか確認するスクリプト
+
+`python -X importtime` の出力をモジュールごとに集計してレポートし、
+- ハンドラー（app）全体のimport時間が予算内か
+- 早期リターンの経路で不要な重い依存をモジュール読み込み時にimportしていないか
+を確認する。どちらかに違反した場合は終了コード1で終了する。
+
+使い方（backendディレクトリで実行）:
+    python tools/import_budget.py
+    python tools/import_budget.py evaluate tweet --path layers/langchain/python --repeat 5
+    python -m pytest tests/test_import_budget.py
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HANDLERS_DIR = os.path.join(BACKEND_DIR, "src", "handlers")
+SHARED_DIR = os.path.join(BACKEND_DIR, "src", "shared")
+
+# ハンドラーごとのimport時間の予算（ミリ秒）
+DEFAULT_BUDGETS_MS: Dict[str, float] = {
+    "evaluate": 150,
+    "tweet": 150,
+    "load_url": 600,
+    "load_pdf": 1500,
+}
+
+# モジュール読み込み時にimportしてはいけない重い依存（関数内で遅延importすること）
+LAZY_ONLY_MODULES: Dict[str, List[str]] = {
+    "evaluate": ["langchain_core", "langchain_aws", "langfuse", "requests", "botocore", "boto3"],
+    "tweet": ["langchain_core", "langchain_aws", "langfuse", "requests", "botocore", "boto3"],
+}
+
+
+class ImportRecord(NamedTuple):
+    """importtimeの1行分"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+class HandlerReport(NamedTuple):
+    """ハンドラーごとの計測結果"""
+    handler: str
+    total_ms: float
+    top_modules: List[ImportRecord]
+    loaded_modules: List[str]
+    error: Optional[str]
+
+
+def parse_importtime(stderr: str) -> List[ImportRecord]:
+    """
+    `-X importtime` の出力をパースする
+
+    Args:
+        stderr (str): 標準エラー出力
+
+    Returns:
+        List[ImportRecord]: importされたモジュールの一覧
+    """
+    records = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        module = name.lstrip(" ")
+        # モジュール名の前のインデント（2スペース単位）がimportの入れ子の深さを表す
+        depth = (len(name) - len(module) - 1) // 2
+        records.append(ImportRecord(module.strip(), int(self_us), int(cumulative_us), depth))
+    return records
+
+
+def measure_handler(handler: str, extra_paths: List[str]) -> HandlerReport:
+    """
+    ハンドラーのimport時間を1回計測する
+
+    Args:
+        handler (str): ハンドラー名（src/handlers配下のディレクトリ名）
+        extra_paths (List[str]): 追加のPYTHONPATH（Lambdaレイヤーの展開先など）
+
+    Returns:
+        HandlerReport: 計測結果
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([SHARED_DIR, *extra_paths])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=os.path.join(HANDLERS_DIR, handler),
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    records = parse_importtime(result.stderr)
+    error = None
+    if result.returncode != 0:
+        error = next(
+            (line for line in reversed(result.stderr.splitlines()) if not line.startswith("import time:")),
+            "importに失敗しました"
+        )
+
+    app_record = next((record for record in records if record.module == "app"), None)
+    top_level = [record for record in records if record.depth == 0 and record.module != "app"]
+    # appの直下でimportされたモジュール（appの子）を集計対象にする
+    app_children = [record for record in records if record.depth == 1]
+    return HandlerReport(
+        handler=handler,
+        total_ms=(app_record.cumulative_us if app_record else sum(r.cumulative_us for r in top_level)) / 1000,
+        top_modules=sorted(app_children or top_level, key=lambda record: record.cumulative_us, reverse=True),
+        loaded_modules=[record.module for record in records],
+        error=error
+    )
+
+
+def check_handler(report: HandlerReport, budget_ms: Optional[float]) -> List[str]:
+    """
+    計測結果が予算と遅延importのルールを守っているか確認する
+
+    Args:
+        report (HandlerReport): 計測結果
+        budget_ms (Optional[float]): import時間の予算（ミリ秒）
+
+    Returns:
+        List[str]: 違反内容の一覧
+    """
+    violations = []
+    if report.error:
+        violations.append(f"importに失敗しました: {report.error}")
+    if budget_ms is not None and report.total_ms > budget_ms:
+        violations.append(f"import時間 {report.total_ms:.1f}ms が予算 {budget_ms:.0f}ms を超えています")
+    loaded_roots = {module.split(".")[0] for module in report.loaded_modules}
+    for module in LAZY_ONLY_MODULES.get(report.handler, []):
+        if module in loaded_roots:
+            violations.append(f"{module} がモジュール読み込み時にimportされています（関数内で遅延importしてください）")
+    return violations
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Lambdaハンドラーのimport時間を計測する")
+    parser.add_argument("handlers", nargs="*", default=list(DEFAULT_BUDGETS_MS), help="計測するハンドラー")
+    parser.add_argument("--path", action="append", default=[], help="追加のPYTHONPATH（複数指定可）")
+    parser.add_argument("--repeat", type=int, default=3, help="計測回数（最小値を採用する）")
+    parser.add_argument("--top", type=int, default=10, help="表示する上位モジュール数")
+    parser.add_argument("--budget-ms", type=float, help="全ハンドラー共通の予算（ミリ秒）")
+    parser.add_argument("--json", action="store_true", help="結果をJSONで出力する")
+    args = parser.parse_args()
+
+    extra_paths = [os.path.abspath(path) for path in args.path]
+    results = []
+    failed = False
+    for handler in args.handlers:
+        reports = [measure_handler(handler, extra_paths) for _ in range(max(1, args.repeat))]
+        report = min(reports, key=lambda r: r.total_ms)
+        budget_ms = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS.get(handler)
+        violations = check_handler(report, budget_ms)
+        failed = failed or bool(violations)
+        results.append({
+            "handler": handler,
+            "totalMs": round(report.total_ms, 1),
+            "budgetMs": budget_ms,
+            "topModules": [
+                {"module": record.module, "cumulativeMs": round(record.cumulative_us / 1000, 1)}
+                for record in report.top_modules[:args.top]
+            ],
+            "violations": violations
+        })
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        for result in results:
+            status = "NG" if result["violations"] else "OK"
+            print(f"[{status}] {result['handler']}: {result['totalMs']}ms (予算: {result['budgetMs']}ms)")
+            for module in result["topModules"]:
+                print(f"    {module['cumulativeMs']:>8.1f}ms  {module['module']}")
+            for violation in result["violations"]:
+                print(f"    ! {violation}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+"""
+ハンドラーをAWSやLangfuseにつながずにローカルで動かすための代替実装
+
+tools/ 配下のスクリプト（bulk_evaluate.py / benchmark_handlers.py）から使う。
+- LocalPromptSource: prompts/*.txt をLangfuseのプロンプトの代わりに返す
+- create_stub_llm: Bedrockの代わりに固定の応答を返すチャットモデル（応答時間を指定できる）
+- StubBedrockClient: Converse APIの代わりに固定の応答を返すbedrock-runtimeクライアント
+- start_secrets_extension: Secrets拡張機能（localhost:2773）の代わりのHTTPサーバー
+- start_fake_langfuse: プロンプト取得とトレース送信を受け付けるLangfuseの代わりのHTTPサーバー
+- start_fixture_server: 固定のHTMLを返すHTTPサーバー
+- InMemoryS3: motoがない環境で使う、load_pdfが使うAPIだけを持つS3クライアント
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import unquote, urlparse
+
+# Secrets拡張機能のポート（ハンドラーは localhost:2773 を直接呼ぶ）
+SECRETS_EXTENSION_PORT = 2773
+
+
+class LocalPrompt:
+    """ローカルのテキストファイルから読み込んだプロンプト（Langfuseのプロンプトの代わり）"""
+
+    def __init__(self, text: str, version: int = 0):
+        self.version = version
+        self._text = text
+
+    def get_langchain_prompt(self) -> str:
+        return self._text
+
+
+class LocalPromptSource:
+    """prompts/*.txt をプロンプト名で返す（Langfuseの get_prompt の代わり）"""
+
+    def __init__(self, directory: str):
+        self._directory = directory
+
+    def get_prompt(self, name: str) -> LocalPrompt:
+        with open(os.path.join(self._directory, f"{name}.txt"), encoding="utf-8") as f:
+            return LocalPrompt(f.read())
+
+
+def create_stub_llm(latency_seconds: float) -> Any:
+    """
+    Bedrockの代わりに固定の評価文を返すチャットモデルを生成する
+
+    Args:
+        latency_seconds (float): 1回の呼び出しにかける時間（秒）
+
+    Returns:
+        Any: LangChainのチャットモデル
+    """
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+
+    class StubChatModel(BaseChatModel):
+        """入力の長さだけを返すチャットモデル（トークン使用量も概算で返す）"""
+        latency_seconds: float = 0.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "stub"
+
+        def _generate(self, messages: List[Any], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+            time.sleep(self.latency_seconds)
+            prompt_chars = sum(len(str(message.content)) for message in messages)
+            input_tokens = max(1, prompt_chars // 2)
+            message = AIMessage(
+                content=f"Level 200（スタブ応答: 入力{prompt_chars}文字）",
+                usage_metadata={"input_tokens": input_tokens, "output_tokens": 16, "total_tokens": input_tokens + 16}
+            )
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    return StubChatModel(latency_seconds=latency_seconds)
+
+
+class StubBedrockClient:
+    """Converse APIの代わりに、入力の長さだけを返すbedrock-runtimeクライアント（トークン使用量も概算で返す）"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+
+    def converse(self, **request: Any) -> Dict[str, Any]:
+        time.sleep(self.latency_seconds)
+        prompt_chars = len(json.dumps([request.get("system"), request["messages"]], ensure_ascii=False))
+        return {
+            "output": {"message": {"role": "assistant", "content": [{"text": f"Level 200（スタブ応答: 入力{prompt_chars}文字）"}]}},
+            "stopReason": "end_turn",
+            "usage": {"inputTokens": max(1, prompt_chars // 2), "outputTokens": 16},
+            "metrics": {"latencyMs": int(self.latency_seconds * 1000)}
+        }
+
+
+class LocalServer:
+    """バックグラウンドスレッドで動くHTTPサーバー"""
+
+    def __init__(self, handler_class: type, port: int = 0):
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), handler_class)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class QuietHandler(BaseHTTPRequestHandler):
+    """アクセスログを出さないリクエストハンドラー"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def send_body(self, status: int, body: bytes, content_type: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status: int, payload: Any) -> None:
+        self.send_body(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json")
+
+    def read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+
+def start_secrets_extension(secrets: Dict[str, Dict[str, str]], port: int = SECRETS_EXTENSION_PORT) -> LocalServer:
+    """
+    Secrets拡張機能の代わりのHTTPサーバーを起動する
+
+    Args:
+        secrets (Dict[str, Dict[str, str]]): シークレット名ごとのシークレットの値
+        port (int): 待ち受けるポート
+
+    Returns:
+        LocalServer: 起動したサーバー
+    """
+    class SecretsHandler(QuietHandler):
+        def do_GET(self) -> None:
+            query = dict(part.split("=", 1) for part in urlparse(self.path).query.split("&") if "=" in part)
+            secret = secrets.get(unquote(query.get("secretId", "")))
+            if secret is None:
+                self.send_json(400, {"message": "secret not found"})
+                return
+            self.send_json(200, {"SecretString": json.dumps(secret)})
+
+    return LocalServer(SecretsHandler, port)
+
+
+class FakeLangfuseStats:
+    """Langfuseの代わりのサーバーが受け付けた件数"""
+
+    def __init__(self) -> None:
+        self.prompt_requests = 0
+        self.ingestion_events = 0
+
+
+def start_fake_langfuse(prompts_dir: str, stats: Optional[FakeLangfuseStats] = None) -> LocalServer:
+    """
+    Langfuseの代わりのHTTPサーバーを起動する
+
+    プロンプトの取得（GET /api/public/v2/prompts/<名前>）は prompts_dir のテキストファイルを返し、
+    トレースの送信（POST /api/public/ingestion）はすべて成功として受け付ける
+
+    Args:
+        prompts_dir (str): プロンプトのテキストファイルのディレクトリ
+        stats (Optional[FakeLangfuseStats]): 受け付けた件数の記録先
+
+    Returns:
+        LocalServer: 起動したサーバー
+    """
+    stats = stats or FakeLangfuseStats()
+    prompt_prefix = "/api/public/v2/prompts/"
+
+    class LangfuseHandler(QuietHandler):
+        def do_GET(self) -> None:
+            path = urlparse(self.path).path
+            if not path.startswith(prompt_prefix):
+                self.send_json(404, {"message": "not found"})
+                return
+            name = unquote(path[len(prompt_prefix):])
+            prompt_path = os.path.join(prompts_dir, f"{name}.txt")
+            if not os.path.exists(prompt_path):
+                self.send_json(404, {"message": f"prompt {name} not found"})
+                return
+            stats.prompt_requests += 1
+            with open(prompt_path, encoding="utf-8") as f:
+                self.send_json(200, {
+                    "type": "text",
+                    "name": name,
+                    "version": 1,
+                    "prompt": f.read(),
+                    "config": {},
+                    "labels": ["production"],
+                    "tags": []
+                })
+
+        def do_POST(self) -> None:
+            payload = json.loads(self.read_body() or b"{}")
+            events = payload.get("batch", [])
+            stats.ingestion_events += len(events)
+            self.send_json(207, {
+                "successes": [{"id": event.get("id"), "status": 201} for event in events],
+                "errors": []
+            })
+
+    return LocalServer(LangfuseHandler)
+
+
+def start_fixture_server(pages: Dict[str, bytes], latency_seconds: float = 0.0) -> LocalServer:
+    """
+    固定のHTMLを返すHTTPサーバーを起動する（クエリ文字列は無視する）
+
+    Args:
+        pages (Dict[str, bytes]): パスごとのHTML
+        latency_seconds (float): 応答を返すまでの時間（秒）
+
+    Returns:
+        LocalServer: 起動したサーバー
+    """
+    class FixtureHandler(QuietHandler):
+        def do_GET(self) -> None:
+            time.sleep(latency_seconds)
+            body = pages.get(urlparse(self.path).path)
+            if body is None:
+                self.send_body(404, b"not found", "text/plain")
+                return
+            self.send_body(200, body, "text/html; charset=utf-8")
+
+    return LocalServer(FixtureHandler)
+
+
+class InMemoryS3Error(Exception):
+    """botocoreのClientErrorと同じ形のエラー"""
+
+    def __init__(self, code: str):
+        super().__init__(code)
+        self.response = {"Error": {"Code": code}}
+
+
+class InMemoryS3:
+    """motoがない環境で使う、load_pdfが使うAPIだけを持つS3クライアント"""
+
+    def __init__(self) -> None:
+        self._objects: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def head_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        with self._lock:
+            if Key not in self._objects:
+                raise InMemoryS3Error("404")
+            return {"ContentLength": len(self._objects[Key])}
+
+    def put_object(self, Bucket: str, Key: str, Body: Any, **kwargs: Any) -> Dict[str, Any]:
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self._objects[Key] = data
+        return {}
+
+    def download_fileobj(self, Bucket: str, Key: str, Fileobj: Any) -> None:
+        with self._lock:
+            data = self._objects.get(Key)
+        if data is None:
+            raise InMemoryS3Error("404")
+        Fileobj.write(data)
+
+    def delete_object(self, Bucket: str, Key: str) -> Dict[str, Any]:
+        with self._lock:
+            self._objects.pop(Key, None)
+        return {}
+
+    def generate_presigned_post(
+        self,
+        Bucket: str,
+        Key: str,
+        Fields: Optional[Dict[str, Any]] = None,
+        Conditions: Optional[List[Any]] = None,
+        ExpiresIn: int = 3600
+    ) -> Dict[str, Any]:
+        return {"url": f"https://{Bucket}.s3.local/", "fields": {**(Fields or {}), "key": Key, "policy": "local"}}
+
+
+def start_fake_s3(bucket: str) -> tuple[Callable[[], Any], str]:
+    """
+    S3の代わりを用意する（motoがあればmotoでboto3の呼び出しを置き換え、なければInMemoryS3を使う）
+
+    Args:
+        bucket (str): 作成するバケット名
+
+    Returns:
+        tuple[Callable[[], Any], str]: S3クライアントを返す関数と、使った実装の名前
+    """
+    try:
+        from moto import mock_aws
+    except ImportError:
+        client = InMemoryS3()
+        return (lambda: client), "in-memory"
+
+    for key, value in {
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "AWS_DEFAULT_REGION": "us-east-1"
+    }.items():
+        os.environ.setdefault(key, value)
+    mock_aws().start()
+    import boto3
+    boto3.client("s3").create_bucket(Bucket=bucket)
+    return (lambda: boto3.client("s3")), "moto"
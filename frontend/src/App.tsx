@@ -81,37 +81,23 @@ function App() {
   const uploadPdf = async (file: File): Promise<string> => {
     setIsUploading(true);
     setUploadProgress(0);
-    return new Promise<string>((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onload = async () => {
-        setUploadProgress(50); // ファイル読み込み完了
-        try {
-          const base64String = (reader.result as string).split(',')[1];
-          const data = await ApiService.uploadPdf(
-            {
-              pdfBase64: base64String,
-              userEmail: auth.user?.profile?.email
-            },
-            auth.user?.id_token || ''
-          );
-          setUploadProgress(100);
-          resolve(data.text);
-        } catch (error) {
-          if (error instanceof Error) {
-            reject(new AppError(error.message));
-          } else {
-            reject(new AppError('PDFファイルのアップロードに失敗しました'));
-          }
-        }
-      };
-      reader.onerror = () => {
-        setIsUploading(false);
-        reject(new AppError('ファイルの読み込みに失敗しました'));
-      };
-      reader.readAsDataURL(file);
-    }).finally(() => {
+    try {
+      const data = await ApiService.uploadPdfDirect(
+        file,
+        { userEmail: auth.user?.profile?.email },
+        auth.user?.id_token || '',
+        () => setUploadProgress(50) // S3へのアップロード完了
+      );
+      setUploadProgress(100);
+      return data.text;
+    } catch (error) {
+      if (error instanceof Error) {
+        throw new AppError(error.message);
+      }
+      throw new AppError('PDFファイルのアップロードに失敗しました');
+    } finally {
       setIsUploading(false);
-    });
+    }
   };
 
   const invokeBedrock = async () => {
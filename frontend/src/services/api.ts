@@ -9,17 +9,54 @@ interface UploadPdfResponse {
   message: string;
   text: string;
   objectKey: string;
+  pages?: number[];
+  pageCount?: number;
+  estimatedTokens?: number;
+  truncated?: boolean;
+  // 適用したトークン予算（0は上限なし）
+  budgetTokens?: number;
+  cacheHit?: boolean;
+}
+
+interface PdfUploadUrlResponse {
+  // 同じ内容のPDFが保存済みの場合はtrue（アップロード不要）
+  exists: boolean;
+  objectKey: string;
+  uploadUrl?: string;
+  // 署名付きPOSTのフォームに含めるフィールド（ファイルより前に追加する）
+  fields?: Record<string, string>;
+  expiresIn?: number;
+  maxBytes?: number;
+}
+
+interface LoadUploadedPdfRequest {
+  objectKey: string;
+  userEmail: string | undefined;
+  // 抽出するページ範囲（例: "1-10,15"）
+  pages?: string;
+  strategy?: 'sequential' | 'sample';
+  budgetTokens?: number;
 }
 
 interface CheckRequest {
   blogContent: string;
   userEmail: string | undefined;
+  // 評価と同時にツイート文言も生成する（Bedrockの呼び出しが増えるため、すぐに共有する場合だけ指定する）
+  withTweet?: boolean;
 }
 
 interface CheckResponse {
   message: string;
   traceId: string;
   langfuseSessionId: string;
+  promptVersion?: number;
+  cacheHit?: boolean;
+  chunkCount?: number;
+  tweet?: TweetResponse;
+  // Bedrockに送る前の正規化・切り詰め後の推定トークン数と、元の入力に対して残った割合
+  inputTokens?: number;
+  keptRatio?: number;
+  trimmed?: boolean;
 }
 
 interface TweetRequest {
@@ -30,15 +67,50 @@ interface TweetRequest {
 
 interface TweetResponse {
   message: string;
+  promptVersion?: number;
+  // ツイートの元にした評価結果の正規化・切り詰め後の推定トークン数と、元の評価結果に対して残った割合
+  inputTokens?: number;
+  keptRatio?: number;
+  trimmed?: boolean;
 }
 
 interface LoadUrlRequest {
   url: string;
+  // 省略時は full（ページ全体）。main を指定すると本文のみを抽出する
+  extractMode?: 'main' | 'full';
   userEmail: string | undefined;
 }
 
 interface LoadUrlResponse {
   message: string;
+  extractMode?: 'main' | 'full';
+  originalChars?: number;
+  removedChars?: number;
+  cacheStatus?: 'HIT' | 'REVALIDATED' | 'MISS';
+}
+
+interface LoadUrlsRequest {
+  urls: string[];
+  extractMode?: 'main' | 'full';
+  combine?: boolean;
+  userEmail: string | undefined;
+}
+
+interface LoadUrlsItem extends Partial<Omit<LoadUrlResponse, 'message'>> {
+  url: string;
+  ok: boolean;
+  message: string;
+  errorCode?: string;
+}
+
+interface LoadUrlsResponse {
+  message: string;
+  results: LoadUrlsItem[];
+  succeeded: number;
+  failed: number;
+  // 期限までに読み込みが終わらなかったURLの件数
+  timedOut?: number;
+  combined?: string;
 }
 
 export class ApiService {
@@ -102,6 +174,59 @@ export class ApiService {
     );
   }
 
+  static async getPdfUploadUrl(
+    sha256: string,
+    idToken: string
+  ): Promise<PdfUploadUrlResponse> {
+    return this.makeRequest<PdfUploadUrlResponse>(
+      `${config.apiEndpoint}/load-pdf/upload-url`,
+      'POST',
+      idToken,
+      { sha256 }
+    );
+  }
+
+  private static async computeSha256(file: File): Promise<string> {
+    const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+      .map((byte) => byte.toString(16).padStart(2, '0'))
+      .join('');
+  }
+
+  // 署名付きPOSTでS3にPDFを直接アップロードしてから、Lambdaでテキストを抽出する
+  static async uploadPdfDirect(
+    file: File,
+    params: Omit<LoadUploadedPdfRequest, 'objectKey'>,
+    idToken: string,
+    onUploaded?: () => void
+  ): Promise<UploadPdfResponse> {
+    // 同じ内容のPDFが保存済みの場合はアップロードを省略する
+    const upload = await this.getPdfUploadUrl(await this.computeSha256(file), idToken);
+    if (!upload.exists && upload.uploadUrl) {
+      if (upload.maxBytes && file.size > upload.maxBytes) {
+        throw new Error(`PDFファイルが大きすぎます（上限: ${Math.floor(upload.maxBytes / (1024 * 1024))}MB）`);
+      }
+      // サイズの上限はS3側でも検証される（content-length-range）
+      const form = new FormData();
+      Object.entries(upload.fields ?? {}).forEach(([key, value]) => form.append(key, value));
+      form.append('file', file);
+      const response = await fetch(upload.uploadUrl, {
+        method: 'POST',
+        body: form,
+      });
+      if (!response.ok) {
+        throw new Error('PDFファイルのアップロードに失敗しました');
+      }
+    }
+    onUploaded?.();
+    return this.makeRequest<UploadPdfResponse>(
+      `${config.apiEndpoint}/load-pdf`,
+      'POST',
+      idToken,
+      { ...params, objectKey: upload.objectKey }
+    );
+  }
+
   static async loadUrl(
     params: LoadUrlRequest,
     idToken: string
@@ -113,4 +238,16 @@ export class ApiService {
       params
     );
   }
+
+  static async loadUrls(
+    params: LoadUrlsRequest,
+    idToken: string
+  ): Promise<LoadUrlsResponse> {
+    return this.makeRequest<LoadUrlsResponse>(
+      `${config.apiEndpoint}/load-url`,
+      'POST',
+      idToken,
+      params
+    );
+  }
 }
@@ -47,3 +47,30 @@ resource "aws_s3_bucket_cors_configuration" "document" {
     max_age_seconds = 3000
   }
 }
+
+# ライフサイクルの設定
+# 抽出済みテキストのキャッシュ（PDF_CACHE_BACKEND の extracted/ 配下）は期限切れ後も残るため、
+# 作成から一定期間で削除する。バージョニングが有効なので、上書き・削除で残る旧バージョンも削除する
+resource "aws_s3_bucket_lifecycle_configuration" "document" {
+  bucket = aws_s3_bucket.document.id
+
+  # バージョニングを有効にしてからルールを設定する
+  depends_on = [aws_s3_bucket_versioning.document]
+
+  rule {
+    id     = "expire-extraction-cache"
+    status = "Enabled"
+
+    filter {
+      prefix = "extracted/"
+    }
+
+    expiration {
+      days = var.extraction_cache_expiration_days
+    }
+
+    noncurrent_version_expiration {
+      noncurrent_days = 1
+    }
+  }
+}
@@ -7,3 +7,9 @@ variable "allowed_origins" {
   description = "CORSで許可するオリジン一覧"
   type        = list(string)
 }
+
+variable "extraction_cache_expiration_days" {
+  description = "抽出済みテキストのキャッシュ（extracted/ 配下）を削除するまでの日数（PDF_CACHE_TTL_SECONDSの期間以上にする）"
+  type        = number
+  default     = 30
+}